@@ -0,0 +1,43 @@
+from thebeast.contrib.ftm_ext.meta_factory import DEFAULT_META_FIELDS
+from thebeast.dump.aggregate import (
+    AggregatingWriter,
+    read_ftm_lines,
+    DEFAULT_RUN_SIZE,
+)
+from tqdm import tqdm
+import argparse
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Merge the FTM jsonlines files (i.e the outputs of the shards) "
+        "into one line per entity, sorted by id"
+    )
+    parser.add_argument("inputs", nargs="+", help="FTM jsonlines files to merge")
+    parser.add_argument("--output", default="-", help="defaults to stdout")
+    parser.add_argument(
+        "--writer",
+        default="thebeast.dump.FTMLinesWriter",
+        help="fully qualified class name of the writer of the merged entities",
+    )
+    parser.add_argument(
+        "--run-size",
+        type=int,
+        default=DEFAULT_RUN_SIZE,
+        help="the number of the entities to sort in memory",
+    )
+    parser.add_argument(
+        "--spill-dir", default=None, help="directory for the sorted runs"
+    )
+    args = parser.parse_args()
+
+    dumper = AggregatingWriter(
+        output_uri=args.output,
+        meta_fields=DEFAULT_META_FIELDS,
+        writer=args.writer,
+        run_size=args.run_size,
+        spill_dir=args.spill_dir,
+    )
+    for uri in args.inputs:
+        dumper.write_entities(tqdm(read_ftm_lines(uri), desc=uri))
+
+    dumper.close()
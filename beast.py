@@ -1,20 +1,158 @@
 from pathlib import Path
 from thebeast.conf.mapping import SourceMapping
+from thebeast.conf.checkpoint import Checkpointer, load_checkpoint
+from thebeast.conf.incremental import IncrementalRun
+from thebeast.digest.merge import EntityMerger, DEFAULT_MAX_ENTITIES
+from thebeast.conf.utils import parse_shard
+from thebeast.ingest.abstract import SHARD_MODES
 from tqdm import tqdm
+import argparse
 import sys
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
+    parser = argparse.ArgumentParser(description="Run the mapping")
+    parser.add_argument("mapping", type=Path, nargs="?")
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        default=None,
+        help="index/count (0-based) of the shard to process, i.e 0/4. Each shard "
+        "writes into its own output, only the first one writes constant entities",
+    )
+    parser.add_argument(
+        "--shard-by",
+        choices=SHARD_MODES,
+        default=None,
+        help="split the input between the shards by file or by record, "
+        "defaults to file, unless there are fewer files than shards",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        type=Path,
+        default=None,
+        help="file to periodically save the position of the run into, removed once "
+        "the run is complete",
+    )
+    parser.add_argument(
+        "--checkpoint-interval",
+        type=float,
+        default=60.0,
+        help="seconds between the checkpoints",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue the interrupted run from the --checkpoint file, if it exists",
+    )
+    parser.add_argument(
+        "--incremental",
+        type=Path,
+        default=None,
+        help="state dir to keep the entities of each input file in, so the next run "
+        "only digests the new and the changed files",
+    )
+    parser.add_argument(
+        "--fingerprint",
+        choices=["stat", "content"],
+        default="stat",
+        help="tell the changed files by size and mtime or by the hash of the content",
+    )
+    parser.add_argument(
+        "--merge-entities",
+        action="store_true",
+        help="merge the fragments of the entities with the same id before writing "
+        "them, the entities far apart in the input might be written partially merged",
+    )
+    parser.add_argument(
+        "--merge-memory",
+        type=int,
+        default=DEFAULT_MAX_ENTITIES,
+        help="the number of the entities to merge in memory, the least recently "
+        "updated one is written out once there are more",
+    )
+    args = parser.parse_args()
+
+    if args.mapping is None:
         print("No mapping yaml is provided in script arguments")
         sys.exit(0)
 
-    mapping = SourceMapping(Path(sys.argv[1]))
+    if args.resume and args.checkpoint is None:
+        print("--resume requires --checkpoint", file=sys.stderr)
+        sys.exit(1)
 
-    mapping.dumper.write_entities(
-        tqdm(
-            mapping.digestor.extract(tqdm(mapping.ingestor, desc="Records in")),
-            desc="Entities out",
+    if args.incremental is not None and args.checkpoint is not None:
+        print("--incremental cannot be combined with --checkpoint", file=sys.stderr)
+        sys.exit(1)
+
+    if args.merge_entities and (
+        args.incremental is not None or args.checkpoint is not None
+    ):
+        print(
+            "--merge-entities cannot be combined with --incremental or --checkpoint",
+            file=sys.stderr,
         )
+        sys.exit(1)
+
+    mapping = SourceMapping(
+        args.mapping,
+        shard=args.shard,
+        shard_by=args.shard_by,
+        resume=load_checkpoint(args.checkpoint) if args.resume else None,
+        merge_entities=args.merge_entities,
     )
 
+    records = mapping.ingestor
+    if not getattr(mapping.digestor, "parse_in_workers", False) and not getattr(
+        mapping.digestor, "files_in_workers", False
+    ):
+        # Workers need the ingestor itself to parse the raw chunks or read the files
+        records = tqdm(records, desc="Records in")
+
+    if args.incremental is not None:
+        stats = IncrementalRun(
+            args.incremental, mapping, content=args.fingerprint == "content"
+        ).run()
+        print(
+            ", ".join(f"{count} files {action}" for action, count in stats.items()),
+            file=sys.stderr,
+        )
+    elif (
+        getattr(mapping.digestor, "write_in_workers", False) and not args.merge_entities
+    ):
+        # Workers write the entities into the shards of the output themselves
+        written = mapping.digestor.dump(records, mapping.dumper)
+        for uri, count in written.items():
+            print(f"{uri}: {count} entities", file=sys.stderr)
+    else:
+        entities = mapping.digestor.extract(records)
+        checkpointer = None
+        if args.checkpoint is not None:
+            checkpointer = Checkpointer(
+                args.checkpoint,
+                ingestor=mapping.ingestor,
+                digestor=mapping.digestor,
+                dumper=mapping.dumper,
+                interval=args.checkpoint_interval,
+            )
+            entities = checkpointer.track(entities)
+
+        merger = None
+        if args.merge_entities:
+            merger = EntityMerger(
+                max_entities=args.merge_memory, keep_meta=mapping.dumper.uses_meta
+            )
+            entities = merger.merge(entities)
+
+        mapping.dumper.write_entities(tqdm(entities, desc="Entities out"))
+
+        if checkpointer is not None:
+            checkpointer.finish()
+
+        if merger is not None:
+            info = merger.info()
+            print(
+                f"{info.fragments} fragments merged into {info.entities} entities",
+                file=sys.stderr,
+            )
+
     mapping.dumper.close()
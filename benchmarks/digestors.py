@@ -0,0 +1,172 @@
+"""
+Benchmark of the parallel digestors: startup time, memory and throughput
+
+python -m benchmarks.digestors
+python -m benchmarks.digestors thebeast/tests/sample/mappings/ukrainian_mps.yaml --workers 4
+
+Each digestor is run in a fresh python process. Memory is the peak of RSS and PSS
+summed over the process and its children (linux only), PSS splits the pages shared
+by the forked workers between them, so it's the fair one to compare
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+import subprocess
+from itertools import islice
+from pathlib import Path
+from multiprocessing import active_children
+from typing import Dict, List, Tuple
+
+from thebeast.conf.mapping import SourceMapping
+from thebeast.digest import (
+    SingleProcessDigestor,
+    MultiProcessDigestor,
+    ThreadPoolDigestor,
+    SubinterpreterDigestor,
+)
+from thebeast.digest.interpreters import SUBINTERPRETERS_AVAILABLE
+
+DIGESTORS: Dict[str, Tuple[type, str]] = {
+    "single": (SingleProcessDigestor, ""),
+    "processes": (MultiProcessDigestor, "processes"),
+    "threads": (ThreadPoolDigestor, "threads"),
+    "subinterpreters": (SubinterpreterDigestor, "interpreters"),
+}
+
+
+def memory_of(pid: int) -> Tuple[int, int]:
+    """
+    RSS and PSS of the process in kilobytes, zeros if it's gone or there is no /proc
+    """
+    rss, pss = 0, 0
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as fp_in:
+            for line in fp_in:
+                if line.startswith("Rss:"):
+                    rss = int(line.split()[1])
+                elif line.startswith("Pss:"):
+                    pss = int(line.split()[1])
+    except OSError:
+        pass
+
+    return rss, pss
+
+
+class MemorySampler(threading.Thread):
+    """
+    Polls the memory of the process and its children, keeping the peak of the sums
+    """
+
+    def __init__(self, interval: float = 0.05) -> None:
+        super().__init__(daemon=True)
+        self.interval: float = interval
+        self.peak_rss: int = 0
+        self.peak_pss: int = 0
+        self.done: threading.Event = threading.Event()
+
+    def run(self) -> None:
+        while not self.done.is_set():
+            pids: List[int] = [os.getpid()] + [
+                child.pid for child in active_children() if child.pid is not None
+            ]
+            usage: List[Tuple[int, int]] = [memory_of(pid) for pid in pids]
+            self.peak_rss = max(self.peak_rss, sum(rss for rss, _ in usage))
+            self.peak_pss = max(self.peak_pss, sum(pss for _, pss in usage))
+            self.done.wait(self.interval)
+
+    def stop(self) -> None:
+        self.done.set()
+        self.join()
+
+
+def bench_digestor(
+    name: str, mapping_path: Path, limit: int, workers: int, batch_size: int
+) -> None:
+    mapping = SourceMapping(mapping_path, dump_overrides={"output_uri": "/dev/null"})
+    records = list(islice(mapping.ingestor, limit))
+
+    digestor_cls, workers_param = DIGESTORS[name]
+    params = {}
+    if workers_param:
+        params = {workers_param: workers, "batch_size": batch_size}
+
+    def make_digestor():
+        return digestor_cls(
+            mapping_config=mapping.digestor.mapping_config,
+            meta_fields=mapping.digestor.meta_fields,
+            **params,
+        )
+
+    sampler = MemorySampler()
+    sampler.start()
+
+    # Startup is the time to digest a single record, that includes spawning and
+    # initializing the workers (constant entities are yielded before that)
+    started: float = time.perf_counter()
+    list(make_digestor().extract(records[:1]))
+    startup: float = time.perf_counter() - started
+
+    started = time.perf_counter()
+    count: int = sum(1 for _ in make_digestor().extract(records))
+    elapsed: float = time.perf_counter() - started
+
+    sampler.stop()
+
+    print(
+        f"{name:<16} {startup:8.2f} s {len(records) / elapsed:10.0f}"
+        f" rec/s {sampler.peak_rss / 1024:10.1f} MB {sampler.peak_pss / 1024:10.1f} MB"
+        f" {count:8d}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "mapping",
+        type=Path,
+        nargs="?",
+        default=Path("thebeast/tests/sample/mappings/ukrainian_mps.yaml"),
+    )
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--digestor", choices=list(DIGESTORS), default=None)
+    args = parser.parse_args()
+
+    if args.digestor is not None:
+        bench_digestor(
+            args.digestor, args.mapping, args.limit, args.workers, args.batch_size
+        )
+        sys.exit(0)
+
+    print(
+        f"{'digestor':<16} {'startup':>10} {'throughput':>16}"
+        f" {'peak RSS':>13} {'peak PSS':>13} {'entities':>8}"
+    )
+    for name in DIGESTORS:
+        if name == "subinterpreters" and not SUBINTERPRETERS_AVAILABLE:
+            print(f"{name:<16} skipped, requires python 3.14+")
+            continue
+
+        # Fresh process for each of the digestors, so they don't share the warm
+        # caches and the memory baseline is the same
+        subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.digestors",
+                str(args.mapping),
+                "--digestor",
+                name,
+                "--limit",
+                str(args.limit),
+                "--workers",
+                str(args.workers),
+                "--batch-size",
+                str(args.batch_size),
+            ],
+            check=False,
+        )
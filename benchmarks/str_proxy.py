@@ -0,0 +1,91 @@
+"""
+Benchmark of the StrProxy values: allocation speed and memory held by the digested entities
+
+python -m benchmarks.str_proxy
+python -m benchmarks.str_proxy thebeast/tests/sample/mappings/ukrainian_mps.yaml --limit 500
+"""
+
+import gc
+import argparse
+import tracemalloc
+from itertools import islice
+from pathlib import Path
+from timeit import timeit
+
+from thebeast.conf.mapping import SourceMapping
+from thebeast.contrib.ftm_ext.rigged_entity_proxy import StrProxy
+
+
+def bench_values(number: int) -> None:
+    """
+    Values as they are made by the resolvers: many values of the same record
+    share the same statements meta dict
+    """
+    statements_meta = {
+        "locale": "uk",
+        "record_no": 42,
+        "input_uri": "file.jsonl",
+        "date": "2023-01-01",
+        "dataset": "foo",
+    }
+    values = [StrProxy(f"value {i}", meta=statements_meta) for i in range(10)]
+
+    for name, stmt in [
+        ("StrProxy(str, meta=dict)", lambda: StrProxy("foo", meta=statements_meta)),
+        ("StrProxy(StrProxy)", lambda: StrProxy(values[0])),
+        ("inject_meta_to_str", lambda: values[0].inject_meta_to_str("bar")),
+    ]:
+        elapsed: float = timeit(stmt, number=number)
+        print(f"{name:<30} {elapsed / number * 1e9:8.0f} ns per value")
+
+
+def bench_mapping(mapping_path: Path, limit: int) -> None:
+    """
+    Memory held by the digested entities and the number of distinct meta objects
+    """
+    mapping = SourceMapping(mapping_path, dump_overrides={"output_uri": "/dev/null"})
+    digestor = mapping.digestor.__class__(
+        mapping_config=mapping.digestor.mapping_config,
+        meta_fields=mapping.digestor.meta_fields,
+        # We are measuring the meta, so it must be there
+        meta_free=False,
+    )
+    records = list(islice(mapping.ingestor, limit))
+
+    gc.collect()
+    tracemalloc.start()
+    entities = list(digestor.extract(records))
+    gc.collect()
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    values = [
+        value
+        for entity in entities
+        for prop_values in entity.payload["properties"].values()
+        for value in prop_values
+    ]
+    metas = {id(value._meta) for value in values}
+
+    print(f"{len(entities)} entities, {len(values)} values from {len(records)} records")
+    print(f"{memory / len(entities):8.0f} bytes held per entity")
+    print(
+        f"{len(metas)} distinct meta objects ({len(metas) / len(values):.1%} of values)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "mapping",
+        type=Path,
+        nargs="?",
+        default=Path("thebeast/tests/sample/mappings/optimizer/gb_mps.yaml"),
+    )
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--number", type=int, default=200000)
+    args = parser.parse_args()
+
+    # Mapping goes first, so the meta singleton gets the meta fields of the mapping
+    bench_mapping(args.mapping, args.limit)
+    bench_values(args.number)
@@ -0,0 +1,177 @@
+from pathlib import Path
+from typing import Generator, Iterable, Iterator, List, Optional, Tuple
+import json
+import os
+import time
+
+from smart_open.compression import get_supported_extensions  # type: ignore
+
+from thebeast.conf.utils import write_json_atomically
+from thebeast.types import ByteRange, Checkpoint, RedGreenEntity
+from thebeast.ingest.abstract import AbstractIngestor
+from thebeast.digest.abstract import AbstractDigestor
+from thebeast.dump.abstract import AbstractWriter
+
+
+def load_checkpoint(path: Path) -> Optional[Checkpoint]:
+    """
+    Reads the checkpoint, if there is one
+    """
+    if not path.exists():
+        return None
+
+    with path.open("r") as fp:
+        return Checkpoint(**json.load(fp))
+
+
+def save_checkpoint(path: Path, checkpoint: Checkpoint) -> None:
+    """
+    Writes the checkpoint atomically, so the run killed in the middle of it still
+    has the previous one
+    """
+    write_json_atomically(path, checkpoint._asdict())
+
+
+class Checkpointer:
+    """
+    Periodically saves the position of the run: the last record, all entities of
+    which were written, the offset of the next record (for the local uncompressed csv
+    and jsonl files) and the sizes of the outputs. Requires the digestor, that yields
+    the entities in the order of the records, and the outputs, that can be truncated
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        ingestor: AbstractIngestor,
+        digestor: AbstractDigestor,
+        dumper: AbstractWriter,
+        interval: float = 60.0,
+    ) -> None:
+        if (
+            getattr(digestor, "write_in_workers", False)
+            or getattr(digestor, "files_in_workers", False)
+            or not getattr(digestor, "preserve_order", True)
+        ):
+            raise ValueError(
+                "Checkpoints require the entities to be written by the parent process "
+                "in the order of the records"
+            )
+
+        if dumper.writes_on_close:
+            raise ValueError(
+                f"{type(dumper).__name__} writes the output once it's closed, so it "
+                "cannot be checkpointed"
+            )
+
+        if getattr(dumper, "dedup_path", None):
+            # Statements after the checkpoint are truncated on resume, but their ids
+            # stay in the store, so they would never be written again
+            raise ValueError(
+                "Checkpoints cannot be used with the persistent dedup_path"
+            )
+
+        self.uris: Tuple[str, ...] = tuple(
+            {uri for uri in [dumper.output_uri, dumper.error_uri] if uri != "/dev/null"}
+        )
+        for uri in self.uris:
+            if uri in ["/dev/stdout", "/dev/stderr"] or uri.endswith(
+                tuple(get_supported_extensions())
+            ):
+                raise ValueError(
+                    f"Checkpoints require uncompressed local outputs, {uri} is not"
+                )
+
+        self.path: Path = path
+        self.ingestor: AbstractIngestor = ingestor
+        self.digestor: AbstractDigestor = digestor
+        self.dumper: AbstractWriter = dumper
+        self.interval: float = interval
+        self.saved_at: float = time.monotonic()
+        self.saved: Optional[Checkpoint] = None
+
+        # Files, all the records of which were written, in the order they were read.
+        # Resume skips them by name, since sourcer might list the files in the other
+        # order next time (or find the new ones)
+        self.done: List[str] = list(
+            ingestor.checkpoint.done or [] if ingestor.checkpoint is not None else []
+        )
+
+        # Records of the input file are scanned incrementally to find the offsets
+        self.scan_uri: Optional[str] = None
+        self.scan_ranges: Iterator[ByteRange] = iter([])
+        self.scan_last: Optional[ByteRange] = None
+
+    def locate(self, input_uri: str, record_no: int) -> Tuple[Optional[int], int]:
+        """
+        Offset of the record, that comes after record_no, and the size of the preamble
+        of the file. Offset is None if the file cannot be read from the middle
+        """
+        if not self.ingestor.splittable(input_uri):
+            return None, 0
+
+        if (
+            self.scan_uri != input_uri
+            or self.scan_last is not None
+            and self.scan_last.record_no > record_no
+        ):
+            self.scan_uri = input_uri
+            self.scan_ranges = self.ingestor.record_ranges(input_uri)
+            self.scan_last = None
+
+        while self.scan_last is None or self.scan_last.record_no < record_no:
+            self.scan_last = next(self.scan_ranges, None)
+            if self.scan_last is None:
+                # File has changed under our feet
+                self.scan_uri = None
+                return None, 0
+
+        return self.scan_last.end, self.scan_last.preamble_size
+
+    def save(self, progress: Tuple[str, int]) -> Checkpoint:
+        input_uri, record_no = progress
+        offset, preamble_size = self.locate(input_uri, record_no)
+
+        self.dumper.flush()
+        self.saved = Checkpoint(
+            input_uri=input_uri,
+            record_no=record_no,
+            offset=offset,
+            preamble_size=preamble_size,
+            outputs={uri: os.path.getsize(uri) for uri in self.uris},
+            done=list(self.done),
+        )
+        save_checkpoint(self.path, self.saved)
+        self.saved_at = time.monotonic()
+
+        return self.saved
+
+    def track(
+        self, entities: Iterable[RedGreenEntity]
+    ) -> Generator[RedGreenEntity, None, None]:
+        """
+        Passes the entities from the digestor to the dumper. Once the progress of the
+        digestor changes, the entities of all the records up to it are already
+        written and the entity at hand is the first one of the records after it, so
+        that's the moment to save the checkpoint
+        """
+        last_progress: Optional[Tuple[str, int]] = None
+        for entity in entities:
+            progress: Optional[Tuple[str, int]] = self.digestor.progress
+            if progress is not None and progress != last_progress:
+                if last_progress is not None and progress[0] != last_progress[0]:
+                    # Records of the next file are written, so the previous one is over
+                    self.done.append(last_progress[0])
+
+                last_progress = progress
+                if time.monotonic() - self.saved_at >= self.interval:
+                    self.save(progress)
+
+            yield entity
+
+    def finish(self) -> None:
+        """
+        The run is complete, nothing to resume
+        """
+        if self.path.exists():
+            os.remove(self.path)
@@ -0,0 +1,155 @@
+from pathlib import Path
+from typing import Any, Dict, List
+import hashlib
+import json
+import os
+
+from thebeast.conf.mapping import SourceMapping
+from thebeast.conf.utils import write_json_atomically
+from thebeast.dump.abstract import AbstractWriter
+
+# Outputs, that are not kept per input file
+UNKEPT_URIS: List[str] = ["/dev/null"]
+
+
+class IncrementalRun:
+    """
+    Runs the mapping over the files of the ingestor, keeping the entities of each
+    input file in its own part in the state dir, along with the fingerprint of
+    the file and of the mapping. Next run digests only the new and the changed
+    files, reuses the parts of the unchanged ones and assembles the output from
+    the constant entities and the parts in the order of the files, so it's the same
+    as the output of the full run
+    """
+
+    def __init__(
+        self, state_dir: Path, mapping: SourceMapping, content: bool = False
+    ) -> None:
+        """
+        content: fingerprint the files by the hash of the content instead of the
+        size and mtime
+        """
+        if mapping.dumper.writes_on_close:
+            # Entities would be merged or sorted only within each part
+            raise ValueError(
+                f"{type(mapping.dumper).__name__} cannot be used for incremental "
+                "runs, the output is assembled from the parts of the input files"
+            )
+
+        if getattr(mapping.dumper, "dedup", False):
+            # Parts are written by the separate dumpers, each of them would only
+            # dedup its own statements or lock the shared dedup_path
+            raise ValueError("Incremental runs cannot be used with dedup")
+
+        self.state_dir: Path = state_dir
+        self.parts_dir: Path = state_dir / "parts"
+        self.state_path: Path = state_dir / "state.json"
+        self.mapping: SourceMapping = mapping
+        self.content: bool = content
+
+    def load_state(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Files of the previous run, unless the mapping has changed since
+        """
+        if not self.state_path.exists():
+            return {}
+
+        with self.state_path.open("r") as fp:
+            state: Dict[str, Any] = json.load(fp)
+
+        if state.get("mapping") != self.mapping.fingerprint:
+            return {}
+
+        return state["files"]
+
+    def save_state(self, files: Dict[str, Dict[str, Any]]) -> None:
+        write_json_atomically(
+            self.state_path, {"mapping": self.mapping.fingerprint, "files": files}
+        )
+
+    def part_uris(self, file_uri: str) -> Dict[str, str]:
+        """
+        Uris of the outputs for the entities of a single input file
+        """
+        dumper: AbstractWriter = self.mapping.dumper
+        name: str = hashlib.sha1(file_uri.encode("utf-8")).hexdigest()
+
+        uris: Dict[str, str] = {"output_uri": str(self.parts_dir / f"{name}.out")}
+        if dumper.error_uri in UNKEPT_URIS:
+            uris["error_uri"] = dumper.error_uri
+        elif dumper.error_uri == dumper.output_uri:
+            uris["error_uri"] = uris["output_uri"]
+        else:
+            uris["error_uri"] = str(self.parts_dir / f"{name}.err")
+
+        return uris
+
+    def digest_file(self, file_uri: str) -> None:
+        dumper: AbstractWriter = self.mapping.dumper
+        part: AbstractWriter = type(dumper)(
+            **{**dumper.params(), **self.part_uris(file_uri)}
+        )
+        try:
+            part.write_entities(
+                self.mapping.digestor.extract(
+                    self.mapping.ingestor.iterate_file(file_uri)
+                )
+            )
+        finally:
+            part.close()
+
+    def remove_parts(self, file_uri: str) -> None:
+        for uri in set(self.part_uris(file_uri).values()):
+            if uri not in UNKEPT_URIS and os.path.exists(uri):
+                os.remove(uri)
+
+    def run(self) -> Dict[str, int]:
+        """
+        Returns the number of the files digested, reused and removed since the
+        previous run
+        """
+        self.parts_dir.mkdir(parents=True, exist_ok=True)
+        previous: Dict[str, Dict[str, Any]] = self.load_state()
+        files: Dict[str, Dict[str, Any]] = {}
+        stats: Dict[str, int] = {"digested": 0, "reused": 0, "removed": 0}
+
+        dumper: AbstractWriter = self.mapping.dumper
+        digestor = self.mapping.digestor
+        emit_constants: bool = digestor.emit_constants
+
+        # Constant entities go straight to the output, before the parts
+        dumper.write_entities(digestor.extract([]))
+
+        digestor.emit_constants = False
+        try:
+            for file_uri in self.mapping.ingestor.sources():
+                fingerprint: str = self.mapping.ingestor.source_fingerprint(
+                    file_uri, content=self.content
+                )
+                if previous.get(file_uri, {}).get("fingerprint") == fingerprint:
+                    stats["reused"] += 1
+                else:
+                    self.digest_file(file_uri)
+                    stats["digested"] += 1
+
+                files[file_uri] = {"fingerprint": fingerprint}
+                previous.pop(file_uri, None)
+                # State is saved after each file, so the interrupted run still
+                # reuses the files done
+                self.save_state({**previous, **files})
+        finally:
+            digestor.emit_constants = emit_constants
+
+        for file_uri in previous:
+            self.remove_parts(file_uri)
+            stats["removed"] += 1
+
+        self.save_state(files)
+
+        for file_uri in files:
+            uris: Dict[str, str] = self.part_uris(file_uri)
+            dumper.append_file(dumper.output_fh, uris["output_uri"])
+            if uris["error_uri"] not in UNKEPT_URIS + [uris["output_uri"]]:
+                dumper.append_file(dumper.error_fh, uris["error_uri"])
+
+        return stats
@@ -1,13 +1,18 @@
 import os
+import copy
+import hashlib
 from pathlib import Path
-from typing import Union, Callable, Dict, Any, List
+from typing import Union, Callable, Dict, Any, List, Tuple
 import json
 
 
 import fastjsonschema  # type: ignore
 from .exc import InvalidMappingException, InvalidOverridesException
-from .utils import import_string, ordered_load
+from .utils import import_string, ordered_load, truncate_outputs
 from thebeast.contrib.ftm_ext.meta_factory import get_meta_cls, DEFAULT_META_FIELDS
+from thebeast.dump.abstract import shard_uri
+from thebeast.ingest.abstract import SHARD_MODES
+from thebeast.types import Checkpoint
 
 
 class SourceMapping:
@@ -21,9 +26,26 @@ class SourceMapping:
         schema_file: Union[Path, None] = None,
         ingest_overrides: Union[Dict[str, Any], None] = None,
         dump_overrides: Union[Dict[str, Any], None] = None,
+        shard: Union[Tuple[int, int], None] = None,
+        shard_by: Union[str, None] = None,
+        resume: Union[Checkpoint, None] = None,
+        merge_entities: bool = False,
     ):
         """
         You might provide an alternative jsonschema file for the validation (for example, to bypass it)
+
+        shard is the (index, count) of the shard to process, when the run is split
+        between the machines. Each shard reads its part of the input (by file or by
+        record, see shard_by), writes into its own shard of the output and only the
+        first one emits the constant entities
+
+        resume is the checkpoint of the interrupted run (see thebeast.conf.checkpoint)
+        to continue from: outputs are truncated to the checkpointed sizes and
+        appended, the input is read from the record after the checkpointed one
+
+        merge_entities tells that the fragments of the entities are merged before the
+        dump (see thebeast.digest.merge), so the invalid fragments are kept, as those
+        might be completed by the other ones
         """
 
         if ingest_overrides is None:
@@ -60,6 +82,33 @@ class SourceMapping:
         except fastjsonschema.exceptions.JsonSchemaValueException as e:
             raise InvalidOverridesException(e)
 
+        if shard is not None:
+            if not 0 <= shard[0] < shard[1]:
+                raise InvalidOverridesException(
+                    f"Shard index {shard[0]} is out of range of {shard[1]} shards"
+                )
+
+            if shard_by is not None and shard_by not in SHARD_MODES:
+                raise InvalidOverridesException(
+                    f"Unknown shard mode {shard_by}, must be one of "
+                    f"{', '.join(SHARD_MODES)}"
+                )
+
+            for param in ["output_uri", "error_uri"]:
+                uri: Union[str, None] = mapping["dump"]["params"].get(param)
+                if uri is not None and uri not in ["/dev/stdout", "/dev/stderr"]:
+                    mapping["dump"]["params"][param] = shard_uri(uri, shard[0])
+
+        # Fingerprint of everything that affects the entities produced from an input
+        # file, but the location of the input and the output, i.e to tell whether the
+        # outputs of the previous incremental run might be reused
+        fingerprint_mapping: dict = copy.deepcopy(mapping)
+        fingerprint_mapping["ingest"]["params"].pop("input_uri", None)
+        fingerprint_mapping["dump"]["params"].pop("output_uri", None)
+        self.fingerprint: str = hashlib.sha256(
+            json.dumps(fingerprint_mapping, default=str).encode("utf-8")
+        ).hexdigest()
+
         # TODO: validate entity names and availability of the refs in the context
 
         # Overriding ftm ontology with a custom one if needed
@@ -76,19 +125,40 @@ class SourceMapping:
             # Setting meta singletone for statements meta
             get_meta_cls(meta_fields)
 
+        dumper_cls: type = import_string(mapping["dump"]["cls"])
+        if resume is not None:
+            # Whatever was written after the checkpoint will be written again
+            truncate_outputs(resume.outputs)
+            mapping["dump"]["params"]["append"] = True
+
+        self.dumper = dumper_cls(
+            **mapping["dump"].get("params", {}), meta_fields=meta_fields
+        )
+
+        # No need to collect statements meta for the values if the dumper ignores it
+        # and no need to serialize invalid entities if the dumper throws them away
+        digest_params: dict = mapping["digest"].get("params", {})
+        digest_params.setdefault("meta_free", not self.dumper.uses_meta)
+        digest_params.setdefault("skip_invalid", self.dumper.discards_invalid)
+        if merge_entities:
+            digest_params["skip_invalid"] = False
+
         self.ftm = ftm
         self.ingestor = import_string(mapping["ingest"]["cls"])(
             **mapping["ingest"].get("params", {})
         )
         self.digestor = import_string(mapping["digest"]["cls"])(
-            mapping_config=mapping["digest"],
-            meta_fields=meta_fields,
-            **mapping["digest"].get("params", {})
+            mapping_config=mapping["digest"], meta_fields=meta_fields, **digest_params
         )
 
-        self.dumper = import_string(mapping["dump"]["cls"])(
-            **mapping["dump"].get("params", {}), meta_fields=meta_fields
-        )
+        if shard is not None:
+            self.ingestor.set_shard(*shard, shard_by=shard_by)
+            self.digestor.emit_constants = shard[0] == 0
+
+        if resume is not None:
+            self.ingestor.resume(resume)
+            # Constant entities were written before the first checkpoint
+            self.digestor.emit_constants = False
 
         # Just in case, the list of jmespathes to extract some jmespathes.
         # digest.collections.*.path
@@ -1,6 +1,9 @@
 from importlib import import_module
 from collections import OrderedDict
-from typing import Any
+from pathlib import Path
+from typing import Any, Dict, Tuple
+import json
+import os
 
 import yaml
 
@@ -44,3 +47,38 @@ def ordered_load(stream, Loader=yaml.SafeLoader, object_pairs_hook=OrderedDict):
         yaml.resolver.BaseResolver.DEFAULT_MAPPING_TAG, construct_mapping
     )
     return yaml.load(stream, OrderedLoader)
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """
+    Parses the shard passed in the command line as index/count, i.e 0/4.
+    Raises ValueError if it doesn't look like one
+    """
+    index, sep, count = value.partition("/")
+    if not sep:
+        raise ValueError(f"{value} doesn't look like a shard, use index/count")
+
+    return int(index), int(count)
+
+
+def write_json_atomically(path: Path, data: Any) -> None:
+    """
+    Writes the json into the temporary file first and then renames it, so the run
+    killed in the middle of it still has the previous version
+    """
+    tmp_path: Path = path.with_name(path.name + ".tmp")
+    with tmp_path.open("w") as fp:
+        json.dump(data, fp)
+        fp.flush()
+        os.fsync(fp.fileno())
+
+    os.replace(tmp_path, path)
+
+
+def truncate_outputs(outputs: Dict[str, int]) -> None:
+    """
+    Cuts off whatever was written into the outputs after the checkpoint
+    """
+    for uri, size in outputs.items():
+        with open(uri, "r+b") as fp:
+            fp.truncate(size)
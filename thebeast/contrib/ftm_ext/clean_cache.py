@@ -0,0 +1,131 @@
+from typing import Optional, Any, Tuple
+from collections import OrderedDict, namedtuple
+from threading import Lock, local
+
+from followthemoney.types import registry  # type: ignore
+from followthemoney.types.common import PropertyType  # type: ignore
+
+DEFAULT_CLEAN_CACHE_SIZE: int = 100000
+
+# Cleaning of the entity references depends on the id of the entity being built,
+# so those are never cached
+UNCACHED_TYPES = (registry.entity,)
+
+CacheInfo: type = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+_MISSING = object()
+
+
+class CleanCache:
+    """
+    Bounded LRU cache of the cleaned property values, keyed by
+    (property type, raw value, fuzzy, format). Shared by all the entities of the process,
+    so the values that repeat across the records (countries, dates, literals) are
+    cleaned only once
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_CLEAN_CACHE_SIZE) -> None:
+        self.maxsize: int = maxsize
+        self.hits: int = 0
+        self.misses: int = 0
+        self._data: OrderedDict = OrderedDict()
+        # Shared by all the threads of the process
+        self._lock: Lock = Lock()
+
+    def clean(
+        self,
+        prop_type: PropertyType,
+        value: Any,
+        proxy: Any = None,
+        fuzzy: bool = False,
+        format: Optional[str] = None,
+    ) -> Optional[str]:
+        if (
+            self.maxsize <= 0
+            or not isinstance(value, str)
+            or prop_type in UNCACHED_TYPES
+        ):
+            return prop_type.clean(value, proxy=proxy, fuzzy=fuzzy, format=format)
+
+        key: Tuple = (prop_type.name, value, fuzzy, format)
+        if prop_type is registry.phone:
+            # Phones are cleaned with the help of the countries of the entity
+            key += (tuple(sorted(proxy.countries)) if proxy is not None else (),)
+
+        with self._lock:
+            result = self._data.get(key, _MISSING)
+            if result is not _MISSING:
+                self.hits += 1
+                self._data.move_to_end(key)
+
+                return result
+
+            self.misses += 1
+
+        result = prop_type.clean(value, proxy=proxy, fuzzy=fuzzy, format=format)
+        if result is not None and type(result) is not str:
+            result = str(result)
+
+        with self._lock:
+            # We don't want to hold the meta of the raw value in the cache
+            self._data[(key[0], str(value)) + key[2:]] = result
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+        return result
+
+    def resize(self, maxsize: int) -> None:
+        with self._lock:
+            self.maxsize = maxsize
+
+            while len(self._data) > max(maxsize, 0):
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def cache_info(self) -> CacheInfo:
+        return CacheInfo(
+            hits=self.hits,
+            misses=self.misses,
+            maxsize=self.maxsize,
+            currsize=len(self._data),
+        )
+
+
+CLEAN_CACHE: CleanCache = CleanCache()
+
+
+class CleanCacheSettings(local):
+    # Cache used by the entities of the current thread. The process-wide one, unless
+    # the digestor running in the thread has its own
+    cache: CleanCache = CLEAN_CACHE
+
+
+CLEAN_CACHE_SETTINGS: CleanCacheSettings = CleanCacheSettings()
+
+
+def configure_clean_cache(maxsize: int) -> None:
+    """
+    Sets the size of the process-wide cache, 0 disables it
+    """
+    CLEAN_CACHE.resize(maxsize)
+
+
+def use_clean_cache(cache: CleanCache) -> None:
+    """
+    Switches the cache used by the current thread
+    """
+    CLEAN_CACHE_SETTINGS.cache = cache
+
+
+__all__ = [
+    "CleanCache",
+    "CLEAN_CACHE",
+    "CLEAN_CACHE_SETTINGS",
+    "configure_clean_cache",
+    "use_clean_cache",
+]
@@ -1,5 +1,6 @@
-from typing import Optional, List, Any
+from typing import Optional, List, Any, Mapping
 from collections import namedtuple
+from threading import Lock, local
 
 DEFAULT_META_FIELDS: List[str] = [
     "locale",
@@ -11,21 +12,88 @@ DEFAULT_META_FIELDS: List[str] = [
 meta_cls: Optional[type] = None
 
 
+class MetaSettings(local):
+    # Set when nobody is going to read the statements meta (i.e the dumper ignores it),
+    # so values don't carry it and all share the same empty meta instance. Kept per
+    # thread, so the digestors running at the same time don't interfere
+    meta_free: bool = False
+
+
+settings: MetaSettings = MetaSettings()
+
+# Guards the creation of the singleton, when digested by several threads
+meta_cls_lock: Lock = Lock()
+
+
 def get_meta_cls(meta_fields: List[str] = DEFAULT_META_FIELDS) -> type:
     global meta_cls
 
-    if meta_cls is None:
-        # That's a bloody black magic
-        class meta_cls(
-            namedtuple("meta_cls", meta_fields, defaults=[None for _ in meta_fields])
-        ):
-            def set_field(self, name: str, value: Any):
-                if name in self._fields:
-                    return self._replace(**{name: value})
+    if meta_cls is not None:
+        return meta_cls
 
-                return self
+    with meta_cls_lock:
+        if meta_cls is None:
+            # That's a bloody black magic. The class is declared as global, so it's
+            # picklable by reference
+            class meta_cls(
+                namedtuple(
+                    "meta_cls", meta_fields, defaults=[None for _ in meta_fields]
+                )
+            ):
+                def set_field(self, name: str, value: Any):
+                    if name in self._fields:
+                        return self._replace(**{name: value})
+
+                    return self
+
+            # Meta objects are immutable, so values can share them
+            meta_cls._empty = meta_cls()
+            # Last built objects, stored as (key, meta) tuples, so threads always
+            # read a consistent pair
+            meta_cls._last = None
+            meta_cls._last_values = None
 
     return meta_cls
 
 
-__all__ = ["get_meta_cls"]
+def make_meta(meta: Mapping) -> Any:
+    """
+    Builds the meta object out of the statements meta dict, skipping undeclared fields.
+    Values of the same record are made with the same statements meta, so the last built
+    object is reused and shared by all of them
+    """
+    meta_cls = get_meta_cls()
+
+    last = meta_cls._last
+    if last is not None and last[0] == meta:
+        return last[1]
+
+    result = meta_cls(**{k: v for k, v in meta.items() if k in meta_cls._fields})
+    meta_cls._last = (dict(meta), result)
+
+    return result
+
+
+def restore_meta(values: tuple) -> Any:
+    """
+    Builds the meta object out of the plain tuple of its values, i.e after it crossed
+    the process boundary. Consecutive values of the same record share the meta, so the
+    last built object is reused
+    """
+    meta_cls = get_meta_cls()
+
+    last = meta_cls._last_values
+    if last is not None and last[0] == values:
+        return last[1]
+
+    result = meta_cls._make(values)
+    meta_cls._last_values = (values, result)
+
+    return result
+
+
+def set_meta_free(value: bool) -> None:
+    settings.meta_free = value
+
+
+__all__ = ["get_meta_cls", "make_meta", "restore_meta", "set_meta_free"]
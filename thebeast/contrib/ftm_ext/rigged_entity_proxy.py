@@ -2,9 +2,10 @@ from typing import Optional, Dict, Any, Union, NamedTuple, Mapping
 
 from followthemoney.proxy import EntityProxy, P  # type: ignore
 from followthemoney.util import value_list  # type: ignore
-from copy import copy
 
-from .meta_factory import get_meta_cls
+from . import meta_factory
+from .meta_factory import get_meta_cls, make_meta, restore_meta
+from .clean_cache import CLEAN_CACHE_SETTINGS
 
 
 class StrProxy(str):
@@ -17,29 +18,51 @@ class StrProxy(str):
         cls, content: Union[str, Any], meta: Optional[Union[Dict, NamedTuple]] = None
     ):
         meta_cls = get_meta_cls()
-        if isinstance(content, StrProxy):
-            result = copy(content)
-        else:
-            result = str.__new__(cls, content)
-            result._meta = meta_cls()
-
-        if meta is not None:
-            if isinstance(meta, Mapping):
-                # TODO: quickly validate that all the meta provided is in the meta fields declared
-                filtered_meta: Dict = {
-                    k: v for k, v in meta.items() if k in meta_cls._fields
-                }
-                result._meta = meta_cls(**filtered_meta)
+        result = str.__new__(cls, content)
+
+        if meta_factory.settings.meta_free:
+            # Nobody reads the meta, no need to build it
+            result._meta = meta_cls._empty
+        elif meta is None:
+            # Meta objects are immutable, so the value shares the meta of the original one
+            if isinstance(content, StrProxy):
+                result._meta = content._meta
             else:
-                result._meta = meta
+                result._meta = meta_cls._empty
+        elif isinstance(meta, Mapping):
+            # TODO: quickly validate that all the meta provided is in the meta fields declared
+            result._meta = make_meta(meta)
+        else:
+            result._meta = meta
 
         return result
 
+    def __reduce__(self):
+        # Meta class is built dynamically, so only the values of the meta are pickled
+        return (restore_str_proxy, (str(self), tuple(self._meta)))
+
     def inject_meta_to_str(self, content: Optional[str]):
         if content is None:
             return None
 
-        return StrProxy(content, self._meta)
+        result = str.__new__(StrProxy, content)
+        result._meta = self._meta
+
+        return result
+
+
+def make_str_proxy(content: str, meta: Any) -> StrProxy:
+    """
+    Builds the value with the given meta object as is, skipping all the checks
+    """
+    result = str.__new__(StrProxy, content)
+    result._meta = meta
+
+    return result
+
+
+def restore_str_proxy(content: str, meta_values: tuple) -> StrProxy:
+    return make_str_proxy(content, restore_meta(meta_values))
 
 
 class RiggedEntityProxy(EntityProxy):
@@ -59,9 +82,15 @@ class RiggedEntityProxy(EntityProxy):
             resolved_prop = self.schema.properties[prop_name]
 
             values = [
-                StrProxy(value).inject_meta_to_str(
-                    resolved_prop.type.clean(
-                        value, proxy=self, fuzzy=fuzzy, format=format
+                (
+                    value if isinstance(value, StrProxy) else StrProxy(value)
+                ).inject_meta_to_str(
+                    CLEAN_CACHE_SETTINGS.cache.clean(
+                        resolved_prop.type,
+                        value,
+                        proxy=self,
+                        fuzzy=fuzzy,
+                        format=format,
                     )
                 )
                 for value in value_list(values)
@@ -79,7 +108,7 @@ class RiggedEntityProxy(EntityProxy):
         format: Optional[str] = None,
     ) -> None:
         if not cleaned and value is not None:
-            if isinstance(value, str):
+            if isinstance(value, str) and not isinstance(value, StrProxy):
                 value = StrProxy(value)
 
             value = value.inject_meta_to_str(
@@ -88,3 +117,35 @@ class RiggedEntityProxy(EntityProxy):
             cleaned = True
 
         return super().unsafe_add(prop, value, cleaned, fuzzy, format)
+
+
+class PlainEntityProxy(EntityProxy):
+    """
+    Entity proxy for the runs without statements meta. Cleans the values exactly as
+    RiggedEntityProxy does, but keeps them as plain strings
+    """
+
+    def add(
+        self,
+        prop: P,
+        values: Any,
+        cleaned: bool = False,
+        quiet: bool = False,
+        fuzzy: bool = False,
+        format: Optional[str] = None,
+    ) -> None:
+        if not cleaned:
+            prop_name = self._prop_name(prop, quiet=quiet)
+            if prop_name is None:
+                return None
+            resolved_prop = self.schema.properties[prop_name]
+
+            values = [
+                CLEAN_CACHE_SETTINGS.cache.clean(
+                    resolved_prop.type, value, proxy=self, fuzzy=fuzzy, format=format
+                )
+                for value in value_list(values)
+            ]
+            cleaned = True
+
+        return super().add(prop, values, cleaned, quiet, fuzzy, format)
@@ -1,4 +1,13 @@
 from .single import SingleProcessDigestor
 from .multi import MultiProcessDigestor
+from .threads import ThreadPoolDigestor
+from .codegen import CodegenDigestor
+from .interpreters import SubinterpreterDigestor
 
-__all__ = ["SingleProcessDigestor", "MultiProcessDigestor"]
+__all__ = [
+    "SingleProcessDigestor",
+    "MultiProcessDigestor",
+    "ThreadPoolDigestor",
+    "CodegenDigestor",
+    "SubinterpreterDigestor",
+]
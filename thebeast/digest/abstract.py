@@ -1,9 +1,12 @@
+from contextlib import contextmanager
+from functools import partial
 from typing import (
+    Callable,
     List,
     Dict,
     Generator,
     Iterable,
-    Callable,
+    Iterator,
     Optional,
     Any,
     Union,
@@ -12,75 +15,97 @@ from typing import (
 
 from followthemoney.schema import Schema  # type: ignore
 
+from thebeast.contrib.ftm_ext import meta_factory
+from thebeast.contrib.ftm_ext.meta_factory import set_meta_free
+from thebeast.contrib.ftm_ext.clean_cache import (
+    CleanCache,
+    CLEAN_CACHE,
+    CLEAN_CACHE_SETTINGS,
+    use_clean_cache,
+)
 from thebeast.contrib.ftm_ext.rigged_entity_proxy import StrProxy
-from thebeast.types import Record
+from thebeast.types import Record, RedGreenEntity
 
 from .utils import (
-    generate_pseudo_id,
-    make_entity,
     jmespath_results_as_array,
     resolve_entity_refs,
-    ensure_list,
-    resolve_callable,
     deflate_entity,
+    make_entity,
     ENTITY_TYPE,
+    VALIDATION_MODES,
 )
-from .resolvers import (
-    resolve_property_values,
-    resolve_constant_meta_values,
-    resolve_collection_meta_values,
-)
+from .resolvers import resolve_pipelines, set_regex_concurrent, REGEX_SETTINGS
+from .plan import compile_mapping, MappingPlan, CollectionPlan, EntityPlan
+from .optimizer import optimize_plan
+
+
+def build_plan(mapping_config: Dict, optimize: bool = True) -> MappingPlan:
+    """
+    Compiles the mapping and optionally runs the static optimizer over it
+    """
+    plan: MappingPlan = compile_mapping(mapping_config)
+    if optimize:
+        plan = optimize_plan(plan)
+
+    return plan
 
 
 def make_entities(
     record: Union[List, Dict],
-    entities_config: Dict,
+    entity_plans: List[EntityPlan],
     statements_meta: Dict[str, str],
     parent_context_entities_map: Dict[str, Schema],
+    shared: Optional[Dict[str, List[Any]]] = None,
 ) -> Tuple[List[Schema], Dict[str, Schema]]:
     """
-    Takes the list/dict of records and a config for collection and produces entites
+    Takes the list/dict of records and a compiled plan for collection entities and produces entites.
+    shared is a per-record storage for the values of the column paths used more than once
     """
 
     context_entities_map: Dict[str, str] = parent_context_entities_map.copy()
     context_entities: List[Schema] = []
 
-    for entity_name, entity_config in entities_config.items():
-        entity = make_entity(entity_config["schema"], key_prefix=entity_name)
+    for entity_plan in entity_plans:
+        entity = make_entity(entity_plan.schema, key_prefix=entity_plan.name)
         key_values: List[str] = []
         variables: Dict[str, List[StrProxy]] = {}
 
-        for property_name, property_configs in entity_config["properties"].items():
-            if not isinstance(property_configs, list):
-                property_configs = [property_configs]
-
-            property_values: List[StrProxy] = resolve_property_values(
-                property_configs=property_configs,
-                record=record,
-                entity=entity,
-                statements_meta=statements_meta,
-                variables=variables,
-            )
+        for property_plan in entity_plan.properties:
+            property_values: List[StrProxy]
+            if property_plan.constant_values is not None:
+                property_values = [
+                    StrProxy(value, meta=statements_meta)
+                    for value in property_plan.constant_values
+                ]
+            else:
+                property_values = resolve_pipelines(
+                    property_plan.pipelines,
+                    record=record,
+                    entity=entity,
+                    statements_meta=statements_meta,
+                    variables=variables,
+                    shared=shared,
+                )
 
-            if property_name.startswith("$"):
-                variables[property_name] = property_values
+            if property_plan.name.startswith("$"):
+                variables[property_plan.name] = property_values
             else:
                 entity.add(
-                    property_name,
+                    property_plan.name,
                     property_values,
+                    cleaned=property_plan.cleaned,
                 )
 
         # Some bizarre parsing of values here, so we can construct an id for the entity from both
         # existing entity fields and records (after jmespathing it)
-        for key in entity_config["keys"]:
-            key_type, key_path = key.split(".", 1)
-            if key_type == "entity":
+        for key in entity_plan.keys:
+            if key.key_type == "entity":
                 properties_to_use: List[str] = []
 
-                if key_path == "*":
+                if key.key_path == "*":
                     properties_to_use = sorted(entity.properties)
                 else:
-                    properties_to_use = [key_path]
+                    properties_to_use = [key.key_path]
 
                 for property_name in properties_to_use:
                     prop = entity.schema.properties[property_name]
@@ -90,14 +115,14 @@ def make_entities(
                             key_values.append(context_entities_map.get(val))
                     else:
                         key_values += entity.get(property_name)
-            elif key_type == "variable":
-                key_values += variables.get(key_path)
-            elif key_type == "record":
-                key_values += jmespath_results_as_array(key_path, record)
+            elif key.key_type == "variable":
+                key_values += variables.get(key.key_path)
+            elif key.key_type == "record":
+                key_values += jmespath_results_as_array(key.key_path, record)
 
         entity.make_id(*key_values)
 
-        context_entities_map[generate_pseudo_id(entity.key_prefix)] = entity.id
+        context_entities_map[entity_plan.pseudo_id] = entity.id
         context_entities.append(entity)
 
     return (
@@ -108,44 +133,47 @@ def make_entities(
 
 def main_cog(
     data: Record,
-    config: Dict,
+    plan: Union[MappingPlan, CollectionPlan],
     parent_context_entities_map: Dict[str, Schema],
     statements_meta: Dict[str, str],
     # TODO: inject parent record as __parent or something
     parent_record: Optional[Any],
+    deflate: Callable[[Schema], Optional[RedGreenEntity]] = deflate_entity,
 ) -> Generator[Schema, None, None]:
-    for collection_name, collection_config in config.get("collections", {}).items():
-        # Applying optional record level transformer
-        record_transformer: Callable = (
-            resolve_callable(collection_config["record_transformer"])
-            if "record_transformer" in collection_config
-            else lambda x: x
+    for collection_plan in plan.collections:
+        records: List[Any] = jmespath_results_as_array(
+            collection_plan.path, data.payload
         )
 
-        for record in record_transformer(
-            jmespath_results_as_array(collection_config["path"], data.payload)
-        ):
+        # Applying optional record level transformer
+        if collection_plan.record_transformer is not None:
+            records = collection_plan.record_transformer(records)
+
+        for record in records:
+            shared: Dict[str, List[Any]] = {}
+
             # Retrieving some record-level meta
             local_statements_meta: Dict[str, str] = {
                 "record_no": data.record_no,
                 "input_uri": data.input_uri,
             }
-
-            if "meta" in collection_config:
-                local_statements_meta.update(
-                    {
-                        statement_meta_name: "\n".join(
-                            resolve_collection_meta_values(
-                                property_configs=ensure_list(statement_meta_config),
-                                record=record,
-                                statements_meta=statements_meta,
-                            ),
-                        )
-                        for statement_meta_name, statement_meta_config in collection_config.get(
-                            "meta", {}
-                        ).items()
-                    }
-                )
+            local_statements_meta.update(collection_plan.constant_meta)
+
+            local_statements_meta.update(
+                {
+                    statement_meta_name: "\n".join(
+                        resolve_pipelines(
+                            pipelines,
+                            record=record,
+                            statements_meta=statements_meta,
+                            entity=None,
+                            variables=None,
+                            shared=shared,
+                        ),
+                    )
+                    for statement_meta_name, pipelines in collection_plan.meta
+                }
+            )
 
             # Updating local copy of a parent meta with a local statements meta
             # TODO: https://docs.python.org/3/library/collections.html#collections.ChainMap
@@ -154,9 +182,10 @@ def main_cog(
 
             local_context_entities, combined_context_entites_map = make_entities(
                 record,
-                collection_config["entities"],
+                collection_plan.entities,
                 statements_meta=combined_statements_meta,
                 parent_context_entities_map=parent_context_entities_map,
+                shared=shared,
             )
 
             for entity in local_context_entities:
@@ -165,19 +194,22 @@ def main_cog(
                 # the amount of data needs to be transfered between processed, since
                 # each process now has it's own FTM model and you don't need to
                 # carry a copy around with each entity
-                yield deflate_entity(entity)
+                deflated: Optional[RedGreenEntity] = deflate(entity)
+                if deflated is not None:
+                    yield deflated
 
-            if "collections" in collection_config:
+            if collection_plan.collections:
                 for entity in main_cog(
                     data=Record(
                         payload=record,
                         record_no=data.record_no,
                         input_uri=data.input_uri,
                     ),
-                    config=collection_config,
+                    plan=collection_plan,
                     parent_context_entities_map=combined_context_entites_map,
                     statements_meta=statements_meta,
                     parent_record=None,
+                    deflate=deflate,
                 ):
                     yield entity
 
@@ -187,19 +219,117 @@ class AbstractDigestor:
     TODO: review an architecture once it works
     """
 
-    def __init__(self, mapping_config: Dict, meta_fields: List[str]) -> None:
+    # Whether to yield the constant entities of the mapping. Switched off for all
+    # the shards but the first one, when the run is split between the machines
+    emit_constants: bool = True
+
+    # Position (input_uri, record_no) of the last record, all entities of which (and
+    # of all the records before it) were yielded. Set only by the digestors, that
+    # yield the entities in the order of the records, used to checkpoint the run
+    progress: Optional[Tuple[str, int]] = None
+
+    def __init__(
+        self,
+        mapping_config: Dict,
+        meta_fields: List[str],
+        optimize: bool = True,
+        regex_concurrent: Optional[bool] = None,
+        meta_free: bool = False,
+        clean_cache_size: Optional[int] = None,
+        validation: str = "full",
+        skip_invalid: bool = False,
+    ) -> None:
+        """
+        optimize: run static optimizations (shared column paths, dead variables elimination,
+        hoisting of literals) over the compiled mapping
+        regex_concurrent: release the GIL while running regex commands, useful when
+        records are digested by multiple threads
+        meta_free: do not collect statements meta for the values, set by the SourceMapping
+        when the dumper ignores it
+        clean_cache_size: size of the own cache of the cleaned property values of the
+        digestor, 0 disables it. Defaults to the process-wide cache
+        validation: how the entities are validated, `full`, `required` (only the
+        presence of the required properties is checked) or `off`
+        skip_invalid: drop invalid entities right away, set by the SourceMapping when
+        the dumper throws them away
+        """
+        if validation not in VALIDATION_MODES:
+            raise ValueError(
+                f"Unknown validation mode '{validation}', use one of {VALIDATION_MODES}"
+            )
+
         self.mapping_config: Dict = mapping_config
         self.meta_fields: List[str] = meta_fields
+        self.optimize: bool = optimize
+        self.regex_concurrent: Optional[bool] = regex_concurrent
+        self.meta_free: bool = meta_free
+        self.clean_cache_size: Optional[int] = clean_cache_size
+        self.validation: str = validation
+        self.skip_invalid: bool = skip_invalid
+        self.deflate: Callable[[Schema], Optional[RedGreenEntity]] = partial(
+            deflate_entity, validation=validation, skip_invalid=skip_invalid
+        )
+
+        self.clean_cache: CleanCache = CLEAN_CACHE
+        if clean_cache_size is not None:
+            self.clean_cache = CleanCache(clean_cache_size)
+
+        # Mapping is parsed and compiled only once, digest runs the plan for each record
+        self.plan: MappingPlan = build_plan(mapping_config, optimize=optimize)
+
+    @contextmanager
+    def own_settings(self) -> Iterator[None]:
+        """
+        Switches the current thread to the meta free mode, regex concurrency and clean
+        cache of the digestor and restores the previous ones afterwards
+        """
+        previous: Tuple[bool, Optional[bool], CleanCache] = (
+            meta_factory.settings.meta_free,
+            REGEX_SETTINGS.concurrent,
+            CLEAN_CACHE_SETTINGS.cache,
+        )
+        set_meta_free(self.meta_free)
+        set_regex_concurrent(self.regex_concurrent)
+        use_clean_cache(self.clean_cache)
+        try:
+            yield
+        finally:
+            set_meta_free(previous[0])
+            set_regex_concurrent(previous[1])
+            use_clean_cache(previous[2])
 
     def extract(self, records: Iterable[Record]) -> Generator[Dict, None, None]:
+        # Settings of the digestor are switched on only while it produces the next
+        # entity, so they don't leak into the code which consumes them or into
+        # the other digestors running at the same time
+        self.progress = None
+        entities: Generator[Dict, None, None] = self._extract(records)
+        try:
+            while True:
+                with self.own_settings():
+                    try:
+                        entity: Dict = next(entities)
+                    except StopIteration:
+                        return
+
+                yield entity
+        finally:
+            with self.own_settings():
+                entities.close()
+
+    def _extract(self, records: Iterable[Record]) -> Generator[Dict, None, None]:
         # First let's get some global level meta values for our statements
         statements_meta: Dict[str, str] = {
             statement_meta_name: "\n".join(
-                resolve_constant_meta_values(ensure_list(statement_meta_config))
+                resolve_pipelines(
+                    pipelines,
+                    record=None,
+                    entity=None,
+                    statements_meta=None,
+                    variables=None,
+                )
             )
-            for statement_meta_name, statement_meta_config in self.mapping_config.get(
-                "meta", {}
-            ).items()
+            for statement_meta_name, pipelines in self.plan.meta
         }
 
         # constant statements will have dummy values for the record_no and input_uri
@@ -213,13 +343,16 @@ class AbstractDigestor:
         # Then let's yield constant entities
         context_entities, context_entities_map = make_entities(
             record={},
-            entities_config=self.mapping_config.get("constant_entities", {}),
+            entity_plans=self.plan.constant_entities,
             statements_meta=statements_meta,
             parent_context_entities_map={},
         )
 
-        for entity in context_entities:
-            yield deflate_entity(entity)
+        if self.emit_constants:
+            for entity in context_entities:
+                deflated: Optional[RedGreenEntity] = self.deflate(entity)
+                if deflated is not None:
+                    yield deflated
 
         for entity in self.run_the_cog(
             records=records,
@@ -0,0 +1,521 @@
+import os
+import sys
+import json
+import types
+import marshal
+from hashlib import sha1
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Dict, Generator, Iterable, Optional, Tuple, Any, Union
+
+from followthemoney import model as ftm  # type: ignore
+from followthemoney.schema import Schema  # type: ignore
+
+from thebeast.types import Record
+from . import resolvers
+from .abstract import AbstractDigestor
+from .plan import MappingPlan, CollectionPlan, EntityPlan, PropertyPlan, KeyPlan
+from .resolvers import Pipeline
+from .utils import ENTITY_TYPE
+
+# Bump it when the generated code changes, so the disk cache is invalidated
+CODEGEN_VERSION: int = 2
+
+# Modules the generated code is made by. Their source is hashed into the key of the
+# disk cache, so an upgrade of thebeast never picks up a stale compiled module
+CODEGEN_MODULES: Tuple[str, ...] = ("codegen.py", "optimizer.py", "plan.py")
+
+
+@lru_cache(maxsize=None)
+def codegen_fingerprint() -> str:
+    """
+    Hash of the source of the modules, that generate the code
+    """
+    digest = sha1()
+    for name in CODEGEN_MODULES:
+        digest.update((Path(__file__).parent / name).read_bytes())
+
+    return digest.hexdigest()
+
+
+def entity_key_values(
+    entity: Schema, property_names: Iterable[str], context_entities_map: Dict[str, str]
+) -> List[str]:
+    """
+    Runtime part of the `entity.` keys, used by the generated code when the property
+    cannot be resolved in advance (i.e for `entity.*`)
+    """
+    key_values: List[str] = []
+
+    for property_name in property_names:
+        prop = entity.schema.properties[property_name]
+
+        if prop.type == ENTITY_TYPE:
+            for val in entity.get(property_name):
+                key_values.append(context_entities_map.get(val))
+        else:
+            key_values += entity.get(property_name)
+
+    return key_values
+
+
+def mapping_hash(mapping_config: Dict, optimize: bool) -> str:
+    """
+    Hash of everything the generated code depends on
+    """
+    key: str = json.dumps(
+        [
+            CODEGEN_VERSION,
+            codegen_fingerprint(),
+            optimize,
+            os.environ.get("FTM_MODEL_PATH"),
+            mapping_config,
+        ],
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+
+    return sha1(key.encode("utf-8")).hexdigest()
+
+
+class MappingCodeGenerator:
+    """
+    Turns the compiled mapping into the source of python module with one function per
+    collection. Compiled regexes, jmespathes, transformers and templates are not serialized
+    into the source. Instead the module has `bind(plan)` function, which picks them from
+    the plan by their path, so the same source works for every plan of the same mapping
+    """
+
+    def __init__(self, plan: MappingPlan, key: str) -> None:
+        self.plan: MappingPlan = plan
+        self.key: str = key
+        self.lines: List[str] = []
+        self.indent: int = 0
+        self.bindings: List[Tuple[str, str]] = []
+        self.imported_resolvers: Dict[str, str] = {}
+
+    def emit(self, line: str = "") -> None:
+        self.lines.append(("    " * self.indent + line) if line else "")
+
+    def bind(self, path: str) -> str:
+        name: str = f"_c{len(self.bindings)}"
+        self.bindings.append((name, path))
+        return name
+
+    def literal(self, value: Any, path: str) -> str:
+        """
+        Strings and numbers go to the source as is, everything else is bound from the plan
+        """
+        if type(value) in (str, int, float, bool):
+            return repr(value)
+
+        return self.bind(path)
+
+    def resolver_name(self, resolver: Any, path: str) -> str:
+        if getattr(resolvers, resolver.__name__, None) is resolver:
+            self.imported_resolvers[resolver.__name__] = resolver.__name__
+            return resolver.__name__
+
+        return self.bind(path)
+
+    def generate(self) -> str:
+        body: List[str]
+        for i, collection_plan in enumerate(self.plan.collections):
+            self.generate_collection(
+                collection_plan, f"plan.collections[{i}]", f"collection_{i}"
+            )
+
+        self.emit(
+            "def run(data, parent_context_entities_map, statements_meta, deflate):"
+        )
+        self.indent += 1
+        for i, _ in enumerate(self.plan.collections):
+            self.emit(
+                f"yield from collection_{i}("
+                "data, parent_context_entities_map, statements_meta, deflate)"
+            )
+        if not self.plan.collections:
+            self.emit("yield from ()")
+        self.indent -= 1
+
+        body, self.lines = self.lines, []
+
+        self.emit(
+            f"# Generated by thebeast.digest.codegen (version {CODEGEN_VERSION}) "
+            f"for the mapping {self.key}. Do not edit"
+        )
+        self.emit("from thebeast.types import Record")
+        self.emit("from thebeast.contrib.ftm_ext.rigged_entity_proxy import StrProxy")
+        self.emit(
+            "from thebeast.digest.utils import make_entity, ensure_list, "
+            "resolve_entity_refs"
+        )
+        self.emit("from thebeast.digest.resolvers import ResolveContext")
+        for name in sorted(self.imported_resolvers):
+            self.emit(f"from thebeast.digest.resolvers import {name}")
+        self.emit("from thebeast.digest.codegen import entity_key_values")
+        self.emit()
+        self.emit()
+        self.emit("def bind(plan):")
+        self.indent += 1
+        if self.bindings:
+            self.emit("global " + ", ".join(name for name, _ in self.bindings))
+            for name, path in self.bindings:
+                self.emit(f"{name} = {path}")
+        else:
+            self.emit("pass")
+        self.indent -= 1
+        self.emit()
+        self.emit()
+
+        return "\n".join(self.lines + body) + "\n"
+
+    def generate_pipelines(
+        self,
+        pipelines: List[Pipeline],
+        path: str,
+        meta_var: str,
+        target: str = "values",
+    ) -> None:
+        """
+        Emits the code to resolve the list of pipelines into the `target` list
+        """
+        self.emit(f"{target} = []")
+
+        for i, pipeline in enumerate(pipelines):
+            if not pipeline:
+                continue
+
+            # Values of the previous commands, nothing to prepend for the first one
+            prefix: str = ""
+            for j, (resolver, command_config) in enumerate(pipeline):
+                config_path: str = f"{path}[{i}][{j}][1]"
+
+                if resolver is resolvers._resolve_literal:
+                    value: str = self.literal(command_config, config_path)
+                    self.emit(f"curr = {prefix}[StrProxy({value}, meta={meta_var})]")
+                elif resolver is resolvers._resolve_entity:
+                    pseudo_id: str = resolvers.compile_entity(command_config).pseudo_id
+                    self.emit(
+                        f"curr = {prefix}[StrProxy({pseudo_id!r}, meta={meta_var})]"
+                    )
+                elif resolver is resolvers._resolve_column:
+                    expression: str = self.bind(config_path)
+                    self.emit(
+                        f"curr = {prefix}[StrProxy(val, meta={meta_var}) "
+                        f"for val in ensure_list({expression}.search(record) or [])]"
+                    )
+                elif resolver is resolvers._resolve_shared_column:
+                    expression = self.bind(f"{config_path}.expression")
+                    shared_key: str = repr(command_config.path)
+                    self.emit(f"shared_values = shared.get({shared_key})")
+                    self.emit("if shared_values is None:")
+                    self.indent += 1
+                    self.emit(
+                        f"shared_values = shared[{shared_key}] = "
+                        f"ensure_list({expression}.search(record) or [])"
+                    )
+                    self.indent -= 1
+                    self.emit(
+                        f"curr = {prefix}[StrProxy(val, meta={meta_var}) "
+                        "for val in shared_values]"
+                    )
+                else:
+                    config: str = self.literal(command_config, config_path)
+                    name: str = self.resolver_name(resolver, f"{path}[{i}][{j}][0]")
+                    self.emit(f"ctx.property_values = {'curr' if prefix else '[]'}")
+                    self.emit(f"curr = {name}({config}, ctx)")
+
+                prefix = "curr + "
+
+            self.emit(f"{target} += curr")
+
+    def generate_property(
+        self, property_plan: PropertyPlan, path: str, entity_plan: EntityPlan
+    ) -> None:
+        self.emit(f"# {entity_plan.name}.{property_plan.name}")
+        if property_plan.constant_values is not None:
+            constant_values: str = self.bind(f"{path}.constant_values")
+            self.emit(
+                "values = [StrProxy(value, meta=combined_statements_meta) "
+                f"for value in {constant_values}]"
+            )
+        else:
+            self.generate_pipelines(
+                property_plan.pipelines,
+                f"{path}.pipelines",
+                meta_var="combined_statements_meta",
+            )
+
+        if property_plan.name.startswith("$"):
+            self.emit(f"variables[{property_plan.name!r}] = values")
+        elif property_plan.cleaned:
+            self.emit(f"entity.add({property_plan.name!r}, values, cleaned=True)")
+        else:
+            self.emit(f"entity.add({property_plan.name!r}, values)")
+
+    def generate_keys(self, keys: List[KeyPlan], path: str, schema_name: str) -> None:
+        schema: Optional[Schema] = ftm.get(schema_name)
+
+        self.emit("key_values = []")
+        for i, key in enumerate(keys):
+            if key.key_type == "entity":
+                prop = (
+                    schema.properties.get(key.key_path)
+                    if schema is not None and key.key_path != "*"
+                    else None
+                )
+
+                if key.key_path == "*":
+                    self.emit(
+                        "key_values += entity_key_values("
+                        "entity, sorted(entity.properties), context_entities_map)"
+                    )
+                elif prop is None:
+                    self.emit(
+                        f"key_values += entity_key_values("
+                        f"entity, [{key.key_path!r}], context_entities_map)"
+                    )
+                elif prop.type == ENTITY_TYPE:
+                    self.emit(
+                        f"key_values += [context_entities_map.get(val) "
+                        f"for val in entity.get({key.key_path!r})]"
+                    )
+                else:
+                    self.emit(f"key_values += entity.get({key.key_path!r})")
+            elif key.key_type == "variable":
+                self.emit(f"key_values += variables.get({key.key_path!r})")
+            elif key.key_type == "record":
+                expression: str = self.bind(f"{path}[{i}].key_path")
+                self.emit(
+                    f"key_values += ensure_list({expression}.search(record) or [])"
+                )
+
+    def generate_entity(self, entity_plan: EntityPlan, path: str) -> None:
+        self.emit(f"# entity {entity_plan.name}")
+        self.emit(
+            f"entity = make_entity({entity_plan.schema!r}, key_prefix={entity_plan.name!r})"
+        )
+        self.emit("variables = {}")
+        self.emit(
+            "ctx = ResolveContext(record=record, property_values=[], entity=entity, "
+            "statements_meta=combined_statements_meta, variables=variables, shared=shared)"
+        )
+
+        for i, property_plan in enumerate(entity_plan.properties):
+            self.generate_property(
+                property_plan, f"{path}.properties[{i}]", entity_plan
+            )
+
+        self.generate_keys(entity_plan.keys, f"{path}.keys", entity_plan.schema)
+        self.emit("entity.make_id(*key_values)")
+        self.emit(f"context_entities_map[{entity_plan.pseudo_id!r}] = entity.id")
+        self.emit("context_entities.append(entity)")
+        self.emit()
+
+    def generate_collection(
+        self, collection_plan: CollectionPlan, path: str, function_name: str
+    ) -> None:
+        nested: List[Tuple[CollectionPlan, str, str]] = [
+            (
+                nested_plan,
+                f"{path}.collections[{i}]",
+                f"{function_name}_{i}",
+            )
+            for i, nested_plan in enumerate(collection_plan.collections)
+        ]
+
+        for nested_plan, nested_path, nested_name in nested:
+            self.generate_collection(nested_plan, nested_path, nested_name)
+
+        collection_path: str = self.bind(f"{path}.path")
+
+        self.emit(
+            f"def {function_name}("
+            "data, parent_context_entities_map, statements_meta, deflate):"
+        )
+        self.indent += 1
+        self.emit(f'"""Collection {collection_plan.name}"""')
+        self.emit(
+            f"records = ensure_list({collection_path}.search(data.payload) or [])"
+        )
+        if collection_plan.record_transformer is not None:
+            record_transformer: str = self.bind(f"{path}.record_transformer")
+            self.emit(f"records = {record_transformer}(records)")
+        self.emit()
+        self.emit("for record in records:")
+        self.indent += 1
+        self.emit("shared = {}")
+        self.emit(
+            "local_statements_meta = "
+            '{"record_no": data.record_no, "input_uri": data.input_uri}'
+        )
+        for meta_name, meta_value in collection_plan.constant_meta.items():
+            self.emit(f"local_statements_meta[{meta_name!r}] = {meta_value!r}")
+
+        if collection_plan.meta:
+            self.emit(
+                "ctx = ResolveContext(record=record, property_values=[], entity=None, "
+                "statements_meta=statements_meta, variables=None, shared=shared)"
+            )
+            meta_values: List[Tuple[str, str]] = []
+            for i, (meta_name, pipelines) in enumerate(collection_plan.meta):
+                target: str = f"meta_{i}"
+                self.generate_pipelines(
+                    pipelines,
+                    f"{path}.meta[{i}][1]",
+                    meta_var="statements_meta",
+                    target=target,
+                )
+                meta_values.append((meta_name, target))
+
+            for meta_name, target in meta_values:
+                self.emit(
+                    f'local_statements_meta[{meta_name!r}] = "\\n".join({target})'
+                )
+
+        self.emit("combined_statements_meta = statements_meta.copy()")
+        self.emit("combined_statements_meta.update(local_statements_meta)")
+        self.emit("context_entities_map = parent_context_entities_map.copy()")
+        self.emit("context_entities = []")
+        self.emit()
+
+        for i, entity_plan in enumerate(collection_plan.entities):
+            self.generate_entity(entity_plan, f"{path}.entities[{i}]")
+
+        self.emit(
+            "for entity in resolve_entity_refs(context_entities, context_entities_map):"
+        )
+        self.indent += 1
+        self.emit("deflated = deflate(entity)")
+        self.emit("if deflated is not None:")
+        self.emit("    yield deflated")
+        self.indent -= 1
+
+        if nested:
+            self.emit()
+            self.emit(
+                "nested_data = Record(payload=record, record_no=data.record_no, "
+                "input_uri=data.input_uri)"
+            )
+            for _, _, nested_name in nested:
+                self.emit(
+                    f"yield from {nested_name}("
+                    "nested_data, context_entities_map, statements_meta, deflate)"
+                )
+
+        self.indent -= 2
+        self.emit()
+        self.emit()
+
+
+def load_module(
+    plan: MappingPlan, key: str, cache_dir: Optional[Union[str, Path]] = None
+) -> Tuple[types.ModuleType, str]:
+    """
+    Generates (or loads from the disk cache) the module for the plan, compiles it
+    and binds it to the plan. Returns the module and its source
+    """
+    source: Optional[str] = None
+    code: Optional[types.CodeType] = None
+    source_path: Optional[Path] = None
+    code_path: Optional[Path] = None
+
+    if cache_dir is not None:
+        cache_dir = Path(cache_dir)
+        source_path = cache_dir / f"{key}.py"
+        code_path = cache_dir / f"{key}.{sys.implementation.cache_tag}.bin"
+
+        if source_path.exists():
+            source = source_path.read_text(encoding="utf-8")
+
+            if code_path.exists():
+                with code_path.open("rb") as fp:
+                    code = marshal.load(fp)
+
+    if source is None:
+        source = MappingCodeGenerator(plan, key).generate()
+
+    if code is None:
+        code = compile(
+            source, str(source_path) if source_path else f"<thebeast {key}>", "exec"
+        )
+
+        if cache_dir is not None and source_path is not None and code_path is not None:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+
+            # Writing through the temporary files, so parallel runs never see half-written cache
+            for target, payload in [
+                (source_path, source.encode("utf-8")),
+                (code_path, marshal.dumps(code)),
+            ]:
+                tmp_path: Path = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+                tmp_path.write_bytes(payload)
+                os.replace(tmp_path, target)
+
+    module = types.ModuleType(f"thebeast_codegen_{key}")
+    module.__file__ = str(source_path) if source_path else None
+    exec(code, module.__dict__)
+    module.bind(plan)
+
+    return module, source
+
+
+class CodegenDigestor(AbstractDigestor):
+    """
+    Digestor that turns the mapping into the specialized python module instead of
+    interpreting the plan command by command. Runs in a single process
+    """
+
+    def __init__(
+        self,
+        mapping_config: Dict,
+        meta_fields: List[str],
+        optimize: bool = True,
+        regex_concurrent: Optional[bool] = None,
+        meta_free: bool = False,
+        clean_cache_size: Optional[int] = None,
+        validation: str = "full",
+        skip_invalid: bool = False,
+        cache_dir: Optional[str] = None,
+        dump_source: Optional[str] = None,
+    ) -> None:
+        """
+        cache_dir: an optional directory to keep generated and compiled modules in,
+        keyed by the hash of the mapping
+        dump_source: an optional path to write the generated source to, for inspection
+        """
+        super().__init__(
+            mapping_config=mapping_config,
+            meta_fields=meta_fields,
+            optimize=optimize,
+            regex_concurrent=regex_concurrent,
+            meta_free=meta_free,
+            clean_cache_size=clean_cache_size,
+            validation=validation,
+            skip_invalid=skip_invalid,
+        )
+
+        self.key: str = mapping_hash(mapping_config, optimize)
+        self.module, self.source = load_module(self.plan, self.key, cache_dir)
+
+        if dump_source is not None:
+            Path(dump_source).write_text(self.source, encoding="utf-8")
+
+    def run_the_cog(
+        self,
+        records: Iterable[Record],
+        parent_context_entities_map: Dict[str, str],
+        statements_meta: Dict[str, str],
+    ) -> Generator[Schema, None, None]:
+        run = self.module.run
+        deflate = self.deflate
+
+        for record in records:
+            for entity in run(
+                record, parent_context_entities_map, statements_meta, deflate
+            ):
+                yield entity
+
+            self.progress = (record.input_uri, record.record_no)
@@ -0,0 +1,154 @@
+from typing import List, Dict, Generator, Iterable, Optional, Deque, Tuple, Union
+from collections import deque
+from concurrent.futures import Future, BrokenExecutor
+from os import cpu_count
+
+from followthemoney.schema import Schema  # type: ignore
+
+try:
+    # PEP 734, python 3.14+
+    from concurrent.futures import InterpreterPoolExecutor  # type: ignore
+except ImportError:
+    InterpreterPoolExecutor = None
+
+from thebeast.ingest.abstract import AbstractIngestor
+from thebeast.types import Record, RawChunk
+from .abstract import AbstractDigestor
+from .multi import BatchResult, batch_task, batch_position, worker_init
+from .utils import chunks, unpack_entities
+
+SUBINTERPRETERS_AVAILABLE: bool = InterpreterPoolExecutor is not None
+
+
+class SubinterpreterDigestor(AbstractDigestor):
+    """
+    EXPERIMENTAL. Digestor that runs the records in the isolated subinterpreters of
+    the same process (PEP 734), each with its own GIL. Workers are initialized the same
+    way as the ones of the MultiProcessDigestor and the batches cross the boundary
+    pickled: records (or raw chunks of them) on the way in, packed entities on the way
+    out. Requires python 3.14+ and all the extension modules used by the mapping
+    to support the subinterpreters
+    """
+
+    def __init__(
+        self,
+        mapping_config: Dict,
+        meta_fields: List[str],
+        batch_size: int = 1,
+        interpreters: int = -1,
+        max_in_flight: int = -1,
+        optimize: bool = True,
+        regex_concurrent: Optional[bool] = None,
+        meta_free: bool = False,
+        clean_cache_size: Optional[int] = None,
+        validation: str = "full",
+        skip_invalid: bool = False,
+        parse_in_workers: bool = False,
+    ) -> None:
+        """
+        interpreters: the number of the subinterpreters to launch in the pool,
+        defaults to the number of cores
+        batch_size: the number of the records to give to the subinterpreter at once
+        max_in_flight: the number of the batches submitted to the pool and not yet
+        yielded. Once reached, the input is not read further. Defaults to 4 batches
+        per subinterpreter, 0 means unbounded
+        parse_in_workers: when the ingestor itself is passed to extract and it
+        supports it, only the chunks of batch_size raw records are sent to the
+        subinterpreters, that parse them
+        """
+        if not SUBINTERPRETERS_AVAILABLE:
+            raise RuntimeError(
+                "SubinterpreterDigestor requires python 3.14+ "
+                "(concurrent.futures.InterpreterPoolExecutor), use "
+                "thebeast.digest.MultiProcessDigestor instead"
+            )
+
+        super().__init__(
+            mapping_config=mapping_config,
+            meta_fields=meta_fields,
+            optimize=optimize,
+            regex_concurrent=regex_concurrent,
+            meta_free=meta_free,
+            clean_cache_size=clean_cache_size,
+            validation=validation,
+            skip_invalid=skip_invalid,
+        )
+
+        self.interpreters: int = interpreters
+        if self.interpreters == -1:
+            self.interpreters = cpu_count() or 1
+
+        self.batch_size: int = batch_size
+        self.parse_in_workers: bool = parse_in_workers
+        self.max_in_flight: int = max_in_flight
+        if self.max_in_flight == -1:
+            self.max_in_flight = self.interpreters * 4
+
+    def run_the_cog(
+        self,
+        records: Iterable[Record],
+        parent_context_entities_map: Dict[str, str],
+        statements_meta: Dict[str, str],
+    ) -> Generator[Schema, None, None]:
+        ingestor: Optional[AbstractIngestor] = None
+        batches: Iterable[Union[Tuple[Record, ...], RawChunk]]
+        if (
+            self.parse_in_workers
+            and isinstance(records, AbstractIngestor)
+            and records.supports_raw
+        ):
+            ingestor = records
+            batches = ingestor.raw_chunks(self.batch_size)
+        else:
+            batches = chunks(records, self.batch_size)
+
+        # Futures are yielded in the order of submission, so the output is the same as
+        # the one of the single process digestor. Each one goes with the position of
+        # the last record of its batch
+        in_flight: Deque[Tuple[Future, Optional[Tuple[str, int]]]] = deque()
+
+        def results() -> Generator[Tuple[BatchResult, Optional[Tuple]], None, None]:
+            with InterpreterPoolExecutor(
+                max_workers=self.interpreters,
+                initializer=worker_init,
+                initargs=(
+                    self.mapping_config,
+                    parent_context_entities_map,
+                    statements_meta,
+                    self.meta_fields,
+                    self.optimize,
+                    self.meta_free,
+                    self.regex_concurrent,
+                    self.clean_cache_size,
+                    self.deflate,
+                    ingestor,
+                ),
+            ) as executor:
+                try:
+                    for item in enumerate(batches):
+                        if self.max_in_flight and len(in_flight) >= self.max_in_flight:
+                            future, position = in_flight.popleft()
+                            yield future.result(), position
+
+                        in_flight.append(
+                            (executor.submit(batch_task, item), batch_position(item[1]))
+                        )
+
+                    while in_flight:
+                        future, position = in_flight.popleft()
+                        yield future.result(), position
+                finally:
+                    for future, _ in in_flight:
+                        future.cancel()
+
+        try:
+            for result, position in results():
+                yield from unpack_entities(result.entities)
+                self.progress = position
+        except BrokenExecutor as exc:
+            # Initializer failed, usually because one of the extension modules
+            # cannot be imported into the subinterpreter
+            raise RuntimeError(
+                "Cannot start the subinterpreters, check that all the extension "
+                "modules used by the mapping support them"
+            ) from exc
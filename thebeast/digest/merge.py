@@ -0,0 +1,215 @@
+from typing import Any, Dict, Generator, Iterable, List, Optional, Set, Tuple
+from collections import OrderedDict, namedtuple
+
+# We are utilizing here the fact that Model is a singletone and set up
+# in the thebeast.conf.mapping
+from followthemoney import model as ftm  # type: ignore
+from followthemoney.exc import InvalidData  # type: ignore
+
+from thebeast.types import RedGreenEntity
+
+DEFAULT_MAX_ENTITIES: int = 100000
+
+MergeInfo: type = namedtuple("MergeInfo", ["fragments", "entities", "evictions"])
+
+
+def value_key(value: Any, keep_meta: bool) -> Any:
+    if keep_meta:
+        return (str(value), getattr(value, "_meta", None))
+
+    return str(value)
+
+
+def merge_values(
+    left: List[Any],
+    right: List[Any],
+    keep_meta: bool = True,
+    seen: Optional[Set[Any]] = None,
+) -> List[Any]:
+    """
+    Union of the values of the property, keeping their order. With keep_meta same
+    values with different statements meta (i.e coming from different records) are
+    all kept, so the provenance is not lost.
+    seen: keys of the left values, kept by the caller between the merges. Left is
+    extended in place then and seen is updated, so the merge costs only as much as
+    the right values
+    """
+    merged: List[Any] = left
+    if seen is None:
+        seen = {value_key(value, keep_meta) for value in left}
+        merged = list(left)
+
+    for value in right:
+        key: Any = value_key(value, keep_meta)
+        if key not in seen:
+            seen.add(key)
+            merged.append(value)
+
+    return merged
+
+
+def revalidate(entity: RedGreenEntity) -> RedGreenEntity:
+    """
+    Validates the invalid entity again, i.e once the missing properties were
+    completed by the other fragments
+    """
+    if entity.valid:
+        return entity
+
+    try:
+        ftm.get(entity.payload["schema"]).validate(entity.payload)
+    except InvalidData:
+        return entity
+
+    return RedGreenEntity(payload=entity.payload, valid=True)
+
+
+def merge_fragments(
+    left: RedGreenEntity,
+    right: RedGreenEntity,
+    keep_meta: bool = True,
+    seen: Optional[Dict[str, Set[Any]]] = None,
+    validate: bool = True,
+) -> RedGreenEntity:
+    """
+    Merges two fragments of the entity with the same id, FTM-style: the schema is the
+    most specific one of the two, the values of the properties are combined
+    (see merge_values). Merged entity is validated again, unless both fragments
+    are valid.
+    seen: keys of the values of left by property, kept by the caller that merges
+    many fragments into the same entity, so the values of left are not hashed again
+    on each merge. Values of the properties, that are not there yet, are copied
+    once, after that those are extended in place
+    validate: validate the merged entity, set it to False to validate it once, after
+    all the fragments are merged (see revalidate)
+    """
+    payload: Dict[str, Any] = dict(left.payload)
+    try:
+        schema = ftm.common_schema(left.payload["schema"], right.payload["schema"])
+        payload["schema"] = schema.name
+    except InvalidData:
+        # Same id for the unrelated schemas is the error in the mapping, the
+        # properties of the first fragment win then
+        return left
+
+    properties: Dict[str, List[Any]] = dict(left.payload["properties"])
+    for prop, values in right.payload["properties"].items():
+        if seen is None:
+            properties[prop] = merge_values(properties.get(prop, []), values, keep_meta)
+            continue
+
+        if prop not in seen:
+            properties[prop] = list(properties.get(prop, []))
+            seen[prop] = {value_key(value, keep_meta) for value in properties[prop]}
+
+        merge_values(properties[prop], values, keep_meta, seen[prop])
+    payload["properties"] = properties
+
+    merged = RedGreenEntity(payload=payload, valid=left.valid and right.valid)
+    if validate:
+        return revalidate(merged)
+
+    return merged
+
+
+def merge_all(
+    fragments: Iterable[RedGreenEntity], keep_meta: bool = True
+) -> RedGreenEntity:
+    """
+    Merges all the fragments of the same entity in linear time, validating the
+    result once
+    """
+    seen: Dict[str, Set[Any]] = {}
+    iterator = iter(fragments)
+    merged: RedGreenEntity = next(iterator)
+    for fragment in iterator:
+        merged = merge_fragments(merged, fragment, keep_meta, seen, validate=False)
+
+    return revalidate(merged)
+
+
+class EntityMerger:
+    """
+    Stage between the digest and the dump, that merges the fragments of the entities
+    with the same id (i.e the same address or founder produced by many records, or the
+    constant entities) into one entity. The merge is streaming: up to max_entities
+    entities are kept in memory, once there are more of them, the least recently
+    updated one is yielded. Fragments of that id, that come after it, start the new
+    entity, so the entities with the fragments far apart in the stream are yielded
+    partially merged, more than once. The rest is yielded at the end of the digest,
+    in the order their ids were first seen, entities without id are passed through
+    right away. See thebeast.dump.aggregate.AggregatingWriter for the complete merge
+    """
+
+    def __init__(
+        self,
+        max_entities: int = DEFAULT_MAX_ENTITIES,
+        keep_meta: bool = True,
+    ) -> None:
+        """
+        max_entities: the number of the entities to keep in memory
+        keep_meta: keep the same values with the different statements meta, set it to
+        False when the dumper ignores the meta, so the values are not repeated
+        """
+        self.max_entities: int = max_entities
+        self.keep_meta: bool = keep_meta
+        self.fragments: int = 0
+        self.entities: int = 0
+        self.evictions: int = 0
+        self.seq: int = 0
+
+    def info(self) -> MergeInfo:
+        """
+        Number of the fragments received, of the entities yielded and of the entities
+        yielded before the end of the current (or the last) run
+        """
+        return MergeInfo(self.fragments, self.entities, self.evictions)
+
+    def merge(
+        self, entities: Iterable[RedGreenEntity]
+    ) -> Generator[RedGreenEntity, None, None]:
+        self.fragments, self.entities, self.evictions = 0, 0, 0
+        # Entities by id, the least recently updated first
+        table: "OrderedDict[str, Tuple[int, RedGreenEntity]]" = OrderedDict()
+        # Keys of the values of the entities in the table, that were merged at least
+        # once, by property (see merge_fragments), so each merge costs only as much
+        # as the fragment. Merged entities are validated once, when they are yielded
+        seen: Dict[str, Dict[str, Set[Any]]] = {}
+
+        for entity in entities:
+            self.fragments += 1
+            entity_id: Optional[str] = entity.payload.get("id")
+            if entity_id is None:
+                self.entities += 1
+                yield entity
+                continue
+
+            if entity_id in table:
+                seq, merged = table[entity_id]
+                table[entity_id] = (
+                    seq,
+                    merge_fragments(
+                        merged,
+                        entity,
+                        self.keep_meta,
+                        seen.setdefault(entity_id, {}),
+                        validate=False,
+                    ),
+                )
+                table.move_to_end(entity_id)
+                continue
+
+            table[entity_id] = (self.seq, entity)
+            self.seq += 1
+
+            if len(table) > self.max_entities:
+                evicted_id, (_, evicted) = table.popitem(last=False)
+                seen.pop(evicted_id, None)
+                self.evictions += 1
+                self.entities += 1
+                yield revalidate(evicted)
+
+        # Ids are yielded in the order they are first seen
+        for _, entity in sorted(table.values(), key=lambda item: item[0]):
+            self.entities += 1
+            yield revalidate(entity)
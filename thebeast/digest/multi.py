@@ -1,33 +1,238 @@
-from typing import List, Dict, Generator, Iterable, Any
-from multiprocessing import Pool, cpu_count
+from typing import (
+    List,
+    Dict,
+    Generator,
+    Iterable,
+    Iterator,
+    Any,
+    Optional,
+    Callable,
+    Tuple,
+    Union,
+)
+import heapq
+import threading
+from collections import Counter, namedtuple
+from multiprocessing import Pool, Value, cpu_count
+from multiprocessing.util import Finalize
 from followthemoney.schema import Schema  # type: ignore
 
-from thebeast.contrib.ftm_ext.meta_factory import get_meta_cls
-from .abstract import AbstractDigestor, main_cog
-from thebeast.types import Record
+from thebeast.contrib.ftm_ext.meta_factory import get_meta_cls, set_meta_free
+from thebeast.contrib.ftm_ext.clean_cache import configure_clean_cache
+from .abstract import AbstractDigestor, main_cog, build_plan
+from .resolvers import set_regex_concurrent
+from thebeast.ingest.abstract import AbstractIngestor
+from thebeast.dump.abstract import AbstractWriter, shard_uri
+from thebeast.types import Record, RawChunk, ByteRange
 
-from .utils import flatten
+from .utils import chunks, pack_entities, unpack_entities
 
 main_cog_ctx: Dict[str, Any]
 
+# Result of the batch, processed by the worker. seq is the number of the batch in the
+# input, shard is the shard worker writes into, if any, entities are packed with
+# the pack_entities
+BatchResult: type = namedtuple("BatchResult", ["seq", "shard", "count", "entities"])
+
+# Queue depth of the pool: batches submitted and not received back yet, batches not
+# released by the parent yet, the peak of the former and the number of times
+# ingest was blocked because the window was full
+QueueStats: type = namedtuple(
+    "QueueStats", ["in_flight", "pending", "peak_in_flight", "blocked"]
+)
+
 
 def task(record: Record) -> List[Schema]:
     # To overcome an issue with passing multiple parameters into the
     # mapped function we declare and use global variable main_cog_ctx
     # https://superfastpython.com/multiprocessing-pool-initializer/
-    global main_cog_ctx # noqa: F824
+    global main_cog_ctx  # noqa: F824
 
     return list(
         main_cog(
             data=record,
-            config=main_cog_ctx["mapping_config"],
+            plan=main_cog_ctx["plan"],
             parent_context_entities_map=main_cog_ctx["parent_context_entities_map"],
             statements_meta=main_cog_ctx["statements_meta"],
             parent_record=None,
+            deflate=main_cog_ctx["deflate"],
+        )
+    )
+
+
+def batch_task(
+    item: Tuple[int, Union[Tuple[Record, ...], RawChunk, ByteRange, str]],
+) -> BatchResult:
+    # Digests the batch of records, the chunk of raw records, that worker parses
+    # itself, or the whole file (or the byte range of it), that worker reads itself.
+    # When the worker has its own dumper, it writes the entities into its shard and
+    # only reports back the number of them
+    global main_cog_ctx  # noqa: F824
+
+    seq, batch = item
+    records: Iterable[Record]
+    if isinstance(batch, RawChunk):
+        records = main_cog_ctx["ingestor"].parse_chunk(batch)
+    elif isinstance(batch, ByteRange):
+        records = main_cog_ctx["ingestor"].iterate_range(batch)
+    elif isinstance(batch, str):
+        records = main_cog_ctx["ingestor"].iterate_file(batch)
+    else:
+        records = batch
+
+    if main_cog_ctx["dumper"] is not None:
+        # Streaming, so the entities of the whole file are not held in memory
+        counter: Counter = Counter()
+        main_cog_ctx["dumper"].write_entities(
+            count_entities(
+                (entity for record in records for entity in task(record)), counter
+            ),
+            flush=False,
+        )
+
+        return BatchResult(
+            seq=seq,
+            shard=main_cog_ctx["shard"],
+            count=counter[None],
+            entities=pack_entities([]),
         )
+
+    entities: List[Schema] = [entity for record in records for entity in task(record)]
+
+    return BatchResult(
+        seq=seq, shard=None, count=len(entities), entities=pack_entities(entities)
     )
 
 
+def batch_position(
+    batch: Union[Tuple[Record, ...], RawChunk, ByteRange, str],
+) -> Optional[Tuple[str, int]]:
+    """
+    Position (input_uri, record_no) of the last record of the batch, if it's known
+    before the batch is read
+    """
+    if isinstance(batch, RawChunk):
+        return (batch.input_uri, batch.record_no + len(batch.payload) - 1)
+
+    if isinstance(batch, tuple) and not isinstance(batch, ByteRange):
+        return (batch[-1].input_uri, batch[-1].record_no)
+
+    return None
+
+
+def reorder(results: Iterable[BatchResult]) -> Generator[BatchResult, None, None]:
+    """
+    Restores the order of the batches, that are completed out of order. The size of
+    the buffer is bounded by the window, that feeds the batches into the pool
+    """
+    buffer: Dict[int, BatchResult] = {}
+    next_seq: int = 0
+
+    for result in results:
+        buffer[result.seq] = result
+        while next_seq in buffer:
+            yield buffer.pop(next_seq)
+            next_seq += 1
+
+
+class Window:
+    """
+    Backpressure for the pool. Bounds the number of the batches in flight (submitted,
+    but not yet received back) and pending (submitted, but not yet released by the
+    parent, i.e still waiting in the reorder buffer). The pool consumes the batches
+    in its task handler thread, so it's that thread that blocks on ingest once the
+    window is full, until the parent receives or releases some of the batches
+    """
+
+    def __init__(
+        self, max_in_flight: Optional[int] = None, max_pending: Optional[int] = None
+    ) -> None:
+        self.max_in_flight: Optional[int] = max_in_flight
+        self.max_pending: Optional[int] = max_pending
+        self.condition: threading.Condition = threading.Condition()
+        self.closed: bool = False
+
+        self.in_flight: int = 0
+        self.pending: int = 0
+        self.peak_in_flight: int = 0
+        self.blocked: int = 0
+
+    def is_full(self) -> bool:
+        return bool(
+            (self.max_in_flight and self.in_flight >= self.max_in_flight)
+            or (self.max_pending and self.pending >= self.max_pending)
+        )
+
+    def feed(self, iterable: Iterable) -> Generator[Any, None, None]:
+        iterator: Iterator = iter(iterable)
+
+        while True:
+            with self.condition:
+                if self.is_full():
+                    self.blocked += 1
+
+                while self.is_full() and not self.closed:
+                    self.condition.wait()
+
+                if self.closed:
+                    return
+
+                # Next batch is only read once there is room for it
+                self.in_flight += 1
+                self.pending += 1
+                self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+            try:
+                item = next(iterator)
+            except StopIteration:
+                with self.condition:
+                    self.in_flight -= 1
+                    self.pending -= 1
+
+                return
+
+            yield item
+
+    def receive(
+        self, results: Iterable[BatchResult]
+    ) -> Generator[BatchResult, None, None]:
+        for result in results:
+            with self.condition:
+                self.in_flight -= 1
+                self.condition.notify()
+
+            yield result
+
+    def release(self) -> None:
+        with self.condition:
+            self.pending -= 1
+            self.condition.notify()
+
+    def close(self) -> None:
+        # Unblocking the task handler thread, so the pool can be terminated
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def stats(self) -> QueueStats:
+        with self.condition:
+            return QueueStats(
+                in_flight=self.in_flight,
+                pending=self.pending,
+                peak_in_flight=self.peak_in_flight,
+                blocked=self.blocked,
+            )
+
+
+def count_entities(
+    entities: Iterable[Schema], counter: Counter
+) -> Generator[Schema, None, None]:
+    # Entities, written by the parent process itself are counted under the None key
+    for entity in entities:
+        counter[None] += 1
+        yield entity
+
+
 # Here we are storing worker context into the global variable in a worker process
 # and also initializing our meta_cls with a list of meta fields, that came from
 # the mapping
@@ -36,6 +241,15 @@ def worker_init(
     parent_context_entities_map: Dict[str, str],
     statements_meta: Dict[str, str],
     meta_fields: List[str],
+    optimize: bool,
+    meta_free: bool,
+    regex_concurrent: Optional[bool],
+    clean_cache_size: Optional[int],
+    deflate: Callable,
+    ingestor: Optional[AbstractIngestor] = None,
+    dumper_cls: Optional[type] = None,
+    dumper_params: Optional[Dict[str, Any]] = None,
+    shard_counter: Any = None,
 ) -> None:
     global main_cog_ctx
 
@@ -44,14 +258,37 @@ def worker_init(
     # When doing multiprocessing you cannot access the dynamically initialized class
     # in the scope of the parent process, so you need to redo it for each process
     get_meta_cls(meta_fields)
+    set_meta_free(meta_free)
+    set_regex_concurrent(regex_concurrent)
+    if clean_cache_size is not None:
+        configure_clean_cache(clean_cache_size)
 
-    # assign the global variable
+    # assign the global variable. The plan is compiled in each worker rather than
+    # pickled, since it holds compiled regexes, jmespathes and resolved callables
     main_cog_ctx = {
-        "mapping_config": mapping_config,
+        "plan": build_plan(mapping_config, optimize=optimize),
         "parent_context_entities_map": parent_context_entities_map,
         "statements_meta": statements_meta,
+        "deflate": deflate,
+        "ingestor": ingestor,
+        "dumper": None,
+        "shard": None,
     }
 
+    if dumper_cls is not None:
+        with shard_counter.get_lock():
+            main_cog_ctx["shard"] = shard_counter.value
+            shard_counter.value += 1
+
+        dumper: AbstractWriter = dumper_cls.make_shard(
+            dumper_params, main_cog_ctx["shard"]
+        )
+        main_cog_ctx["dumper"] = dumper
+
+        # Worker processes are not notified when the pool is done, so the shard
+        # is closed when the worker exits
+        Finalize(dumper, dumper.close, exitpriority=10)
+
 
 class MultiProcessDigestor(AbstractDigestor):
     """
@@ -64,26 +301,195 @@ class MultiProcessDigestor(AbstractDigestor):
         meta_fields: List[str],
         batch_size: int = 1,
         processes: int = -1,
+        optimize: bool = True,
+        regex_concurrent: Optional[bool] = None,
+        meta_free: bool = False,
+        clean_cache_size: Optional[int] = None,
+        validation: str = "full",
+        skip_invalid: bool = False,
+        parse_in_workers: bool = False,
+        files_in_workers: bool = False,
+        range_size: int = 0,
+        write_in_workers: bool = False,
+        merge_shards: bool = True,
+        preserve_order: bool = True,
+        reorder_buffer: int = 64,
+        max_in_flight: int = -1,
+        schedule_lookahead: int = -1,
     ) -> None:
         """
         processes: the number of processes to launch in the pool
         batch_size: the number of the records to throw into the pool
+        parse_in_workers: when the ingestor itself is passed to extract and it
+        supports it, the parent process only splits the files into the chunks of
+        batch_size raw records and workers parse them
+        files_in_workers: when the ingestor itself is passed to extract, each worker
+        takes whole files from its sourcer and reads them itself, largest files first.
+        Requires write_in_workers or range_size, so the entities of the whole file
+        are never sent back at once
+        range_size: with files_in_workers, local uncompressed csv and jsonl files are
+        split into the byte ranges of about range_size bytes, aligned to the records,
+        so a single large file is read by many workers. 0 disables the splitting.
+        Unless the workers write the entities themselves, files that can't be split
+        are read by the parent in batches of batch_size records
+        write_in_workers: when entities are written with dump, each worker writes
+        them into its own shard of the output instead of sending them back
+        merge_shards: concatenate the shards into the output once the workers are done
+        preserve_order: yield the entities in the same order as the single process
+        digestor does. Otherwise the batches are yielded as soon as they are done,
+        so one slow record doesn't hold the rest
+        reorder_buffer: the number of the batches that might be completed ahead of
+        the slowest one, while the order is preserved
+        max_in_flight: the number of the batches submitted into the pool and not
+        received back yet. Once reached, the parent stops reading the input, so the
+        memory stays flat. Defaults to 4 batches per process, 0 means unbounded
+        schedule_lookahead: with files_in_workers, the number of the files (or their
+        byte ranges) scanned ahead of the pool, the largest of them are sent first.
+        Defaults to 2 per process, 0 sends them in the order they are found
         """
-        super().__init__(mapping_config=mapping_config, meta_fields=meta_fields)
+        if files_in_workers and not (write_in_workers or range_size):
+            raise ValueError(
+                "files_in_workers requires write_in_workers or range_size, otherwise "
+                "the entities of the whole file are sent back to the parent at once"
+            )
+
+        super().__init__(
+            mapping_config=mapping_config,
+            meta_fields=meta_fields,
+            optimize=optimize,
+            regex_concurrent=regex_concurrent,
+            meta_free=meta_free,
+            clean_cache_size=clean_cache_size,
+            validation=validation,
+            skip_invalid=skip_invalid,
+        )
 
         self.processes: int = processes
+        self.parse_in_workers: bool = parse_in_workers
+        self.files_in_workers: bool = files_in_workers
+        self.range_size: int = range_size
+        self.write_in_workers: bool = write_in_workers
+        self.merge_shards: bool = merge_shards
+        self.dumper: Optional[AbstractWriter] = None
+        self.shard_counts: Counter = Counter()
+        self.preserve_order: bool = preserve_order
+        self.reorder_buffer: int = reorder_buffer
 
-        # TODO: use it or remove it
         self.batch_size: int = batch_size
         if self.processes == -1:
             self.processes = cpu_count()
 
+        self.max_in_flight: int = max_in_flight
+        if self.max_in_flight == -1:
+            self.max_in_flight = self.processes * 4
+
+        self.schedule_lookahead: int = schedule_lookahead
+        if self.schedule_lookahead == -1:
+            self.schedule_lookahead = self.processes * 2
+
+        self.window: Window = Window()
+
+    def queue_stats(self) -> QueueStats:
+        """
+        Queue depth of the current (or the last) run
+        """
+        return self.window.stats()
+
+    def dump(self, records: Iterable[Record], dumper: AbstractWriter) -> Dict[str, int]:
+        """
+        Digests the records and writes the entities with the dumper. With
+        write_in_workers the workers write into the shards of the dumper output
+        themselves, while the parent only writes constant entities and collects
+        the number of entities written into each shard.
+        Returns the number of entities written, keyed by the output uri and the
+        uris of the shards
+        """
+        self.shard_counts = Counter()
+        if self.write_in_workers:
+            self.dumper = dumper
+
+        try:
+            dumper.write_entities(
+                count_entities(self.extract(records), self.shard_counts)
+            )
+        finally:
+            self.dumper = None
+
+        written: Dict[str, int] = {dumper.output_uri: self.shard_counts.pop(None, 0)}
+        shards: List[int] = sorted(self.shard_counts)
+        for shard in shards:
+            written[shard_uri(dumper.output_uri, shard)] = self.shard_counts[shard]
+
+        if self.merge_shards:
+            for shard in shards:
+                dumper.merge_shard(shard)
+
+        return written
+
+    def scan_files(
+        self, ingestor: AbstractIngestor
+    ) -> Generator[Tuple[Union[ByteRange, str], int], None, None]:
+        """
+        Files (or their byte ranges) to be read by the workers with their sizes, in
+        the order they are found
+        """
+        for file_uri in ingestor.sources():
+            if self.range_size and ingestor.splittable(file_uri):
+                for byte_range in ingestor.byte_ranges(file_uri, self.range_size):
+                    yield byte_range, byte_range.end - byte_range.start
+            else:
+                yield file_uri, ingestor.source_size(file_uri)
+
+    def schedule_files(
+        self, ingestor: AbstractIngestor
+    ) -> Generator[Union[ByteRange, str], None, None]:
+        """
+        Files (or their byte ranges) to be read by the workers. Those are sent as soon
+        as they are scanned, so the workers don't wait for the whole input to be
+        split. The largest of the next schedule_lookahead ones go first, so the pool
+        isn't waiting for the one big file picked up at the very end
+        """
+        # Sequence number breaks the ties, so the batches themselves aren't compared
+        heap: List[Tuple[int, int, Union[ByteRange, str]]] = []
+        for seq, (batch, size) in enumerate(self.scan_files(ingestor)):
+            heapq.heappush(heap, (-size, seq, batch))
+            if len(heap) > self.schedule_lookahead:
+                yield heapq.heappop(heap)[2]
+
+        while heap:
+            yield heapq.heappop(heap)[2]
+
+    def bounded_batches(
+        self, ingestor: AbstractIngestor, batches: Iterable[Union[ByteRange, str]]
+    ) -> Generator[Union[Tuple[Record, ...], ByteRange, str], None, None]:
+        """
+        Whole files, that workers can't write themselves, are read by the parent in
+        batches of batch_size records, so the result of each batch stays small
+        """
+        for batch in batches:
+            if isinstance(batch, str):
+                yield from chunks(ingestor.iterate_file(batch), self.batch_size)
+            else:
+                yield batch
+
     def run_the_cog(
         self,
         records: Iterable[Record],
         parent_context_entities_map: Dict[str, str],
         statements_meta: Dict[str, str],
     ) -> Generator[Schema, None, None]:
+        ingestor: Optional[AbstractIngestor] = None
+        if isinstance(records, AbstractIngestor) and (
+            self.files_in_workers or (self.parse_in_workers and records.supports_raw)
+        ):
+            ingestor = records
+
+        dumper_cls: Optional[type] = None
+        dumper_params: Optional[Dict[str, Any]] = None
+        if self.dumper is not None:
+            dumper_cls = self.dumper.__class__
+            dumper_params = self.dumper.params()
+
         # Now for the really fun part: real entities with multiprocessing
         with Pool(
             self.processes,
@@ -94,9 +500,69 @@ class MultiProcessDigestor(AbstractDigestor):
                 parent_context_entities_map,
                 statements_meta,
                 self.meta_fields,
+                self.optimize,
+                self.meta_free,
+                self.regex_concurrent,
+                self.clean_cache_size,
+                # partial of the module level function, so it's picklable
+                self.deflate,
+                ingestor,
+                dumper_cls,
+                dumper_params,
+                Value("i", 0),
             ),
         ) as da_pool:
-            for entity in flatten(
-                da_pool.imap(func=task, iterable=records, chunksize=self.batch_size)
-            ):
-                yield entity
+            batches: Iterable[Union[Tuple[Record, ...], RawChunk, ByteRange, str]]
+            if ingestor is not None and self.files_in_workers:
+                batches = self.schedule_files(ingestor)
+                if dumper_cls is None:
+                    batches = self.bounded_batches(ingestor, batches)
+            elif ingestor is not None:
+                batches = ingestor.raw_chunks(self.batch_size)
+            else:
+                batches = chunks(records, self.batch_size)
+
+            # Batches are always completed out of order, the order is restored by
+            # the parent if needed
+            self.window = Window(
+                max_in_flight=self.max_in_flight,
+                max_pending=self.reorder_buffer if self.preserve_order else None,
+            )
+            # Positions of the batches in flight, to track the progress
+            positions: Dict[int, Optional[Tuple[str, int]]] = {}
+
+            def positioned(
+                batches: Iterable[Union[Tuple[Record, ...], RawChunk, ByteRange, str]],
+            ) -> Generator[Tuple[int, Any], None, None]:
+                for seq, batch in enumerate(batches):
+                    positions[seq] = batch_position(batch)
+                    yield seq, batch
+
+            results: Iterable[BatchResult] = self.window.receive(
+                da_pool.imap_unordered(
+                    func=batch_task, iterable=self.window.feed(positioned(batches))
+                )
+            )
+            if self.preserve_order:
+                results = reorder(results)
+
+            try:
+                for result in results:
+                    if result.shard is not None:
+                        self.shard_counts[result.shard] += result.count
+
+                    yield from unpack_entities(result.entities)
+                    self.window.release()
+
+                    # Progress is only known when the batches are yielded in order
+                    # and the entities are written by the parent
+                    position = positions.pop(result.seq)
+                    if self.preserve_order and dumper_cls is None:
+                        self.progress = position
+            finally:
+                self.window.close()
+
+            if dumper_cls is not None:
+                # Letting workers exit gracefully, so they close their shards
+                da_pool.close()
+                da_pool.join()
@@ -0,0 +1,202 @@
+from typing import List, Dict, Set, Iterable, Optional
+from collections import Counter
+
+from followthemoney import model as ftm  # type: ignore
+from followthemoney.types import registry  # type: ignore
+
+from .plan import MappingPlan, CollectionPlan, EntityPlan, PropertyPlan
+from .resolvers import (
+    Pipeline,
+    SharedColumn,
+    _resolve_literal,
+    _resolve_column,
+    _resolve_shared_column,
+    _resolve_property,
+    _resolve_template,
+    _resolve_meta,
+)
+
+# Types, which cleaning depends on the other properties of the entity, so we cannot
+# clean the literal values of those in advance
+PROXY_DEPENDENT_TYPES = (registry.phone, registry.entity)
+
+
+def iter_pipelines(pipelines: List[Pipeline]) -> Iterable[Pipeline]:
+    """
+    Yields the pipelines together with all the pipelines nested into `meta` commands
+    """
+    for pipeline in pipelines:
+        yield pipeline
+
+        for resolver, command_config in pipeline:
+            if resolver is _resolve_meta:
+                for _, meta_pipelines in command_config.fields:
+                    yield from iter_pipelines(meta_pipelines)
+
+
+def is_literal_only(pipelines: List[Pipeline]) -> bool:
+    return all(
+        resolver is _resolve_literal
+        for pipeline in pipelines
+        for resolver, _ in pipeline
+    )
+
+
+def literal_values(pipelines: List[Pipeline]) -> List[str]:
+    return [
+        str(command_config) for pipeline in pipelines for _, command_config in pipeline
+    ]
+
+
+def used_variables(entity_plan: EntityPlan) -> Optional[Set[str]]:
+    """
+    Collects the names of the variables, that are referenced by properties or keys
+    of the entity. Returns None if we cannot tell (i.e template might access any of them)
+    """
+    used: Set[str] = {
+        key.key_path for key in entity_plan.keys if key.key_type == "variable"
+    }
+
+    for property_plan in entity_plan.properties:
+        for pipeline in iter_pipelines(property_plan.pipelines):
+            for resolver, command_config in pipeline:
+                if resolver is _resolve_property:
+                    used.add(command_config)
+                elif (
+                    resolver is _resolve_template
+                    and "variables" in command_config.source
+                ):
+                    return None
+
+    return used
+
+
+def eliminate_dead_properties(entity_plan: EntityPlan) -> None:
+    """
+    Drops variables that nobody reads and properties that cannot produce any value
+    """
+    used: Optional[Set[str]] = used_variables(entity_plan)
+    schema = ftm.get(entity_plan.schema)
+
+    properties: List[PropertyPlan] = []
+    for property_plan in entity_plan.properties:
+        if property_plan.name.startswith("$"):
+            if used is not None and property_plan.name not in used:
+                continue
+        elif not any(property_plan.pipelines) and (
+            schema is not None and property_plan.name in schema.properties
+        ):
+            # We keep empty properties unknown to the schema, so entity.add can complain
+            continue
+
+        properties.append(property_plan)
+
+    entity_plan.properties = properties
+
+
+def hoist_literals(entity_plan: EntityPlan) -> None:
+    """
+    Resolves literal-only properties once. Values of the entity properties are also
+    cleaned once if their type allows it
+    """
+    schema = ftm.get(entity_plan.schema)
+
+    for property_plan in entity_plan.properties:
+        if not is_literal_only(property_plan.pipelines):
+            continue
+
+        values: List[str] = literal_values(property_plan.pipelines)
+
+        if property_plan.name.startswith("$") or schema is None:
+            property_plan.constant_values = values
+            continue
+
+        prop = schema.properties.get(property_plan.name)
+        if prop is None or prop.stub or prop.type in PROXY_DEPENDENT_TYPES:
+            property_plan.constant_values = values
+            continue
+
+        cleaned_values: List[str] = []
+        for value in values:
+            cleaned: Optional[str] = prop.type.clean(value, fuzzy=False, format=None)
+            if cleaned is not None:
+                cleaned_values.append(cleaned)
+
+        property_plan.constant_values = cleaned_values
+        property_plan.cleaned = True
+
+
+def share_columns(collection_plan: CollectionPlan) -> None:
+    """
+    Replaces column commands, that read the same path more than once per record, with the
+    shared column command, so jmespath is evaluated only once
+    """
+
+    all_pipelines: List[Pipeline] = [
+        pipeline
+        for entity_plan in collection_plan.entities
+        for property_plan in entity_plan.properties
+        for pipeline in iter_pipelines(property_plan.pipelines)
+    ] + [
+        pipeline
+        for _, meta_pipelines in collection_plan.meta
+        for pipeline in meta_pipelines
+    ]
+
+    counter: Dict[str, int] = Counter(
+        command_config.expression
+        for pipeline in all_pipelines
+        for resolver, command_config in pipeline
+        if resolver is _resolve_column
+    )
+
+    for pipeline in all_pipelines:
+        for i, (resolver, command_config) in enumerate(pipeline):
+            if resolver is _resolve_column and counter[command_config.expression] > 1:
+                pipeline[i] = (
+                    _resolve_shared_column,
+                    SharedColumn(
+                        path=command_config.expression, expression=command_config
+                    ),
+                )
+
+
+def hoist_collection_meta(collection_plan: CollectionPlan) -> None:
+    """
+    Resolves literal-only collection meta once
+    """
+    meta = []
+    for statement_meta_name, pipelines in collection_plan.meta:
+        if is_literal_only(pipelines):
+            collection_plan.constant_meta[statement_meta_name] = "\n".join(
+                literal_values(pipelines)
+            )
+        else:
+            meta.append((statement_meta_name, pipelines))
+
+    collection_plan.meta = meta
+
+
+def optimize_entities(entity_plans: List[EntityPlan]) -> None:
+    for entity_plan in entity_plans:
+        eliminate_dead_properties(entity_plan)
+        hoist_literals(entity_plan)
+
+
+def optimize_collections(collection_plans: List[CollectionPlan]) -> None:
+    for collection_plan in collection_plans:
+        hoist_collection_meta(collection_plan)
+        optimize_entities(collection_plan.entities)
+        share_columns(collection_plan)
+        optimize_collections(collection_plan.collections)
+
+
+def optimize_plan(plan: MappingPlan) -> MappingPlan:
+    """
+    Static optimizations of the compiled mapping. Output of the optimized plan
+    must be identical to the output of the original one
+    """
+    optimize_entities(plan.constant_entities)
+    optimize_collections(plan.collections)
+
+    return plan
@@ -0,0 +1,168 @@
+from typing import List, Dict, Callable, Optional, Any, Tuple
+from dataclasses import dataclass, field
+
+from .utils import (
+    generate_pseudo_id,
+    compile_jmespath,
+    resolve_callable,
+    ensure_list,
+)
+from .resolvers import (
+    Pipeline,
+    compile_property_configs,
+    PROPERTY_COMMANDS,
+    COLLECTION_META_COMMANDS,
+    CONSTANT_META_COMMANDS,
+)
+
+
+@dataclass
+class KeyPlan:
+    """
+    Parsed entity key, i.e `record.name` or `entity.*`. For the `record` keys
+    key_path is a compiled jmespath expression
+    """
+
+    key_type: str
+    key_path: Any
+
+
+@dataclass
+class PropertyPlan:
+    """
+    Compiled property (or $variable) of the entity. constant_values are set by the optimizer
+    for literal-only properties, so they are resolved once instead of for every record.
+    When cleaned is set, constant_values are already cleaned by the property type
+    """
+
+    name: str
+    pipelines: List[Pipeline]
+    constant_values: Optional[List[str]] = None
+    cleaned: bool = False
+
+
+@dataclass
+class EntityPlan:
+    """
+    Everything we need to make an entity out of the record, parsed and compiled
+    """
+
+    name: str
+    schema: str
+    pseudo_id: str
+    # Properties in the order of the mapping. Names starting with $ are variables
+    properties: List[PropertyPlan]
+    keys: List[KeyPlan]
+
+
+@dataclass
+class CollectionPlan:
+    """
+    Compiled collection config: path, record transformer, meta, entities and nested collections
+    """
+
+    name: str
+    path: Any
+    record_transformer: Optional[Callable]
+    meta: List[Tuple[str, List[Pipeline]]]
+    entities: List[EntityPlan]
+    collections: List["CollectionPlan"] = field(default_factory=list)
+    # Literal-only meta values, precalculated by the optimizer
+    constant_meta: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class MappingPlan:
+    """
+    Execution plan for the whole digest section of the mapping. Built once and then
+    reused for every record instead of walking the raw mapping dicts
+    """
+
+    meta: List[Tuple[str, List[Pipeline]]]
+    constant_entities: List[EntityPlan]
+    collections: List[CollectionPlan]
+
+
+def compile_keys(keys: List[str]) -> List[KeyPlan]:
+    key_plans: List[KeyPlan] = []
+
+    for key in keys:
+        key_type, key_path = key.split(".", 1)
+        if key_type == "record":
+            key_plans.append(
+                KeyPlan(key_type=key_type, key_path=compile_jmespath(key_path))
+            )
+        else:
+            key_plans.append(KeyPlan(key_type=key_type, key_path=key_path))
+
+    return key_plans
+
+
+def compile_entities(entities_config: Dict) -> List[EntityPlan]:
+    return [
+        EntityPlan(
+            name=entity_name,
+            schema=entity_config["schema"],
+            pseudo_id=generate_pseudo_id(entity_name),
+            properties=[
+                PropertyPlan(
+                    name=property_name,
+                    pipelines=compile_property_configs(
+                        ensure_list(property_configs), PROPERTY_COMMANDS
+                    ),
+                )
+                for property_name, property_configs in entity_config[
+                    "properties"
+                ].items()
+            ],
+            keys=compile_keys(entity_config["keys"]),
+        )
+        for entity_name, entity_config in entities_config.items()
+    ]
+
+
+def compile_meta_configs(
+    meta_config: Dict, commands_mapping: Dict[str, Callable]
+) -> List[Tuple[str, List[Pipeline]]]:
+    return [
+        (
+            statement_meta_name,
+            compile_property_configs(
+                ensure_list(statement_meta_config), commands_mapping
+            ),
+        )
+        for statement_meta_name, statement_meta_config in meta_config.items()
+    ]
+
+
+def compile_collections(collections_config: Dict) -> List[CollectionPlan]:
+    return [
+        CollectionPlan(
+            name=collection_name,
+            path=compile_jmespath(collection_config["path"]),
+            record_transformer=(
+                resolve_callable(collection_config["record_transformer"])
+                if "record_transformer" in collection_config
+                else None
+            ),
+            meta=compile_meta_configs(
+                collection_config.get("meta", {}), COLLECTION_META_COMMANDS
+            ),
+            entities=compile_entities(collection_config["entities"]),
+            collections=compile_collections(collection_config.get("collections", {})),
+        )
+        for collection_name, collection_config in collections_config.items()
+    ]
+
+
+def compile_mapping(mapping_config: Dict) -> MappingPlan:
+    """
+    Compiles the digest section of the mapping into the execution plan
+    """
+    return MappingPlan(
+        meta=compile_meta_configs(
+            mapping_config.get("meta", {}), CONSTANT_META_COMMANDS
+        ),
+        constant_entities=compile_entities(mapping_config.get("constant_entities", {})),
+        collections=compile_collections(mapping_config.get("collections", {})),
+    )
@@ -0,0 +1,299 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from collections import namedtuple
+import hashlib
+import inspect
+import json
+import pickle
+import sqlite3
+
+from jinja2 import meta as jinja_meta
+
+from thebeast.contrib.ftm_ext import meta_factory
+from thebeast.types import Record, RedGreenEntity
+from .templates import jinja_env
+from .utils import pack_entities, unpack_entities, resolve_callable
+
+DEFAULT_RECORD_CACHE_SIZE: int = 1 << 30
+
+# Keys of the mapping that hold the fully qualified names of the python functions
+CALLABLE_KEYS: Tuple[str, ...] = ("transformer", "augmentor", "record_transformer")
+
+# Meta fields, that differ between the runs and are stamped on the cached entities
+STAMPED_FIELDS: Tuple[str, ...] = ("record_no", "input_uri")
+
+RecordCacheInfo: type = namedtuple(
+    "RecordCacheInfo", ["hits", "misses", "evictions", "maxsize", "currsize"]
+)
+
+
+def callable_names(config: Any) -> Iterable[str]:
+    """
+    Fully qualified names of all the functions used by the mapping
+    """
+    if isinstance(config, dict):
+        for key, value in config.items():
+            if key in CALLABLE_KEYS:
+                for command in value if isinstance(value, list) else [value]:
+                    yield command["name"] if isinstance(command, dict) else command
+            else:
+                yield from callable_names(value)
+    elif isinstance(config, list):
+        for value in config:
+            yield from callable_names(value)
+
+
+def template_sources(config: Any) -> Iterable[str]:
+    """
+    Sources of all the templates used by the mapping
+    """
+    if isinstance(config, dict):
+        for key, value in config.items():
+            if key == "template" and isinstance(value, str):
+                yield value
+            else:
+                yield from template_sources(value)
+    elif isinstance(config, list):
+        for value in config:
+            yield from template_sources(value)
+
+
+def reads_statements_meta(mapping_config: Dict) -> bool:
+    """
+    Whether any template of the mapping reads the statements meta, so the record_no
+    and input_uri might end up in the ids and the values of the entities
+    """
+    return any(
+        "meta" in jinja_meta.find_undeclared_variables(jinja_env.parse(source))
+        for source in template_sources(mapping_config)
+    )
+
+
+def mapping_fingerprint(mapping_config: Dict, **settings: Any) -> str:
+    """
+    Hash of the mapping, of the source code of the functions it uses and of the
+    digestor settings, that change the entities
+    """
+    digest = hashlib.sha256(
+        json.dumps([mapping_config, settings], sort_keys=True, default=str).encode(
+            "utf-8"
+        )
+    )
+
+    for fqfn in sorted(set(callable_names(mapping_config))):
+        func = resolve_callable(fqfn)
+        try:
+            code: str = inspect.getsource(func)
+        except (OSError, TypeError):
+            # Builtins and the like
+            code = repr(func)
+
+        digest.update(fqfn.encode("utf-8"))
+        digest.update(code.encode("utf-8"))
+
+    return digest.hexdigest()
+
+
+def restamp(packed: Tuple, record: Record) -> Tuple:
+    """
+    Replaces the record_no and input_uri in the meta of the packed entities with the
+    ones of the record at hand. Only the fields, that were set, so the values without
+    meta (i.e in the meta_free mode) stay the same as in the fresh digest
+    """
+    meta_table, texts, indices, entities = packed
+    if not meta_table:
+        return packed
+
+    fields: Tuple[str, ...] = meta_factory.get_meta_cls()._fields
+    positions: Dict[int, Any] = {
+        fields.index(field): getattr(record, field)
+        for field in STAMPED_FIELDS
+        if field in fields
+    }
+
+    return (
+        [
+            tuple(
+                value if value is None else positions.get(i, value)
+                for i, value in enumerate(meta)
+            )
+            for meta in meta_table
+        ],
+        texts,
+        indices,
+        entities,
+    )
+
+
+class RecordCache:
+    """
+    Persistent cache of the entities produced for each record, keyed by the hash of
+    the record payload and of the mapping (see mapping_fingerprint). Entities are
+    stored packed in the local SQLite file, the least recently used records are
+    evicted once the total size exceeds maxsize bytes. Record_no and input_uri of
+    the meta are replaced with the ones of the record on reuse. The database is
+    closed once the digest is over and opened again by the next one
+    """
+
+    def __init__(
+        self,
+        path: str,
+        mapping_key: str,
+        maxsize: int = DEFAULT_RECORD_CACHE_SIZE,
+        commit_every: int = 1000,
+        stamped_key: bool = False,
+    ) -> None:
+        """
+        stamped_key: add the record_no and input_uri to the key, when the mapping
+        reads them (see reads_statements_meta), so the entities are only reused for
+        the record at the same position
+        """
+        self.path: str = path
+        self.stamped_key: bool = stamped_key
+        self.mapping_key: bytes = mapping_key.encode("utf-8")
+        self.maxsize: int = maxsize
+        self.commit_every: int = commit_every
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.pending: int = 0
+
+        self.currsize: int
+        self.clock: int
+        self.conn: Optional[sqlite3.Connection] = None
+        self.connect()
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        Opens the database, unless it's open already
+        """
+        if self.conn is not None:
+            return self.conn
+
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS records "
+            "(key BLOB PRIMARY KEY, entities BLOB NOT NULL, size INTEGER NOT NULL, "
+            "used INTEGER NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS records_used ON records (used)")
+
+        self.currsize, self.clock = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0), COALESCE(MAX(used), 0) FROM records"
+        ).fetchone()
+
+        return self.conn
+
+    def key(self, record: Record) -> bytes:
+        digest = hashlib.sha256(self.mapping_key)
+        digest.update(
+            json.dumps(record.payload, sort_keys=True, default=str).encode("utf-8")
+        )
+        if self.stamped_key:
+            digest.update(
+                json.dumps(
+                    [getattr(record, field) for field in STAMPED_FIELDS], default=str
+                ).encode("utf-8")
+            )
+
+        return digest.digest()
+
+    def get(self, record: Record, key: Optional[bytes] = None) -> Optional[List]:
+        """
+        Entities of the record, if those are cached
+        """
+        if key is None:
+            key = self.key(record)
+
+        row: Optional[Tuple[bytes]] = (
+            self.connect()
+            .execute("SELECT entities FROM records WHERE key = ?", (key,))
+            .fetchone()
+        )
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.clock += 1
+        self.conn.execute(
+            "UPDATE records SET used = ? WHERE key = ?", (self.clock, key)
+        )
+        self.maybe_commit()
+
+        return unpack_entities(restamp(pickle.loads(row[0]), record))
+
+    def put(
+        self,
+        record: Record,
+        entities: List[RedGreenEntity],
+        key: Optional[bytes] = None,
+    ) -> None:
+        if key is None:
+            key = self.key(record)
+
+        blob: bytes = pickle.dumps(
+            pack_entities(entities), protocol=pickle.HIGHEST_PROTOCOL
+        )
+        if len(blob) > self.maxsize:
+            return
+
+        self.clock += 1
+        previous: Optional[Tuple[int]] = (
+            self.connect()
+            .execute("SELECT size FROM records WHERE key = ?", (key,))
+            .fetchone()
+        )
+        self.conn.execute(
+            "INSERT OR REPLACE INTO records (key, entities, size, used) "
+            "VALUES (?, ?, ?, ?)",
+            (key, blob, len(blob), self.clock),
+        )
+        self.currsize += len(blob) - (previous[0] if previous else 0)
+
+        if self.currsize > self.maxsize:
+            self.evict()
+
+        self.maybe_commit()
+
+    def evict(self) -> None:
+        """
+        Removes the least recently used records until the cache takes 90% of maxsize
+        """
+        target: int = int(self.maxsize * 0.9)
+        rows: List[Tuple[bytes]] = []
+        freed: int = 0
+        for key, size in self.conn.execute(
+            "SELECT key, size FROM records ORDER BY used"
+        ):
+            if self.currsize - freed <= target:
+                break
+
+            rows.append((key,))
+            freed += size
+
+        self.conn.executemany("DELETE FROM records WHERE key = ?", rows)
+        self.currsize -= freed
+        self.evictions += len(rows)
+
+    def maybe_commit(self) -> None:
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            self.commit()
+
+    def commit(self) -> None:
+        if self.conn is not None:
+            self.conn.commit()
+        self.pending = 0
+
+    def info(self) -> RecordCacheInfo:
+        return RecordCacheInfo(
+            self.hits, self.misses, self.evictions, self.maxsize, self.currsize
+        )
+
+    def close(self) -> None:
+        if self.conn is not None:
+            self.commit()
+            self.conn.close()
+            self.conn = None
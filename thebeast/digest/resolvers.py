@@ -1,21 +1,38 @@
 import regex as re  # type: ignore
-from typing import Optional, List, Dict, Union, Any, Callable, NewType
+from typing import Optional, List, Dict, Union, Any, Callable, NewType, Tuple
+from collections import namedtuple
 from dataclasses import dataclass
+from threading import local
 
 
-from jinja2 import Environment, BaseLoader, select_autoescape
 from followthemoney.schema import Schema  # type: ignore
+from thebeast.contrib.ftm_ext import meta_factory
 from thebeast.contrib.ftm_ext.rigged_entity_proxy import StrProxy
 
 from .utils import (
     generate_pseudo_id,
     jmespath_results_as_array,
+    compile_jmespath,
     resolve_callable,
     ensure_list,
 )
+from .templates import compile_template, jinja_env  # noqa: F401
 
-# TODO: expose jmespath to templates as a filter?
-jinja_env = Environment(loader=BaseLoader(), autoescape=select_autoescape())
+REGEX_CACHE: Dict[str, Any] = {}
+
+
+class RegexSettings(local):
+    # Passed as `concurrent` to every regex call. True releases the GIL while matching,
+    # so the threaded execution scales on regex heavy mappings. None keeps the default.
+    # Kept per thread, so it's switched by the digestor only for its own threads
+    concurrent: Optional[bool] = None
+
+
+REGEX_SETTINGS: RegexSettings = RegexSettings()
+
+
+# Characters that turn the pattern into something more than a plain string
+REGEX_SPECIAL_CHARS: frozenset = frozenset("\\.^$*+?{}[]|()")
 
 
 @dataclass
@@ -25,10 +42,186 @@ class ResolveContext:
     entity: Optional[Schema]
     statements_meta: Optional[Dict[str, str]]
     variables: Optional[Dict[str, List[StrProxy]]]
+    # Per-record storage for the results of the shared column paths
+    shared: Optional[Dict[str, List[Any]]] = None
 
 
 CommandConfig = NewType("CommandConfig", Union[str, dict])
 
+# Compiled forms of the command configs. Each resolver accepts both, the raw config
+# from the mapping and its compiled counterpart, produced by the compile_* functions below
+EntityRef: type = namedtuple("EntityRef", ["pseudo_id"])
+CompiledTransformer: type = namedtuple(
+    "CompiledTransformer", ["func", "params", "signature"]
+)
+# merged_regex/merged_replace are set when all the replacements can be done in one pass
+CompiledRegexReplace: type = namedtuple(
+    "CompiledRegexReplace", ["regex_list", "replace", "merged_regex", "merged_replace"]
+)
+CompiledMeta: type = namedtuple("CompiledMeta", ["fields"])
+# Column path that is used more than once per record, see optimizer
+SharedColumn: type = namedtuple("SharedColumn", ["path", "expression"])
+
+# A pipeline is a list of (resolver, compiled command config) pairs, applied in order
+# to produce the values of one property config
+Pipeline = List[Tuple[Callable, Any]]
+
+
+def compile_regex(pattern: Union[str, Any]) -> Any:
+    """
+    Caching compiled regexes. Already compiled patterns are returned as is
+    """
+    if not isinstance(pattern, str):
+        return pattern
+
+    if pattern in REGEX_CACHE:
+        return REGEX_CACHE[pattern]
+
+    compiled = re.compile(pattern, flags=re.V1)
+    REGEX_CACHE[pattern] = compiled
+
+    return compiled
+
+
+def set_regex_concurrent(concurrent: Optional[bool]) -> None:
+    """
+    Switches the GIL releasing mode of the regex module for all the regex commands
+    run by the current thread
+    """
+    REGEX_SETTINGS.concurrent = concurrent
+
+
+def merge_plain_replacements(
+    patterns: List[Any], replaces: List[Any]
+) -> Optional[Tuple[Any, Callable]]:
+    """
+    Merges the list of plain string replacements into the single pass alternation,
+    when it gives exactly the same result as applying them one by one. That's the case when:
+    - patterns have no characters in common, so their occurrences cannot overlap
+    - later patterns have no characters in common with earlier replacements, so
+      replacements cannot produce new matches
+    - patterns that follow a deletion are single characters, so removed text cannot
+      glue a new match together
+    Returns merged regex and the replacement callable or None
+    """
+    if len(patterns) < 2:
+        return None
+
+    for pattern in patterns:
+        if not isinstance(pattern, str) or not pattern:
+            return None
+
+        if REGEX_SPECIAL_CHARS.intersection(pattern):
+            return None
+
+    for replace in replaces:
+        if not isinstance(replace, str) or "\\" in replace:
+            return None
+
+    seen_chars: set = set()
+    for i, pattern in enumerate(patterns):
+        pattern_chars: set = set(pattern)
+        if seen_chars & pattern_chars:
+            return None
+
+        seen_chars |= pattern_chars
+
+        for replace in replaces[:i]:
+            if pattern_chars.intersection(replace):
+                return None
+
+            if not replace and len(pattern) > 1:
+                return None
+
+    table: Dict[str, str] = dict(zip(patterns, replaces))
+
+    return compile_regex("|".join(patterns)), lambda match: table[match.group()]
+
+
+def compile_entity(command_config: Union[str, EntityRef]) -> EntityRef:
+    """
+    Precalculates the pseudo id for the entity reference
+    """
+    if isinstance(command_config, EntityRef):
+        return command_config
+
+    return EntityRef(pseudo_id=generate_pseudo_id(command_config))
+
+
+def compile_transformer(
+    command_config: Union[CommandConfig, CompiledTransformer],
+) -> CompiledTransformer:
+    """
+    Resolves transformer callable and builds its signature for the statements meta
+    """
+    if isinstance(command_config, CompiledTransformer):
+        return command_config
+
+    if isinstance(command_config, dict):
+        fcfn: str = command_config["name"]
+        params: dict = command_config.get("params", {})
+    else:
+        fcfn = command_config
+        params = {}
+
+    params_as_args = ", ".join(
+        f"{param_name}={param_value}" for param_name, param_value in params.items()
+    )
+
+    return CompiledTransformer(
+        func=resolve_callable(fcfn),
+        params=params,
+        signature=f"{fcfn}({params_as_args})",
+    )
+
+
+def compile_regex_replace(
+    command_config: Union[CommandConfig, CompiledRegexReplace],
+) -> CompiledRegexReplace:
+    """
+    Compiles all the regexes of the regex_replace command. Lengths of regex and replace
+    lists are validated by the resolver
+    """
+    if isinstance(command_config, CompiledRegexReplace):
+        return command_config
+
+    patterns: List[Any] = ensure_list(command_config["regex"])
+    replace: Any = command_config["replace"]
+    replaces: List[Any] = (
+        replace if isinstance(replace, list) else [replace] * len(patterns)
+    )
+
+    merged: Optional[Tuple[Any, Callable]] = None
+    if len(replaces) == len(patterns):
+        merged = merge_plain_replacements(patterns, replaces)
+
+    return CompiledRegexReplace(
+        regex_list=[compile_regex(regex) for regex in patterns],
+        replace=replace,
+        merged_regex=merged[0] if merged else None,
+        merged_replace=merged[1] if merged else None,
+    )
+
+
+def compile_meta(command_config: Union[CommandConfig, CompiledMeta]) -> CompiledMeta:
+    """
+    Compiles the property level meta configs into the pipelines
+    """
+    if isinstance(command_config, CompiledMeta):
+        return command_config
+
+    return CompiledMeta(
+        fields=[
+            (
+                meta_name,
+                compile_property_configs(
+                    ensure_list(meta_config), PROPERTY_META_COMMANDS
+                ),
+            )
+            for meta_name, meta_config in command_config.items()
+        ]
+    )
+
 
 def _resolve_literal(
     command_config: CommandConfig, context: ResolveContext
@@ -56,7 +249,7 @@ def _resolve_entity(
     """
 
     return context.property_values + [
-        StrProxy(generate_pseudo_id(command_config), meta=context.statements_meta)
+        StrProxy(compile_entity(command_config).pseudo_id, meta=context.statements_meta)
     ]
 
 
@@ -74,6 +267,27 @@ def _resolve_column(
     ]
 
 
+def _resolve_shared_column(
+    command_config: SharedColumn, context: ResolveContext
+) -> List[StrProxy]:
+    """
+    Same as `column`, but jmespath is evaluated only once per record and
+    the result is reused by all the properties that read the same path
+    """
+
+    if context.shared is None:
+        values = jmespath_results_as_array(command_config.expression, context.record)
+    elif command_config.path in context.shared:
+        values = context.shared[command_config.path]
+    else:
+        values = jmespath_results_as_array(command_config.expression, context.record)
+        context.shared[command_config.path] = values
+
+    return context.property_values + [
+        StrProxy(val, meta=context.statements_meta) for val in values
+    ]
+
+
 def _resolve_regex_split(
     command_config: CommandConfig, context: ResolveContext
 ) -> List[StrProxy]:
@@ -82,11 +296,14 @@ def _resolve_regex_split(
     values for the entity field from the single string.
     """
     new_property_values: List[StrProxy] = []
+    regex = compile_regex(command_config)
 
     for property_value in context.property_values:
         new_property_values += [
             property_value.inject_meta_to_str(val)
-            for val in re.split(command_config, str(property_value), flags=re.V1)
+            for val in regex.split(
+                str(property_value), concurrent=REGEX_SETTINGS.concurrent
+            )
         ]
 
     return new_property_values
@@ -101,12 +318,13 @@ def _resolve_regex_first(
     """
 
     extracted_property_values: List[Any] = []
+    regex = compile_regex(command_config)
 
     for property_value in context.property_values:
         if not property_value:
             continue
 
-        m = re.search(command_config, property_value, flags=re.V1)
+        m = regex.search(property_value, concurrent=REGEX_SETTINGS.concurrent)
         if m:
             if m.groups():
                 # We support both, groups
@@ -131,6 +349,7 @@ def _resolve_regex(
     """
 
     extracted_property_values: List[Any] = []
+    regex = compile_regex(command_config)
 
     for property_value in context.property_values:
         if not property_value:
@@ -138,7 +357,7 @@ def _resolve_regex(
 
         extracted_property_values += [
             property_value.inject_meta_to_str(v)
-            for v in re.findall(command_config, property_value, flags=re.V1)
+            for v in regex.findall(property_value, concurrent=REGEX_SETTINGS.concurrent)
         ]
 
     return extracted_property_values
@@ -162,7 +381,9 @@ def regex_replace_multiple(
 
         for regex, replace in zip(regex_list, replace_list):
             string = property_value.inject_meta_to_str(
-                re.sub(regex, replace, string, flags=re.V1)
+                compile_regex(regex).sub(
+                    replace, string, concurrent=REGEX_SETTINGS.concurrent
+                )
             )
 
         extracted_property_values += [string]
@@ -184,11 +405,26 @@ def _resolve_regex_replace(
     """
 
     extracted_property_values: List[Any] = []
-    regex_list = command_config["regex"]
-    replace = command_config["replace"]
+    compiled: CompiledRegexReplace = compile_regex_replace(command_config)
+    regex_list = compiled.regex_list
+    replace = compiled.replace
+
+    if compiled.merged_regex is not None:
+        for property_value in context.property_values:
+            if not property_value:
+                continue
+
+            extracted_property_values.append(
+                property_value.inject_meta_to_str(
+                    compiled.merged_regex.sub(
+                        compiled.merged_replace,
+                        property_value,
+                        concurrent=REGEX_SETTINGS.concurrent,
+                    )
+                )
+            )
 
-    if not isinstance(regex_list, list):
-        regex_list = [regex_list]
+        return extracted_property_values
 
     if isinstance(replace, list):
         if len(replace) != len(regex_list):
@@ -204,7 +440,7 @@ def _resolve_regex_replace(
 
         for regex in regex_list:
             property_value = property_value.inject_meta_to_str(
-                re.sub(regex, replace, property_value, flags=re.V1)
+                regex.sub(replace, property_value, concurrent=REGEX_SETTINGS.concurrent)
             )
 
         extracted_property_values += [property_value]
@@ -221,23 +457,20 @@ def _resolve_transformer(
     added to the entity instead of the original values
     """
 
-    if isinstance(command_config, dict):
-        fcfn: str = command_config["name"]
-        params: dict = command_config.get("params", {})
-    else:
-        fcfn = command_config
-        params = {}
-
-    params_as_args = ", ".join(
-        f"{param_name}={param_value}" for param_name, param_value in params.items()
-    )
+    transformer: CompiledTransformer = compile_transformer(command_config)
+    property_values = transformer.func(context.property_values, **transformer.params)
+    if meta_factory.settings.meta_free:
+        return property_values
 
-    transformer_signature = f"{fcfn}({params_as_args})"
-    property_values = resolve_callable(fcfn)(context.property_values, **params)
+    # Values mostly share the meta, so it's replaced once for the whole run of them
+    meta: Any = None
+    transformed_meta: Any = None
     for property_value in property_values:
-        property_value._meta = property_value._meta.set_field(
-            "transformation", transformer_signature
-        )
+        if property_value._meta is not meta:
+            meta = property_value._meta
+            transformed_meta = meta.set_field("transformation", transformer.signature)
+
+        property_value._meta = transformed_meta
 
     return property_values
 
@@ -258,9 +491,10 @@ def _resolve_template(
 ) -> List[StrProxy]:
     """
     `template` is a jinja template str that will be rendered using the context
-    which contains current half-finished entity and original
+    which contains current half-finished entity and original.
+    Templates are compiled once and cached, simple ones are rendered without jinja
     """
-    template = jinja_env.from_string(command_config)
+    template = compile_template(command_config)
     return [
         StrProxy(
             template.render(
@@ -286,6 +520,12 @@ def _resolve_property(
     if command_config.startswith("$") and context.variables is not None:
         return context.property_values + context.variables.get(command_config, [])
     elif context.entity is not None:
+        if meta_factory.settings.meta_free:
+            # Plain entity proxy keeps plain strings
+            return context.property_values + [
+                StrProxy(value) for value in context.entity.get(command_config)
+            ]
+
         return context.property_values + context.entity.get(command_config)
 
 
@@ -296,52 +536,157 @@ def _resolve_meta(
     `meta` collects the meta information and sets it for the current property values
     """
 
+    if meta_factory.settings.meta_free:
+        return context.property_values
+
     # TODO: DRY with "meta" in collection_config
     local_statements_meta: Dict[str, str] = {
         meta_name: "\n".join(
-            resolve_meta_values(
-                ensure_list(meta_config),
+            resolve_pipelines(
+                pipelines,
                 record=context.record,
                 statements_meta=context.statements_meta,
                 entity=context.entity,
+                variables=None,
+                shared=context.shared,
             )
         )
-        for meta_name, meta_config in command_config.items()
+        for meta_name, pipelines in compile_meta(command_config).fields
     }
 
+    meta: Any = None
+    replaced_meta: Any = None
     for property_value in context.property_values:
-        property_value._meta = property_value._meta._replace(**local_statements_meta)
+        if property_value._meta is not meta:
+            meta = property_value._meta
+            replaced_meta = meta._replace(**local_statements_meta)
+
+        property_value._meta = replaced_meta
 
     return context.property_values
 
 
-def _resolve_configs(
-    property_configs: List, commands_mapping: Dict[str, Callable], **kwargs
-) -> List[StrProxy]:
-    """
-    A general function that applies all the command from the config to the kwargs
-    """
-
-    property_values: List[StrProxy] = []
-    ctx = ResolveContext(property_values=property_values, **kwargs)
+# Commands allowed on the different levels of the mapping
+PROPERTY_COMMANDS: Dict[str, Callable] = {
+    "literal": _resolve_literal,
+    "entity": _resolve_entity,
+    "column": _resolve_column,
+    "regex_split": _resolve_regex_split,
+    "regex": _resolve_regex,
+    "regex_first": _resolve_regex_first,
+    "regex_replace": _resolve_regex_replace,
+    "transformer": _resolve_transformer,
+    "augmentor": _resolve_augmentor,
+    "template": _resolve_template,
+    "property": _resolve_property,
+    "meta": _resolve_meta,
+}
+
+PROPERTY_META_COMMANDS: Dict[str, Callable] = {
+    "literal": _resolve_literal,
+    "column": _resolve_column,
+    "regex_split": _resolve_regex_split,
+    "regex": _resolve_regex,
+    "regex_first": _resolve_regex_first,
+    "regex_replace": _resolve_regex_replace,
+    "transformer": _resolve_transformer,
+    "augmentor": _resolve_augmentor,
+    "property": _resolve_property,
+    "template": _resolve_template,
+}
+
+COLLECTION_META_COMMANDS: Dict[str, Callable] = {
+    "literal": _resolve_literal,
+    "column": _resolve_column,
+    "regex_split": _resolve_regex_split,
+    "regex": _resolve_regex,
+    "regex_first": _resolve_regex_first,
+    "transformer": _resolve_transformer,
+    "augmentor": _resolve_augmentor,
+    "template": _resolve_template,
+}
+
+CONSTANT_META_COMMANDS: Dict[str, Callable] = {
+    "literal": _resolve_literal,
+}
+
+# Compilers turn raw command config into the form, that resolver can use without
+# parsing it again. Commands that are missing here are used as is
+COMMAND_COMPILERS: Dict[str, Callable] = {
+    "entity": compile_entity,
+    "column": compile_jmespath,
+    "regex_split": compile_regex,
+    "regex": compile_regex,
+    "regex_first": compile_regex,
+    "regex_replace": compile_regex_replace,
+    "transformer": compile_transformer,
+    "augmentor": compile_transformer,
+    "template": compile_template,
+    "meta": compile_meta,
+}
+
+
+def compile_property_configs(
+    property_configs: List, commands_mapping: Dict[str, Callable]
+) -> List[Pipeline]:
+    """
+    Turns the list of property configs into the list of pipelines, dropping the commands
+    that aren't supported by the commands_mapping
+    """
+
+    pipelines: List[Pipeline] = []
 
     for property_config in property_configs:
-        curr_property_values: List[StrProxy] = []
+        pipeline: Pipeline = []
         for command, command_config in property_config.items():
             if command in commands_mapping:
-                ctx.property_values = curr_property_values
-                curr_property_values = commands_mapping[command](
-                    command_config=command_config, context=ctx
+                compiler: Optional[Callable] = COMMAND_COMPILERS.get(command)
+                pipeline.append(
+                    (
+                        commands_mapping[command],
+                        compiler(command_config) if compiler else command_config,
+                    )
                 )
             else:
                 pass
                 # TODO: signal to show our disrespect?
 
+        pipelines.append(pipeline)
+
+    return pipelines
+
+
+def resolve_pipelines(pipelines: List[Pipeline], **kwargs) -> List[StrProxy]:
+    """
+    Applies compiled pipelines to the kwargs
+    """
+
+    property_values: List[StrProxy] = []
+    ctx = ResolveContext(property_values=property_values, **kwargs)
+
+    for pipeline in pipelines:
+        curr_property_values: List[StrProxy] = []
+        for resolver, command_config in pipeline:
+            ctx.property_values = curr_property_values
+            curr_property_values = resolver(command_config=command_config, context=ctx)
+
         property_values += curr_property_values
 
     return property_values
 
 
+def _resolve_configs(
+    property_configs: List, commands_mapping: Dict[str, Callable], **kwargs
+) -> List[StrProxy]:
+    """
+    A general function that applies all the command from the config to the kwargs
+    """
+
+    return resolve_pipelines(
+        compile_property_configs(property_configs, commands_mapping), **kwargs
+    )
+
+
 def resolve_property_values(
     property_configs: List,
     record: Union[List, Dict],
@@ -354,20 +699,7 @@ def resolve_property_values(
     """
     return _resolve_configs(
         property_configs=property_configs,
-        commands_mapping={
-            "literal": _resolve_literal,
-            "entity": _resolve_entity,
-            "column": _resolve_column,
-            "regex_split": _resolve_regex_split,
-            "regex": _resolve_regex,
-            "regex_first": _resolve_regex_first,
-            "regex_replace": _resolve_regex_replace,
-            "transformer": _resolve_transformer,
-            "augmentor": _resolve_augmentor,
-            "template": _resolve_template,
-            "property": _resolve_property,
-            "meta": _resolve_meta,
-        },
+        commands_mapping=PROPERTY_COMMANDS,
         record=record,
         entity=entity,
         statements_meta=statements_meta,
@@ -386,18 +718,7 @@ def resolve_meta_values(
     """
     return _resolve_configs(
         property_configs=property_configs,
-        commands_mapping={
-            "literal": _resolve_literal,
-            "column": _resolve_column,
-            "regex_split": _resolve_regex_split,
-            "regex": _resolve_regex,
-            "regex_first": _resolve_regex_first,
-            "regex_replace": _resolve_regex_replace,
-            "transformer": _resolve_transformer,
-            "augmentor": _resolve_augmentor,
-            "property": _resolve_property,
-            "template": _resolve_template,
-        },
+        commands_mapping=PROPERTY_META_COMMANDS,
         record=record,
         statements_meta=statements_meta,
         entity=entity,
@@ -414,16 +735,7 @@ def resolve_collection_meta_values(
     """
     return _resolve_configs(
         property_configs=property_configs,
-        commands_mapping={
-            "literal": _resolve_literal,
-            "column": _resolve_column,
-            "regex_split": _resolve_regex_split,
-            "regex": _resolve_regex,
-            "regex_first": _resolve_regex_first,
-            "transformer": _resolve_transformer,
-            "augmentor": _resolve_augmentor,
-            "template": _resolve_template,
-        },
+        commands_mapping=COLLECTION_META_COMMANDS,
         record=record,
         statements_meta=statements_meta,
         entity=None,
@@ -437,9 +749,7 @@ def resolve_constant_meta_values(property_configs: List) -> List[StrProxy]:
     """
     return _resolve_configs(
         property_configs=property_configs,
-        commands_mapping={
-            "literal": _resolve_literal,
-        },
+        commands_mapping=CONSTANT_META_COMMANDS,
         record=None,
         entity=None,
         statements_meta=None,
@@ -1,9 +1,15 @@
-from typing import Dict, Generator, Iterable
+from typing import Dict, Generator, Iterable, List, Optional
 
 from followthemoney.schema import Schema  # type: ignore
 
-from thebeast.types import Record
+from thebeast.types import Record, RedGreenEntity
 from .abstract import AbstractDigestor, main_cog
+from .record_cache import (
+    RecordCache,
+    mapping_fingerprint,
+    reads_statements_meta,
+    DEFAULT_RECORD_CACHE_SIZE,
+)
 
 
 class SingleProcessDigestor(AbstractDigestor):
@@ -11,19 +17,97 @@ class SingleProcessDigestor(AbstractDigestor):
     TODO: review an architecture once it works
     """
 
+    def __init__(
+        self,
+        mapping_config: Dict,
+        meta_fields: List[str],
+        optimize: bool = True,
+        regex_concurrent: Optional[bool] = None,
+        meta_free: bool = False,
+        clean_cache_size: Optional[int] = None,
+        validation: str = "full",
+        skip_invalid: bool = False,
+        record_cache: Optional[str] = None,
+        record_cache_size: int = DEFAULT_RECORD_CACHE_SIZE,
+    ) -> None:
+        """
+        record_cache: path to the SQLite file to keep the entities of each record in,
+        so the records seen by the previous runs of the same mapping are not
+        digested again
+        record_cache_size: size of the record cache in bytes, the least recently used
+        records are evicted once it's exceeded
+        """
+        super().__init__(
+            mapping_config=mapping_config,
+            meta_fields=meta_fields,
+            optimize=optimize,
+            regex_concurrent=regex_concurrent,
+            meta_free=meta_free,
+            clean_cache_size=clean_cache_size,
+            validation=validation,
+            skip_invalid=skip_invalid,
+        )
+
+        self.record_cache: Optional[RecordCache] = None
+        if record_cache is not None:
+            self.record_cache = RecordCache(
+                record_cache,
+                mapping_key=mapping_fingerprint(
+                    mapping_config,
+                    meta_fields=meta_fields,
+                    meta_free=meta_free,
+                    validation=validation,
+                    skip_invalid=skip_invalid,
+                ),
+                maxsize=record_cache_size,
+                stamped_key=reads_statements_meta(mapping_config),
+            )
+
     def run_the_cog(
         self,
         records: Iterable[Record],
         parent_context_entities_map: Dict[str, str],
         statements_meta: Dict[str, str],
     ) -> Generator[Schema, None, None]:
-        for record in records:
-            for entity in main_cog(
-                data=record,
-                config=self.mapping_config,
-                parent_context_entities_map=parent_context_entities_map,
-                statements_meta=statements_meta,
-                parent_record=None,
-            ):
-                # TODO: green/red sorting for valid records/exceptions here?
-                yield entity
+        try:
+            for record in records:
+                if self.record_cache is None:
+                    yield from self.digest_record(
+                        record, parent_context_entities_map, statements_meta
+                    )
+                else:
+                    key: bytes = self.record_cache.key(record)
+                    entities: Optional[List[RedGreenEntity]] = self.record_cache.get(
+                        record, key
+                    )
+                    if entities is None:
+                        entities = list(
+                            self.digest_record(
+                                record, parent_context_entities_map, statements_meta
+                            )
+                        )
+                        self.record_cache.put(record, entities, key)
+
+                    yield from entities
+
+                self.progress = (record.input_uri, record.record_no)
+        finally:
+            if self.record_cache is not None:
+                self.record_cache.close()
+
+    def digest_record(
+        self,
+        record: Record,
+        parent_context_entities_map: Dict[str, str],
+        statements_meta: Dict[str, str],
+    ) -> Generator[Schema, None, None]:
+        for entity in main_cog(
+            data=record,
+            plan=self.plan,
+            parent_context_entities_map=parent_context_entities_map,
+            statements_meta=statements_meta,
+            parent_record=None,
+            deflate=self.deflate,
+        ):
+            # TODO: green/red sorting for valid records/exceptions here?
+            yield entity
@@ -0,0 +1,175 @@
+from typing import Optional, List, Dict, Union, Any, Tuple
+from threading import RLock
+
+from jinja2 import Environment, BaseLoader, Template, select_autoescape, nodes
+from markupsafe import escape
+
+# TODO: expose jmespath to templates as a filter?
+jinja_env = Environment(loader=BaseLoader(), autoescape=select_autoescape())
+TEMPLATE_CACHE: Dict[str, "CompiledTemplate"] = {}
+# Rendering is thread-safe, but compilation of the templates by the shared jinja_env
+# and the cache of the compiled templates are guarded, when digested by several threads
+JINJA_LOCK: RLock = RLock()
+
+# A part of the simple template is either a literal string or a lookup, which is
+# a name of the context variable followed by the list of attributes/keys to get from it
+Lookup = Tuple[str, List[Union[str, int]]]
+
+
+class FallbackToJinja(Exception):
+    """
+    Raised by the fast path when the value cannot be rendered exactly as jinja would do it
+    """
+
+    pass
+
+
+def _parse_lookup(node: nodes.Node) -> Optional[Lookup]:
+    """
+    Turns `record.foo['bar'][0]` node into ("record", ["foo", "bar", 0]).
+    Returns None for everything that is not a plain lookup (filters, calls, math, etc)
+    """
+
+    path: List[Union[str, int]] = []
+
+    while not isinstance(node, nodes.Name):
+        if isinstance(node, nodes.Getattr):
+            path.append(node.attr)
+        elif (
+            isinstance(node, nodes.Getitem)
+            and isinstance(node.arg, nodes.Const)
+            and isinstance(node.arg.value, (str, int))
+        ):
+            path.append(node.arg.value)
+        else:
+            return None
+
+        node = node.node
+
+    if node.name in jinja_env.globals:
+        return None
+
+    return node.name, path[::-1]
+
+
+def parse_simple_template(source: str) -> Optional[List[Union[str, Lookup]]]:
+    """
+    Checks if the template consists only of the literals and `{{ record.x }}`-style substitutions
+    and returns its parts. For templates with filters, control flow, etc returns None
+    """
+
+    parts: List[Union[str, Lookup]] = []
+
+    for node in jinja_env.parse(source).body:
+        if not isinstance(node, nodes.Output):
+            return None
+
+        for child in node.nodes:
+            if isinstance(child, nodes.TemplateData):
+                parts.append(child.data)
+            elif isinstance(child, nodes.Const):
+                # Consts are escaped by jinja when autoescape is on
+                parts.append(str(escape(child.value)))
+            else:
+                lookup: Optional[Lookup] = _parse_lookup(child)
+                if lookup is None:
+                    return None
+
+                parts.append(lookup)
+
+    return parts
+
+
+def _lookup(context: Dict[str, Any], lookup: Lookup) -> str:
+    """
+    Resolves the lookup against the context, mimicking jinja getattr/getitem
+    for dicts and lists. Anything ambiguous is delegated to jinja
+    """
+    name, path = lookup
+    if name not in context:
+        if path:
+            raise FallbackToJinja()
+        return ""
+
+    value: Any = context[name]
+    last: int = len(path) - 1
+
+    for i, key in enumerate(path):
+        if isinstance(value, dict):
+            # jinja prefers attributes over keys for the `.` syntax, i.e
+            # `record.items` is a method, not a key
+            if isinstance(key, str) and hasattr(value, key):
+                raise FallbackToJinja()
+
+            if key not in value:
+                if i == last:
+                    # Undefined is rendered as an empty string
+                    return ""
+                raise FallbackToJinja()
+
+            value = value[key]
+        elif isinstance(value, list) and isinstance(key, int):
+            if not -len(value) <= key < len(value):
+                if i == last:
+                    return ""
+                raise FallbackToJinja()
+
+            value = value[key]
+        else:
+            raise FallbackToJinja()
+
+    return str(escape(value))
+
+
+class CompiledTemplate:
+    """
+    Jinja template, parsed once. Simple templates (literals and lookups only) are rendered
+    with plain string operations, everything else is rendered by jinja
+    """
+
+    def __init__(self, source: str) -> None:
+        self.source: str = source
+        self.parts: Optional[List[Union[str, Lookup]]] = parse_simple_template(source)
+        self._jinja_template: Optional[Template] = None
+
+    @property
+    def jinja_template(self) -> Template:
+        if self._jinja_template is None:
+            with JINJA_LOCK:
+                if self._jinja_template is None:
+                    self._jinja_template = jinja_env.from_string(self.source)
+
+        return self._jinja_template
+
+    @property
+    def is_simple(self) -> bool:
+        return self.parts is not None
+
+    def render(self, **context) -> str:
+        if self.parts is not None:
+            try:
+                return "".join(
+                    part if isinstance(part, str) else _lookup(context, part)
+                    for part in self.parts
+                )
+            except FallbackToJinja:
+                pass
+
+        return self.jinja_template.render(**context)
+
+
+def compile_template(source: Union[str, CompiledTemplate]) -> CompiledTemplate:
+    """
+    Caching compiled templates. Already compiled templates are returned as is
+    """
+    if isinstance(source, CompiledTemplate):
+        return source
+
+    if source in TEMPLATE_CACHE:
+        return TEMPLATE_CACHE[source]
+
+    with JINJA_LOCK:
+        if source not in TEMPLATE_CACHE:
+            TEMPLATE_CACHE[source] = CompiledTemplate(source)
+
+    return TEMPLATE_CACHE[source]
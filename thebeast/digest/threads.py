@@ -0,0 +1,123 @@
+from typing import List, Dict, Generator, Iterable, Optional, Deque, Tuple
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from os import cpu_count
+
+from followthemoney.schema import Schema  # type: ignore
+
+from thebeast.types import Record
+from .abstract import AbstractDigestor, main_cog
+from .utils import chunks
+
+
+class ThreadPoolDigestor(AbstractDigestor):
+    """
+    Digestor that runs the records on a pool of threads of the same process. Nothing is
+    pickled and the FTM model, templates and caches are shared by all the threads.
+    Scales with the cores on the free-threaded python builds, while on the regular ones
+    it still helps the mappings that spend their time in the code that releases the GIL
+    (i.e regexes, that are run concurrently by default here)
+    """
+
+    def __init__(
+        self,
+        mapping_config: Dict,
+        meta_fields: List[str],
+        batch_size: int = 1,
+        threads: int = -1,
+        max_in_flight: int = -1,
+        optimize: bool = True,
+        regex_concurrent: Optional[bool] = True,
+        meta_free: bool = False,
+        clean_cache_size: Optional[int] = None,
+        validation: str = "full",
+        skip_invalid: bool = False,
+    ) -> None:
+        """
+        threads: the number of threads to launch in the pool, defaults to the number
+        of cores
+        batch_size: the number of the records to give to the thread at once
+        max_in_flight: the number of the batches submitted to the pool and not yet
+        yielded. Once reached, the input is not read further. Defaults to 4 batches
+        per thread, 0 means unbounded
+        """
+        super().__init__(
+            mapping_config=mapping_config,
+            meta_fields=meta_fields,
+            optimize=optimize,
+            regex_concurrent=regex_concurrent,
+            meta_free=meta_free,
+            clean_cache_size=clean_cache_size,
+            validation=validation,
+            skip_invalid=skip_invalid,
+        )
+
+        self.threads: int = threads
+        if self.threads == -1:
+            self.threads = cpu_count() or 1
+
+        self.batch_size: int = batch_size
+        self.max_in_flight: int = max_in_flight
+        if self.max_in_flight == -1:
+            self.max_in_flight = self.threads * 4
+
+    def digest_batch(
+        self,
+        batch: Tuple[Record, ...],
+        parent_context_entities_map: Dict[str, str],
+        statements_meta: Dict[str, str],
+    ) -> List[Schema]:
+        # Settings are per thread, so those are switched in the pool threads too
+        with self.own_settings():
+            return [
+                entity
+                for record in batch
+                for entity in main_cog(
+                    data=record,
+                    plan=self.plan,
+                    parent_context_entities_map=parent_context_entities_map,
+                    statements_meta=statements_meta,
+                    parent_record=None,
+                    deflate=self.deflate,
+                )
+            ]
+
+    def run_the_cog(
+        self,
+        records: Iterable[Record],
+        parent_context_entities_map: Dict[str, str],
+        statements_meta: Dict[str, str],
+    ) -> Generator[Schema, None, None]:
+        # Futures are yielded in the order of submission, so the output is the same as
+        # the one of the single process digestor. Each one goes with the position of
+        # the last record of its batch
+        in_flight: Deque[Tuple[Future, Tuple[str, int]]] = deque()
+
+        def complete() -> Generator[Schema, None, None]:
+            future, position = in_flight.popleft()
+            yield from future.result()
+            self.progress = position
+
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            try:
+                for batch in chunks(records, self.batch_size):
+                    if self.max_in_flight and len(in_flight) >= self.max_in_flight:
+                        yield from complete()
+
+                    in_flight.append(
+                        (
+                            executor.submit(
+                                self.digest_batch,
+                                batch,
+                                parent_context_entities_map,
+                                statements_meta,
+                            ),
+                            (batch[-1].input_uri, batch[-1].record_no),
+                        )
+                    )
+
+                while in_flight:
+                    yield from complete()
+            finally:
+                for future, _ in in_flight:
+                    future.cancel()
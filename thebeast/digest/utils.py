@@ -1,7 +1,19 @@
-from typing import Any, List, Dict, Union, Iterable, Callable, Generator, Optional
+from typing import (
+    Any,
+    List,
+    Dict,
+    Union,
+    Iterable,
+    Callable,
+    Generator,
+    Optional,
+    Tuple,
+)
+from array import array
+from threading import Lock
 from itertools import islice, chain
 import jmespath  # type: ignore
-
+from jmespath.parser import ParsedResult  # type: ignore
 
 # We are utilizing here the fact that Model is a singletone and set up
 # in the thebeast.conf.mapping
@@ -11,13 +23,21 @@ from followthemoney.util import make_entity_id  # type: ignore
 from followthemoney.schema import Schema  # type: ignore
 from followthemoney.exc import InvalidData
 
-from thebeast.contrib.ftm_ext.rigged_entity_proxy import RiggedEntityProxy
+from thebeast.contrib.ftm_ext import meta_factory
+from thebeast.contrib.ftm_ext.rigged_entity_proxy import (
+    RiggedEntityProxy,
+    PlainEntityProxy,
+    make_str_proxy,
+)
 from thebeast.conf.utils import import_string
 from thebeast.types import RedGreenEntity
 
-
 ENTITY_TYPE = registry.get("entity")
 CALLABLE_CACHE: Dict[str, Callable] = {}
+CALLABLE_CACHE_LOCK: Lock = Lock()
+JMESPATH_CACHE: Dict[str, ParsedResult] = {}
+REQUIRED_PROPERTIES: Dict[str, Tuple[str, ...]] = {}
+VALIDATION_MODES: Tuple[str, ...] = ("full", "required", "off")
 
 
 def ensure_list(values: Any) -> List[Any]:
@@ -38,11 +58,29 @@ def generate_pseudo_id(temporary_entity_id: str):
     )
 
 
-def jmespath_results_as_array(path: str, record: Union[List, Dict]) -> List[Any]:
+def compile_jmespath(path: Union[str, ParsedResult]) -> ParsedResult:
+    """
+    Caching compiled jmespath expressions. Already compiled expressions are returned as is
+    """
+    if isinstance(path, ParsedResult):
+        return path
+
+    if path in JMESPATH_CACHE:
+        return JMESPATH_CACHE[path]
+
+    expression = jmespath.compile(path)
+    JMESPATH_CACHE[path] = expression
+
+    return expression
+
+
+def jmespath_results_as_array(
+    path: Union[str, ParsedResult], record: Union[List, Dict]
+) -> List[Any]:
     """
     Extracts the values from the record according to the path, wraps everything into array
     """
-    return ensure_list(jmespath.search(path, record) or [])
+    return ensure_list(compile_jmespath(path).search(record) or [])
 
 
 def resolve_entity_refs(
@@ -55,9 +93,13 @@ def resolve_entity_refs(
 
                 # TODO: errors (probably red/green sorting) for the properties that cannot be resolved
                 for prop_val in entity.get(prop):
-                    resolved_properties.append(
-                        prop_val.inject_meta_to_str(context_entities.get(prop_val))
-                    )
+                    if meta_factory.settings.meta_free:
+                        # Plain entity proxy keeps plain strings
+                        resolved_properties.append(context_entities.get(prop_val))
+                    else:
+                        resolved_properties.append(
+                            prop_val.inject_meta_to_str(context_entities.get(prop_val))
+                        )
 
                 entity.set(prop, resolved_properties)
 
@@ -69,6 +111,9 @@ def make_entity(
 ) -> RiggedEntityProxy:
     """Instantiate an empty entity proxy of the given schema type."""
 
+    if meta_factory.settings.meta_free:
+        return PlainEntityProxy(ftm, {"schema": schema}, key_prefix=key_prefix)
+
     return RiggedEntityProxy(ftm, {"schema": schema}, key_prefix=key_prefix)
 
 
@@ -79,10 +124,12 @@ def resolve_callable(fqfn: str) -> Callable:
     if fqfn in CALLABLE_CACHE:
         return CALLABLE_CACHE[fqfn]
 
-    func = import_string(fqfn)
-    CALLABLE_CACHE[fqfn] = func
+    # Importing might have side effects, so it's done once even with many threads
+    with CALLABLE_CACHE_LOCK:
+        if fqfn not in CALLABLE_CACHE:
+            CALLABLE_CACHE[fqfn] = import_string(fqfn)
 
-    return func
+    return CALLABLE_CACHE[fqfn]
 
 
 def chunks(iterable: Iterable, size: int) -> Iterable:
@@ -100,16 +147,129 @@ def inflate_entity(entity_dict: Dict) -> RiggedEntityProxy:
     return RiggedEntityProxy.from_dict(ftm, entity_dict)
 
 
-def deflate_entity(entity: RiggedEntityProxy) -> RedGreenEntity:
+def required_properties(schema: Schema) -> Tuple[str, ...]:
+    """
+    Caching the names of the required properties of the schema
+    """
+    if schema.name in REQUIRED_PROPERTIES:
+        return REQUIRED_PROPERTIES[schema.name]
+
+    required: Tuple[str, ...] = tuple(sorted(schema.required))
+    REQUIRED_PROPERTIES[schema.name] = required
+
+    return required
+
+
+def deflate_entity(
+    entity: RiggedEntityProxy, validation: str = "full", skip_invalid: bool = False
+) -> Optional[RedGreenEntity]:
+    """
+    Serializes the entity and sorts it into valid/invalid (red/green).
+    validation: `full` validates the serialized entity against the FTM schema,
+    `required` only checks that the required properties are set on the entity
+    (the values are already cleaned on add) and `off` skips the validation.
+    Entities without id are invalid regardless of the mode.
+    skip_invalid: return None instead of the invalid entities, i.e when the dumper
+    throws them away. Entities without id or required properties are not even
+    serialized then, only the rest goes through the full validation
+    """
+    valid: bool = entity.id is not None
+
+    if valid and validation != "off":
+        # Cheap check first, so most of the invalid entities are never serialized
+        for prop_name in required_properties(entity.schema):
+            if not entity.has(prop_name, quiet=True):
+                valid = False
+                break
+
+    if not valid and skip_invalid:
+        return None
+
     asdict: Dict = entity.to_dict()
-    valid: bool = True
 
-    if entity.id is None:
-        valid = False
-    else:
+    if valid and validation == "full":
         try:
             entity.schema.validate(asdict)
         except InvalidData:
             valid = False
 
+            if skip_invalid:
+                return None
+
     return RedGreenEntity(payload=asdict, valid=valid)
+
+
+def pack_entities(entities: Iterable[RedGreenEntity]) -> Tuple:
+    """
+    Compact form of the batch of entities to send them to another process. Meta is
+    dictionary-encoded per batch and values of all the entities are sent as one flat
+    list of plain strings with an array of the indices of their meta (-1 for the values
+    without meta). Fewer and smaller objects are much cheaper to pickle and unpickle
+    """
+    metas: Dict[Any, int] = {}
+    texts: List[str] = []
+    indices: array = array("i")
+    packed: List[Tuple] = []
+
+    last_meta: Any = None
+    last_index: int = -1
+    for entity in entities:
+        payload: Dict[str, Any] = entity.payload
+        properties: List[Tuple[str, int]] = []
+
+        for prop, values in payload["properties"].items():
+            properties.append((prop, len(values)))
+            texts.extend(map(str, values))
+
+            for value in values:
+                meta: Any = getattr(value, "_meta", None)
+                if meta is None:
+                    indices.append(-1)
+                    continue
+
+                # Values of the same record usually share the meta object
+                if meta is not last_meta:
+                    last_meta = meta
+                    last_index = metas.setdefault(meta, len(metas))
+
+                indices.append(last_index)
+
+        # Keeping the position of the properties in the payload
+        rest: Dict[str, Any] = {
+            key: None if key == "properties" else value
+            for key, value in payload.items()
+        }
+        packed.append((rest, entity.valid, properties))
+
+    return [tuple(meta) for meta in metas], texts, indices.tobytes(), packed
+
+
+def unpack_entities(batch: Tuple) -> List[RedGreenEntity]:
+    """
+    Restores the entities packed with the pack_entities
+    """
+    meta_table, texts, indices_bytes, packed = batch
+    meta_cls: type = meta_factory.get_meta_cls()
+    metas: List[Any] = [meta_cls._make(meta) for meta in meta_table]
+
+    indices: array = array("i")
+    indices.frombytes(indices_bytes)
+
+    values: List[Any] = [
+        make_str_proxy(text, metas[index]) if index >= 0 else text
+        for text, index in zip(texts, indices)
+    ]
+
+    entities: List[RedGreenEntity] = []
+    position: int = 0
+    for rest, valid, properties in packed:
+        payload: Dict[str, Any] = dict(rest)
+        payload["properties"] = {}
+
+        for prop, count in properties:
+            payload["properties"][prop] = values[position : position + count]
+            position += count
+
+        entities.append(RedGreenEntity(payload=payload, valid=valid))
+
+    return entities
@@ -1,8 +1,30 @@
+import os
 import sys
+import shutil
 import smart_open  # type: ignore
 from thebeast.types import RedGreenEntity
 
-from typing import Iterable, List, TextIO
+from typing import Iterable, List, TextIO, Dict, Any, Tuple
+
+# Outputs that are shared as is by all the shards
+UNSHARDED_URIS: List[str] = ["/dev/null"]
+
+
+def shard_uri(uri: str, shard: int) -> str:
+    """
+    Adds the shard number to the file name, keeping the extensions intact, so
+    smart_open still compresses the shards: out.jsonl.gz -> out-shard00001.jsonl.gz
+    """
+    if uri in UNSHARDED_URIS:
+        return uri
+
+    if uri in ["/dev/stdout", "/dev/stderr"]:
+        raise ValueError(f"Cannot split {uri} into shards, write into a file instead")
+
+    head, sep, name = uri.rpartition("/")
+    stem, dot, extensions = name.partition(".")
+
+    return f"{head}{sep}{stem}-shard{shard:05d}{dot}{extensions}"
 
 
 class AbstractWriter:
@@ -10,26 +32,111 @@ class AbstractWriter:
     Abstract class to write entities in a given format
     """
 
+    # Whether the writer reads the statements meta of the values. Digestor skips
+    # collecting it when it doesn't
+    uses_meta: bool = True
+
+    # Number of the lines every output starts with (i.e csv header), those are
+    # skipped when the shards are merged
+    header_lines: int = 0
+
+    # Whether the writer holds the entities until it's closed (i.e to sort or merge
+    # them), so the outputs don't reflect the entities written so far. Such outputs
+    # can't be checkpointed or assembled from the parts
+    writes_on_close: bool = False
+
     def __init__(
-        self, output_uri: str, meta_fields: List[str], error_uri: str = "/dev/null"
+        self,
+        output_uri: str,
+        meta_fields: List[str],
+        error_uri: str = "/dev/null",
+        append: bool = False,
     ) -> None:
         """
         Error_uri (defaulted to /dev/null). By changing it you might route invalid entites
         to /dev/null, same file as valid ones or separate file for the debugging
+        append: continue writing into the existing outputs (i.e when the run is
+        resumed from the checkpoint) instead of overwriting them
         """
 
         self.meta_fields: List[str] = meta_fields
         self.output_uri: str = output_uri
+        self.append: bool = append
 
         self.output_uri = self._resolve_uri(output_uri)
         self.error_uri = self._resolve_uri(error_uri)
+        self.open_outputs()
 
+    def open_outputs(self) -> None:
         self.output_fh = self._get_filehandler(self.output_uri)
         if self.output_uri == self.error_uri:
             self.error_fh = self.output_fh
         else:
             self.error_fh = self._get_filehandler(self.error_uri)
 
+    def params(self) -> Dict[str, Any]:
+        """
+        Params to create the same writer again, i.e in the worker process
+        """
+        return {
+            "output_uri": self.output_uri,
+            "meta_fields": self.meta_fields,
+            "error_uri": self.error_uri,
+        }
+
+    @classmethod
+    def make_shard(cls, params: Dict[str, Any], shard: int) -> "AbstractWriter":
+        """
+        Creates the writer that writes into the shard of the output described by params
+        """
+        params = dict(params)
+        params["output_uri"] = shard_uri(params["output_uri"], shard)
+        params["error_uri"] = shard_uri(params["error_uri"], shard)
+
+        return cls(**params)
+
+    def merge_shard(self, shard: int) -> None:
+        """
+        Appends the content of the shard to the output and removes the shard
+        """
+        outputs: List[Tuple[str, TextIO]] = [(self.output_uri, self.output_fh)]
+        if self.error_uri != self.output_uri:
+            outputs.append((self.error_uri, self.error_fh))
+
+        for uri, fh in outputs:
+            shard_file: str = shard_uri(uri, shard)
+            if shard_file == uri:
+                continue
+
+            self.append_file(fh, shard_file)
+            if os.path.exists(shard_file):
+                os.remove(shard_file)
+
+    def append_file(self, fh: TextIO, file_uri: str) -> None:
+        """
+        Appends the content of the file, written by the writer of the same class, to
+        the output handle, skipping its header lines
+        """
+        with smart_open.open(file_uri, "r") as fp_in:
+            for _ in range(self.header_lines):
+                fp_in.readline()
+
+            shutil.copyfileobj(fp_in, fh)
+
+        fh.flush()
+
+    def flush(self) -> None:
+        self.output_fh.flush()
+        if self.error_uri != self.output_uri:
+            self.error_fh.flush()
+
+    @property
+    def discards_invalid(self) -> bool:
+        """
+        Invalid entities are thrown away, so the digestor might skip them early
+        """
+        return self.error_uri == "/dev/null"
+
     def _resolve_uri(self, uri: str) -> str:
         if uri in ["-", "/dev/stdout"]:
             return "/dev/stdout"
@@ -44,7 +151,7 @@ class AbstractWriter:
         elif uri == "/dev/stderr":
             return sys.stderr
         else:
-            return smart_open.open(uri, "w")
+            return smart_open.open(uri, "a" if self.append else "w")
 
     def write_entities(
         self, entities: Iterable[RedGreenEntity], flush: bool = True
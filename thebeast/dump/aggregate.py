@@ -0,0 +1,259 @@
+import os
+import json
+import heapq
+import pickle
+import tempfile
+from itertools import groupby
+from operator import itemgetter
+from typing import Any, BinaryIO, Dict, Generator, Iterable, List, Optional, Tuple
+
+import smart_open  # type: ignore
+
+from thebeast.conf.utils import import_string
+from thebeast.contrib.ftm_ext.meta_factory import get_meta_cls
+from thebeast.contrib.ftm_ext.rigged_entity_proxy import make_str_proxy
+from thebeast.digest.merge import merge_all
+from thebeast.digest.utils import pack_entities, unpack_entities
+from thebeast.types import RedGreenEntity
+
+from .abstract import AbstractWriter
+
+DEFAULT_RUN_SIZE: int = 100000
+
+# Sorted runs of the same level merged at once into the run of the next level, so
+# each fragment is rewritten only a logarithmic number of times and the number of the
+# open files stays bounded
+DEFAULT_MAX_RUNS: int = 64
+
+
+def read_ftm_lines(uri: str) -> Generator[RedGreenEntity, None, None]:
+    """
+    Reads the entities back from the FTM jsonlines file (i.e the output of one of
+    the shards). Values get the empty statements meta, so they can be written as
+    statements too. Entities are not trusted to be valid, those are validated once
+    merged (see revalidate)
+    """
+    empty_meta: Any = get_meta_cls()._empty
+    with smart_open.open(uri, "r") as fp:
+        for line in fp:
+            if not line.strip():
+                continue
+
+            payload: Dict[str, Any] = json.loads(line)
+            payload["properties"] = {
+                prop: [make_str_proxy(value, empty_meta) for value in values]
+                for prop, values in payload.get("properties", {}).items()
+            }
+            yield RedGreenEntity(payload=payload, valid=False)
+
+
+def collapse(
+    fragments: Iterable[Tuple[str, RedGreenEntity]], keep_meta: bool = True
+) -> Generator[Tuple[str, RedGreenEntity], None, None]:
+    """
+    Merges the consecutive fragments with the same id
+    """
+    for entity_id, group in groupby(fragments, key=itemgetter(0)):
+        yield entity_id, merge_all((entity for _, entity in group), keep_meta)
+
+
+def read_run(path: str) -> Generator[Tuple[str, RedGreenEntity], None, None]:
+    with open(path, "rb") as fp:
+        while True:
+            try:
+                entity_id, packed = pickle.load(fp)
+            except EOFError:
+                return
+
+            yield entity_id, unpack_entities(packed)[0]
+
+
+def write_run(fp: BinaryIO, fragments: Iterable[Tuple[str, RedGreenEntity]]) -> None:
+    for entity_id, entity in fragments:
+        pickle.dump(
+            (entity_id, pack_entities([entity])),
+            fp,
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+
+
+class AggregatingWriter(AbstractWriter):
+    """
+    Writer, that merges all the fragments of each entity into one and writes the
+    entities sorted by id with the wrapped writer (FTMLinesWriter, StatementsCSVWriter,
+    etc), once it's closed. Fragments are collected in the runs of run_size entities,
+    those are sorted and spilled to disk, and then k-way merged, so the memory stays
+    bounded regardless of the size of the dataset. Invalid fragments are kept, as
+    those might be completed by the other ones, so the wrapped writer only discards
+    the entities, that are still invalid once merged
+    """
+
+    writes_on_close: bool = True
+
+    def __init__(
+        self,
+        output_uri: str,
+        meta_fields: List[str],
+        error_uri: str = "/dev/null",
+        writer: str = "thebeast.dump.FTMLinesWriter",
+        writer_params: Optional[Dict[str, Any]] = None,
+        run_size: int = DEFAULT_RUN_SIZE,
+        max_runs: int = DEFAULT_MAX_RUNS,
+        spill_dir: Optional[str] = None,
+        append: bool = False,
+    ) -> None:
+        """
+        writer: fully qualified class name of the writer to write merged entities with
+        writer_params: extra params of that writer
+        run_size: the number of the fragments to sort in memory
+        max_runs: the number of the sorted runs of the same size to merge at once
+        spill_dir: directory for the sorted runs, defaults to the system temp dir
+        """
+        self.writer_cls: str = writer
+        self.writer_params: Dict[str, Any] = writer_params or {}
+        super().__init__(output_uri, meta_fields, error_uri, append=append)
+
+        self.uses_meta: bool = self.writer.uses_meta
+        self.header_lines: int = self.writer.header_lines
+
+        self.run_size: int = run_size
+        self.max_runs: int = max_runs
+        self.spill_dir: Optional[str] = spill_dir
+        self.buffer: List[Tuple[str, RedGreenEntity]] = []
+        # (level, path) of the sorted runs, oldest first. Spilled runs are of the level
+        # 0, max_runs runs of the level n are merged into one run of the level n + 1
+        self.runs: List[Tuple[int, str]] = []
+
+    def open_outputs(self) -> None:
+        # Outputs are opened by the wrapped writer
+        self.writer: AbstractWriter = import_string(self.writer_cls)(
+            output_uri=self.output_uri,
+            meta_fields=self.meta_fields,
+            error_uri=self.error_uri,
+            append=self.append,
+            **self.writer_params,
+        )
+        self.output_fh = self.writer.output_fh
+        self.error_fh = self.writer.error_fh
+
+    def params(self) -> Dict[str, Any]:
+        params: Dict[str, Any] = super().params()
+        params.update(
+            {
+                "writer": self.writer_cls,
+                "writer_params": self.writer_params,
+                "run_size": self.run_size,
+                "max_runs": self.max_runs,
+                "spill_dir": self.spill_dir,
+            }
+        )
+
+        return params
+
+    @property
+    def discards_invalid(self) -> bool:
+        return False
+
+    def write_entities(
+        self, entities: Iterable[RedGreenEntity], flush: bool = True
+    ) -> None:
+        anonymous: bool = False
+        for entity in entities:
+            entity_id: Optional[str] = entity.payload.get("id")
+            if entity_id is None:
+                # Nothing to merge those with, so those are written right away
+                self.writer.write_entities([entity], flush=False)
+                anonymous = True
+                continue
+
+            self.buffer.append((entity_id, entity))
+            if len(self.buffer) >= self.run_size:
+                self.spill()
+
+        if anonymous and flush:
+            self.writer.flush()
+
+    def new_run(
+        self, fragments: Iterable[Tuple[str, RedGreenEntity]], level: int = 0
+    ) -> None:
+        fd, path = tempfile.mkstemp(
+            prefix="thebeast-aggregate-", suffix=".run", dir=self.spill_dir
+        )
+        with os.fdopen(fd, "wb") as fp:
+            write_run(fp, fragments)
+
+        self.runs.append((level, path))
+
+    def spill(self) -> None:
+        """
+        Sorts the fragments in memory by id (keeping the order of the fragments of
+        the same entity) and writes them into the new run
+        """
+        self.buffer.sort(key=itemgetter(0))
+        self.new_run(collapse(self.buffer, self.uses_meta))
+        self.buffer = []
+
+        # Levels never grow towards the end of the list, so the runs of the same level
+        # are always its tail and the merged run keeps the order of the fragments
+        level: int = 0
+        while (
+            sum(1 for run_level, _ in self.runs if run_level == level) >= self.max_runs
+        ):
+            self.merge_tail(self.max_runs, level + 1)
+            level += 1
+
+    def merge_tail(self, count: int, level: int) -> None:
+        """
+        Merges the last count runs into one run of the given level
+        """
+        runs: List[str] = [path for _, path in self.runs[-count:]]
+        del self.runs[-count:]
+        self.new_run(self.merge_runs(runs), level)
+        for path in runs:
+            os.remove(path)
+
+    def merge_runs(
+        self, runs: List[str]
+    ) -> Generator[Tuple[str, RedGreenEntity], None, None]:
+        # heapq.merge is stable, so the fragments are merged in the order they came
+        yield from collapse(
+            heapq.merge(*[read_run(path) for path in runs], key=itemgetter(0)),
+            self.uses_meta,
+        )
+
+    def aggregated(self) -> Generator[RedGreenEntity, None, None]:
+        """
+        Merged entities, sorted by id
+        """
+        if not self.runs:
+            self.buffer.sort(key=itemgetter(0))
+            fragments: Iterable[Tuple[str, RedGreenEntity]] = collapse(
+                self.buffer, self.uses_meta
+            )
+        else:
+            if self.buffer:
+                self.spill()
+
+            # Up to max_runs - 1 runs of each level are left, merge the smallest ones
+            # until the rest can be merged at once
+            while len(self.runs) > self.max_runs:
+                self.merge_tail(self.max_runs, self.runs[-self.max_runs][0] + 1)
+            fragments = self.merge_runs([path for _, path in self.runs])
+
+        for _, entity in fragments:
+            yield entity
+
+        self.buffer = []
+
+    def flush(self) -> None:
+        self.writer.flush()
+
+    def close(self):
+        try:
+            self.writer.write_entities(self.aggregated())
+        finally:
+            for _, path in self.runs:
+                os.remove(path)
+            self.runs = []
+
+            self.writer.close()
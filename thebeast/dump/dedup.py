@@ -0,0 +1,175 @@
+import os
+import math
+import sqlite3
+import tempfile
+from collections import namedtuple
+from hashlib import blake2b
+from typing import List, Optional, Set
+
+# Share of the new statements, that are (wrongly) taken for the already seen ones by
+# the bloom filter and have to be checked on disk
+DEFAULT_BLOOM_ERROR_RATE: float = 0.01
+
+# Expected number of the statements, the filter of the StatementsCSVWriter is sized
+# for by default (~12MB of memory with the default error rate)
+DEFAULT_BLOOM_CAPACITY: int = 10000000
+
+# Number of the new statements to insert into the store at once
+DEFAULT_BATCH_SIZE: int = 10000
+
+StatementSetInfo: type = namedtuple(
+    "StatementSetInfo", ["statements", "duplicates", "lookups"]
+)
+
+
+class BloomFilter:
+    """
+    Plain bloom filter over the bytearray. Bit positions are derived from the two
+    halves of the one hash (Kirsch-Mitzenmacher), so the key is hashed only once
+    """
+
+    def __init__(
+        self, capacity: int, error_rate: float = DEFAULT_BLOOM_ERROR_RATE
+    ) -> None:
+        """
+        capacity: the expected number of the keys
+        error_rate: the share of the false positives once there are capacity keys
+        """
+        self.size: int = max(
+            8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        )
+        self.hashes: int = max(1, round(self.size / capacity * math.log(2)))
+        self.bits: bytearray = bytearray((self.size + 7) // 8)
+
+    def positions(self, key: str) -> List[int]:
+        digest: bytes = blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1: int = int.from_bytes(digest[:8], "little")
+        h2: int = int.from_bytes(digest[8:], "little") | 1
+
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key: str) -> bool:
+        """
+        Adds the key and returns True if it might have been added before
+        """
+        seen: bool = True
+        for pos in self.positions(key):
+            byte, mask = pos >> 3, 1 << (pos & 7)
+            if not self.bits[byte] & mask:
+                seen = False
+                self.bits[byte] |= mask
+
+        return seen
+
+
+class StatementSet:
+    """
+    Exact set of the statement ids, kept in the SQLite store on disk, so it's not
+    bounded by the memory. Optional bloom filter in front of it answers "never seen"
+    for most of the new statements without touching the disk: those are inserted in
+    batches and only the ones, the filter reports as seen, are looked up in the store
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        bloom_capacity: int = 0,
+        bloom_error_rate: float = DEFAULT_BLOOM_ERROR_RATE,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> None:
+        """
+        path: SQLite file to keep the ids in, reused by the next runs. Defaults to
+        the temporary file, removed once the set is closed
+        bloom_capacity: the expected number of the statements, 0 disables the filter
+        bloom_error_rate: the share of the new statements to look up in the store
+        batch_size: the number of the new statements to insert at once
+        """
+        self.temporary: bool = path is None
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix="thebeast-dedup-", suffix=".sqlite")
+            os.close(fd)
+
+        self.path: str = path
+        self.batch_size: int = batch_size
+        self.statements: int = 0
+        self.duplicates: int = 0
+        self.lookups: int = 0
+        self.pending: Set[str] = set()
+
+        self.store: sqlite3.Connection = sqlite3.connect(self.path)
+        self.store.execute("PRAGMA journal_mode=OFF")
+        self.store.execute("PRAGMA synchronous=OFF")
+        self.store.execute(
+            "CREATE TABLE IF NOT EXISTS statements (id TEXT PRIMARY KEY) WITHOUT ROWID"
+        )
+
+        self.bloom: Optional[BloomFilter] = None
+        if bloom_capacity:
+            self.bloom = BloomFilter(bloom_capacity, bloom_error_rate)
+            # Ids stored by the previous runs must not be reported as never seen
+            for (key,) in self.store.execute("SELECT id FROM statements"):
+                self.bloom.add(key)
+
+    def info(self) -> StatementSetInfo:
+        """
+        Number of the statements checked, of the duplicates found and of the lookups
+        in the store on disk
+        """
+        return StatementSetInfo(self.statements, self.duplicates, self.lookups)
+
+    def add(self, key: str) -> bool:
+        """
+        Adds the statement id and returns True if it wasn't seen before
+        """
+        self.statements += 1
+        if self.bloom is not None:
+            if not self.bloom.add(key):
+                self.pending.add(key)
+                if len(self.pending) >= self.batch_size:
+                    self.commit()
+                return True
+
+            if key in self.pending:
+                self.duplicates += 1
+                return False
+
+        self.lookups += 1
+        if self.bloom is not None:
+            if self.store.execute(
+                "SELECT 1 FROM statements WHERE id = ?", (key,)
+            ).fetchone():
+                self.duplicates += 1
+                return False
+
+            # False positive of the filter
+            self.pending.add(key)
+            return True
+
+        if (
+            self.store.execute(
+                "INSERT OR IGNORE INTO statements (id) VALUES (?)", (key,)
+            ).rowcount
+            == 0
+        ):
+            self.duplicates += 1
+            return False
+
+        return True
+
+    def commit(self) -> None:
+        if self.pending:
+            self.store.executemany(
+                "INSERT OR IGNORE INTO statements (id) VALUES (?)",
+                ((key,) for key in self.pending),
+            )
+            self.pending = set()
+
+        self.store.commit()
+
+    def close(self) -> None:
+        if self.temporary:
+            self.store.close()
+            os.remove(self.path)
+        else:
+            self.commit()
+            self.store.close()
@@ -11,6 +11,8 @@ class FTMLinesWriter(AbstractWriter):
     or stdout (-)
     """
 
+    uses_meta: bool = False
+
     def write_entities(
         self, entities: Iterable[RedGreenEntity], flush: bool = True
     ) -> None:
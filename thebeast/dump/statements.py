@@ -10,14 +10,16 @@ except ImportError:
         return lru_cache(maxsize=None)(user_function)
 
 
-from typing import Dict, Union, List, Iterable, Any
-from csv import DictWriter
+from typing import Dict, Union, List, Iterable, Any, Optional, TextIO
+from csv import DictWriter, reader, writer
 
+import smart_open  # type: ignore
 from followthemoney import model as ftm
 
 from thebeast.types import RedGreenEntity
 from thebeast.contrib.ftm_ext.rigged_entity_proxy import StrProxy
-from .abstract import AbstractStatementsWriter
+from .abstract import AbstractStatementsWriter, shard_uri
+from .dedup import DEFAULT_BLOOM_CAPACITY, StatementSet, StatementSetInfo
 from thebeast.contrib.ftm_ext.meta_factory import get_meta_cls
 
 ID_PROP: str = "id"
@@ -57,15 +59,41 @@ def stmt_key(
 
 
 class StatementsCSVWriter(AbstractStatementsWriter):
+    header_lines: int = 1
+
     def __init__(
         self,
         output_uri: str,
         meta_fields: List[str],
         error_uri: str = "/dev/null",
         meta_for_stmt_id: List[str] = DEFAULT_META_FOR_STATEMENT_ID,
+        append: bool = False,
+        dedup: bool = False,
+        dedup_path: Optional[str] = None,
+        dedup_bloom_capacity: int = DEFAULT_BLOOM_CAPACITY,
     ) -> None:
-        super().__init__(output_uri, meta_fields, error_uri)
+        """
+        dedup: write every statement (i.e the same value of the constant or of the
+        entity produced by many records) only once, keyed by the statement id
+        dedup_path: SQLite file to keep the ids of the written statements in, so the
+        next (appending) runs skip them too. Defaults to the temporary file
+        dedup_bloom_capacity: the expected number of the statements to size the bloom
+        filter for, that spares the lookups on disk for most of the new statements.
+        0 disables the filter
+        Shards of write_in_workers are deduplicated on their own and then once again,
+        when those are merged into the output (see append_file)
+        """
+        super().__init__(output_uri, meta_fields, error_uri, append=append)
         self._meta_for_stmt_id = meta_for_stmt_id
+        self.dedup: bool = dedup
+        self.dedup_path: Optional[str] = dedup_path
+        self.dedup_bloom_capacity: int = dedup_bloom_capacity
+
+        self.statement_set: Optional[StatementSet] = None
+        if dedup:
+            self.statement_set = StatementSet(
+                path=dedup_path, bloom_capacity=dedup_bloom_capacity
+            )
 
         fieldnames: List[str] = [
             "id",
@@ -81,7 +109,9 @@ class StatementsCSVWriter(AbstractStatementsWriter):
             fieldnames=fieldnames,
         )
 
-        self.csv_writer.writeheader()
+        # Appended outputs already have the header
+        if not append:
+            self.csv_writer.writeheader()
 
         if self.output_uri != self.error_uri:
             self.csv_error_writer = DictWriter(
@@ -89,10 +119,78 @@ class StatementsCSVWriter(AbstractStatementsWriter):
                 fieldnames=fieldnames,
             )
 
-            self.csv_error_writer.writeheader()
+            if not append:
+                self.csv_error_writer.writeheader()
         else:
             self.csv_error_writer = self.csv_writer
 
+    def params(self) -> Dict[str, Any]:
+        params: Dict[str, Any] = super().params()
+        params["meta_for_stmt_id"] = self._meta_for_stmt_id
+        if self.dedup:
+            params.update(
+                {
+                    "dedup": self.dedup,
+                    "dedup_path": self.dedup_path,
+                    "dedup_bloom_capacity": self.dedup_bloom_capacity,
+                }
+            )
+
+        return params
+
+    @classmethod
+    def make_shard(cls, params: Dict[str, Any], shard: int) -> "StatementsCSVWriter":
+        # Every shard is deduplicated on its own and keeps its own ids
+        if params.get("dedup_path"):
+            params = dict(params, dedup_path=shard_uri(params["dedup_path"], shard))
+
+        return super().make_shard(params, shard)
+
+    def dedup_info(self) -> Optional[StatementSetInfo]:
+        """
+        Number of the statements checked and of the duplicates skipped so far
+        """
+        if self.statement_set is None:
+            return None
+
+        return self.statement_set.info()
+
+    def dedup_prefix(self, valid: bool) -> str:
+        if valid or self.csv_error_writer is self.csv_writer:
+            return ""
+
+        # Invalid statements go to another file, so are deduplicated separately
+        return "invalid:"
+
+    def deduplicated(
+        self, rows: List[Dict[str, Any]], valid: bool
+    ) -> List[Dict[str, Any]]:
+        prefix: str = self.dedup_prefix(valid)
+
+        return [rec for rec in rows if self.statement_set.add(prefix + rec["id"])]
+
+    def append_file(self, fh: TextIO, file_uri: str) -> None:
+        """
+        Statements of the shard, that were already written into the output (i.e the
+        constant entities or the values, that are produced by the records read by
+        the different workers) are skipped
+        """
+        if self.statement_set is None:
+            return super().append_file(fh, file_uri)
+
+        prefix: str = self.dedup_prefix(fh is not self.error_fh)
+        csv_writer = writer(fh)
+        with smart_open.open(file_uri, "r", newline="") as fp_in:
+            rows = reader(fp_in)
+            for _ in range(self.header_lines):
+                next(rows, None)
+
+            csv_writer.writerows(
+                row for row in rows if self.statement_set.add(prefix + row[0])
+            )
+
+        fh.flush()
+
     def write_entities(
         self, entities: Iterable[RedGreenEntity], flush: bool = True
     ) -> None:
@@ -138,6 +236,11 @@ class StatementsCSVWriter(AbstractStatementsWriter):
                     )
                     rows.append(rec)
 
+            if self.statement_set is not None and (
+                entity.valid or not self.discards_invalid
+            ):
+                rows = self.deduplicated(rows, entity.valid)
+
             if entity.valid:
                 self.csv_writer.writerows(rows)
             else:
@@ -145,3 +248,10 @@ class StatementsCSVWriter(AbstractStatementsWriter):
 
         if flush:
             self.output_fh.flush()
+
+    def close(self):
+        if self.statement_set is not None:
+            self.statement_set.close()
+            self.statement_set = None
+
+        super().close()
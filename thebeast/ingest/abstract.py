@@ -1,8 +1,92 @@
-from typing import TextIO, Iterator, Union, Dict, Generator
-
+from typing import (
+    TextIO,
+    Iterator,
+    Iterable,
+    Union,
+    Dict,
+    Generator,
+    Tuple,
+    List,
+    Optional,
+    Set,
+)
+from contextlib import contextmanager
+from itertools import islice, chain
+import codecs
+import hashlib
+import io
+import os
+import re
 
 import smart_open  # type: ignore
-from thebeast.types import Record
+from smart_open.compression import get_supported_extensions  # type: ignore
+from thebeast.types import Record, RawChunk, ByteRange, Checkpoint
+
+# Ways to split the input between the shards: whole files from the sourcer or
+# every n-th record of each file
+SHARD_MODES: Tuple[str, ...] = ("file", "record")
+
+# Lines as the text mode splits them: on \r\n, \n and the bare \r
+UNIVERSAL_LINE_RE: re.Pattern = re.compile(rb"[^\r\n]*(?:\r\n|\r|\n)|[^\r\n]+")
+
+
+def ascii_compatible(encoding: str) -> bool:
+    """
+    Whether the line breaks and quotes of the encoding are the same bytes as in ascii,
+    so the raw file can be split into records without decoding it (i.e utf-8, but
+    not utf-16)
+    """
+    sample: bytes = b'\r\n"'
+    try:
+        return codecs.lookup(encoding).decode(sample)[0] == sample.decode("ascii")
+    except (LookupError, UnicodeDecodeError):
+        return False
+
+
+def universal_lines(fp: Iterable[bytes]) -> Generator[bytes, None, None]:
+    """
+    Lines of the binary file, split the same way as the file opened in the text mode
+    does, with the line breaks kept, so their sizes add up to the position in the file
+    """
+    for line in fp:
+        end: int = (
+            -2 if line.endswith(b"\r\n") else -1 if line.endswith(b"\n") else len(line)
+        )
+        if b"\r" not in line[:end]:
+            yield line
+        else:
+            # Bare \r (old Mac line endings) breaks the line too
+            for match in UNIVERSAL_LINE_RE.finditer(line):
+                yield match.group()
+
+
+class RangeReader(io.RawIOBase):
+    """
+    Raw binary stream of the bytes from start to end of the local file
+    """
+
+    def __init__(self, file_uri: str, start: int, end: Optional[int] = None) -> None:
+        self.fp = open(file_uri, "rb")
+        self.fp.seek(start)
+        self.remaining: Optional[int] = None if end is None else end - start
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        size: int = len(buffer)
+        if self.remaining is not None:
+            size = min(size, self.remaining)
+
+        count: int = self.fp.readinto(memoryview(buffer)[:size])
+        if self.remaining is not None:
+            self.remaining -= count
+
+        return count
+
+    def close(self) -> None:
+        self.fp.close()
+        super().close()
 
 
 class AbstractIngestor:
@@ -19,6 +103,10 @@ class AbstractIngestor:
     more params (for example, credentials for a remote source)
     """
 
+    # Whether the ingestor can split the files into raw records without parsing them
+    # so the parsing can be done somewhere else (i.e in the worker processes)
+    supports_raw: bool = False
+
     def __init__(
         self, input_uri: str, input_encoding: str = "utf-8", *args, **kwargs
     ) -> None:
@@ -33,6 +121,11 @@ class AbstractIngestor:
         self.input_uri = input_uri
         self.input_encoding = input_encoding
         self.filemode = "rt"
+        # (index, count) of the shard, when the input is split between the machines
+        self.shard: Optional[Tuple[int, int]] = None
+        self.shard_by: str = "file"
+        # Position to continue from, when the run is resumed
+        self.checkpoint: Optional[Checkpoint] = None
 
     def __iter__(self):
         return self.iterator()
@@ -56,6 +149,109 @@ class AbstractIngestor:
         """
         yield self.input_uri
 
+    def set_shard(self, index: int, count: int, shard_by: Optional[str] = None) -> None:
+        """
+        Limits the input to the shard index (0-based) of count. Shards are
+        deterministic, so the machines, that run the same mapping over the same input
+        with different shard indices, read disjoint parts of it, that together make
+        the whole input. By default the input is split by files, unless there are
+        fewer files than shards
+        """
+        if not 0 <= index < count:
+            raise ValueError(f"Shard index {index} is out of range of {count} shards")
+
+        if shard_by is None:
+            shard_by = "file" if len(list(self.sourcer())) >= count else "record"
+
+        if shard_by not in SHARD_MODES:
+            raise ValueError(
+                f"Unknown shard mode {shard_by}, must be one of {', '.join(SHARD_MODES)}"
+            )
+
+        self.shard = (index, count)
+        self.shard_by = shard_by
+
+    def resume(self, checkpoint: Checkpoint) -> None:
+        """
+        Continues reading right after the last record of the checkpoint. Files done
+        before the checkpoint are skipped by name, so the order of sourcer doesn't
+        matter, and the file of the checkpoint is read first, from the offset of the
+        next record, if it's known. Otherwise the records up to the last one of the
+        checkpoint are read and thrown away
+        """
+        self.checkpoint = checkpoint
+
+    def sources(self) -> Generator[str, None, None]:
+        """
+        File uris of the shard. When sharded by file, uris from sourcer are sorted and
+        dealt to the shards round robin. When resumed, starts from the file of the
+        checkpoint and skips the files done before it
+        """
+        file_uris: Iterable[str] = self.sourcer()
+        if self.shard is not None and self.shard_by == "file":
+            index, count = self.shard
+            file_uris = [
+                file_uri
+                for i, file_uri in enumerate(sorted(file_uris))
+                if i % count == index
+            ]
+
+        if self.checkpoint is not None:
+            file_uris = list(file_uris)
+            if self.checkpoint.input_uri not in file_uris:
+                raise ValueError(
+                    f"Cannot resume, {self.checkpoint.input_uri} is not in the input"
+                )
+
+            done: Set[str] = set(self.checkpoint.done or [])
+            file_uris = [self.checkpoint.input_uri] + [
+                file_uri
+                for file_uri in file_uris
+                if file_uri not in done and file_uri != self.checkpoint.input_uri
+            ]
+
+        yield from file_uris
+
+    def resumed_range(self, file_uri: str) -> Optional[ByteRange]:
+        """
+        The rest of the file of the checkpoint, if the offset of the next record
+        is known
+        """
+        if (
+            self.checkpoint is None
+            or self.checkpoint.input_uri != file_uri
+            or self.checkpoint.offset is None
+        ):
+            return None
+
+        return ByteRange(
+            input_uri=file_uri,
+            start=self.checkpoint.offset,
+            end=None,
+            record_no=self.checkpoint.record_no + 1,
+            preamble_size=self.checkpoint.preamble_size,
+        )
+
+    def skipped_records(self, file_uri: str) -> int:
+        """
+        Number of the records at the beginning of the file to throw away, when
+        resumed from the checkpoint without the offset
+        """
+        if self.checkpoint is None or self.checkpoint.input_uri != file_uri:
+            return 0
+
+        return self.checkpoint.record_no + 1
+
+    def in_shard(self, record_no: int) -> bool:
+        """
+        Whether the record belongs to the shard, when sharded by record
+        """
+        return (
+            self.shard is None
+            or self.shard_by != "record"
+            or record_no % self.shard[1] == self.shard[0]
+        )
+
     def opener(self, file_uri: str) -> Union[TextIO, Iterator]:
         """
         Turns a file uri into the file-like handle using smart_open
@@ -88,7 +284,230 @@ class AbstractIngestor:
 
         You might want to redefine it for database collections
         """
-        for file_uri in self.sourcer():
-            with self.opener(file_uri) as fp:
-                for i, record in enumerate(self.reader(fp)):
+        for file_uri in self.sources():
+            yield from self.iterate_file(file_uri)
+
+    def iterate_file(self, file_uri: str) -> Generator[Record, None, None]:
+        """
+        Reads the records of a single file uri, yielded by sourcer. Records are
+        numbered within the file, so the files might be read independently
+        (i.e by the worker processes)
+        """
+        resumed_range: Optional[ByteRange] = self.resumed_range(file_uri)
+        if resumed_range is not None:
+            yield from self.iterate_range(resumed_range)
+            return
+
+        skipped: int = self.skipped_records(file_uri)
+        with self.opener(file_uri) as fp:
+            for i, record in enumerate(self.reader(fp)):
+                if i >= skipped and self.in_shard(i):
                     yield Record(payload=record, record_no=i, input_uri=file_uri)
+
+    def source_fingerprint(self, file_uri: str, content: bool = False) -> str:
+        """
+        Fingerprint of the file uri, that changes when the file does, used to skip
+        the unchanged files in the incremental runs. Size and mtime of the local
+        files, or the hash of the content when asked to (or when the file cannot
+        be stat-ed)
+
+        You might want to redefine this method for the remote sources, i.e to use
+        the ETag of the S3 objects
+        """
+        if not content:
+            try:
+                stat: os.stat_result = os.stat(file_uri)
+                return f"stat:{stat.st_size}:{stat.st_mtime_ns}"
+            except OSError:
+                pass
+
+        digest = hashlib.sha256()
+        with smart_open.open(file_uri, "rb", compression="disable") as fp:
+            for block in iter(lambda: fp.read(1 << 20), b""):
+                digest.update(block)
+
+        return f"sha256:{digest.hexdigest()}"
+
+    def source_size(self, file_uri: str) -> int:
+        """
+        Size of the file uri in bytes, used to read the largest files first when
+        the files are read in parallel. 0 if unknown
+
+        You might want to redefine this method for the remote sources
+        """
+        try:
+            return os.path.getsize(file_uri)
+        except OSError:
+            return 0
+
+    def raw_reader(self, iterator: Iterator) -> Tuple[str, Iterator[str]]:
+        """
+        Splits the opened file handle into the raw records without parsing them.
+        Returns the preamble that is required to parse the records (i.e header
+        of the csv) and the iterator over the raw records. Each raw record must
+        produce exactly one record when parsed
+
+        Redefine it together with parse_raw and set supports_raw to True
+        """
+        raise NotImplementedError("You have to redefine it")
+
+    def parse_raw(
+        self, preamble: str, raw_records: Iterator[str]
+    ) -> Generator[Dict, None, None]:
+        """
+        Turns the raw records produced by raw_reader into the dicts
+        """
+        raise NotImplementedError("You have to redefine it")
+
+    def raw_chunks(self, chunk_size: int) -> Generator[RawChunk, None, None]:
+        """
+        Same as iterator, but yields chunks of raw records
+        """
+        for file_uri in self.sources():
+            resumed_range: Optional[ByteRange] = self.resumed_range(file_uri)
+            if resumed_range is not None:
+                with self.open_range(resumed_range) as lines:
+                    yield from self._chunk_raw(
+                        file_uri, lines, chunk_size, record_no=resumed_range.record_no
+                    )
+            else:
+                with self.opener(file_uri) as fp:
+                    yield from self._chunk_raw(
+                        file_uri, fp, chunk_size, skip=self.skipped_records(file_uri)
+                    )
+
+    def _chunk_raw(
+        self,
+        file_uri: str,
+        lines: Iterator,
+        chunk_size: int,
+        record_no: int = 0,
+        skip: int = 0,
+    ) -> Generator[RawChunk, None, None]:
+        preamble, raw_records = self.raw_reader(lines)
+        if skip:
+            raw_records = islice(raw_records, skip, None)
+            record_no += skip
+
+        while True:
+            payload: List[str] = list(islice(raw_records, chunk_size))
+            if not payload:
+                break
+
+            yield RawChunk(
+                payload=payload,
+                record_no=record_no,
+                input_uri=file_uri,
+                preamble=preamble,
+            )
+            record_no += len(payload)
+
+    def parse_chunk(self, chunk: RawChunk) -> Generator[Record, None, None]:
+        """
+        Parses the chunk of raw records, numbering them the same way iterator does
+        """
+        for i, record in enumerate(
+            self.parse_raw(chunk.preamble, iter(chunk.payload)), chunk.record_no
+        ):
+            if self.in_shard(i):
+                yield Record(payload=record, record_no=i, input_uri=chunk.input_uri)
+
+    def splittable(self, file_uri: str) -> bool:
+        """
+        Whether the file uri can be split into byte ranges: the ingestor must support
+        raw records, the file must be local and uncompressed and its encoding must be
+        ascii compatible
+        """
+        return (
+            self.supports_raw
+            and ascii_compatible(self.input_encoding)
+            and os.path.isfile(file_uri)
+            and not file_uri.endswith(tuple(get_supported_extensions()))
+        )
+
+    def record_ranges(self, file_uri: str) -> Generator[ByteRange, None, None]:
+        """
+        Byte range of each raw record of the local uncompressed file, found without
+        parsing the records (so the quoted multiline fields of csv stay in one piece).
+        Requires an ascii compatible encoding (i.e utf-8)
+        """
+        with open(file_uri, "rb") as fp:
+            position: int = 0
+
+            def lines() -> Generator[str, None, None]:
+                nonlocal position
+
+                for line in universal_lines(fp):
+                    position += len(line)
+                    yield line.decode(self.input_encoding)
+
+            preamble, raw_records = self.raw_reader(lines())
+            preamble_size: int = position if preamble else 0
+            start: int = preamble_size
+
+            for record_no, _ in enumerate(raw_records):
+                yield ByteRange(
+                    input_uri=file_uri,
+                    start=start,
+                    end=position,
+                    record_no=record_no,
+                    preamble_size=preamble_size,
+                )
+                start = position
+
+    def byte_ranges(
+        self, file_uri: str, range_size: int
+    ) -> Generator[ByteRange, None, None]:
+        """
+        Splits the local uncompressed file into the ranges of at least range_size
+        bytes, aligned to the raw records. Records are counted on the way, so the
+        ranges know the number of their first record. That's one pass over the file,
+        but without parsing the records
+        """
+        first: Optional[ByteRange] = None
+        for record_range in self.record_ranges(file_uri):
+            if first is None:
+                first = record_range
+
+            if record_range.end - first.start >= range_size:
+                yield first._replace(end=record_range.end)
+                first = None
+
+        if first is not None:
+            yield first._replace(end=record_range.end)
+
+    @contextmanager
+    def open_range(self, byte_range: ByteRange) -> Generator[Iterator[str], None, None]:
+        """
+        Lines of the byte range (up to the end of the file, if the end is None),
+        preceded by the preamble of the file. The range is streamed, with the same
+        newline handling as the file opened for the iterator
+        """
+        with open(byte_range.input_uri, "rb") as fp:
+            preamble: bytes = fp.read(byte_range.preamble_size)
+
+        with io.TextIOWrapper(
+            io.BufferedReader(
+                RangeReader(byte_range.input_uri, byte_range.start, byte_range.end)
+            ),
+            encoding=self.input_encoding,
+        ) as fp:
+            yield chain(
+                io.TextIOWrapper(io.BytesIO(preamble), encoding=self.input_encoding),
+                fp,
+            )
+
+    def iterate_range(self, byte_range: ByteRange) -> Generator[Record, None, None]:
+        """
+        Reads the records of the byte range produced by byte_ranges, numbering them
+        the same way iterator does
+        """
+        with self.open_range(byte_range) as lines:
+            preamble, raw_records = self.raw_reader(lines)
+            for i, record in enumerate(
+                self.parse_raw(preamble, raw_records), byte_range.record_no
+            ):
+                if self.in_shard(i):
+                    yield Record(
+                        payload=record, record_no=i, input_uri=byte_range.input_uri
+                    )
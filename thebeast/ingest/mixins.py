@@ -1,4 +1,5 @@
-from typing import Iterator, Generator, Dict, Union
+from typing import Iterator, Generator, Dict, Union, Tuple, List
+from itertools import chain
 from glob import iglob
 import csv
 import json
@@ -28,6 +29,8 @@ class CSVDictReaderMixin:
     Read CSV with the header
     """
 
+    supports_raw: bool = True
+
     def __init__(
         self,
         input_uri: str,
@@ -53,6 +56,48 @@ class CSVDictReaderMixin:
         for line in csv.DictReader(iterator, **self.dialect_params):
             yield line
 
+    def split_records(self, iterator: Iterator) -> Generator[str, None, None]:
+        """
+        Glues the lines of the quoted multiline fields back together without parsing
+        the csv. Assumes that quotechar is only used to quote the fields
+        """
+        quotechar: str = self.dialect_params["quotechar"]
+        escapechar: Union[str, None] = self.dialect_params["escapechar"]
+
+        buffer: List[str] = []
+        quoted: bool = False
+        for line in iterator:
+            unescaped: str = line
+            if escapechar:
+                unescaped = line.replace(escapechar * 2, "").replace(
+                    escapechar + quotechar, ""
+                )
+
+            if unescaped.count(quotechar) % 2:
+                quoted = not quoted
+
+            if not buffer and not quoted and not line.strip("\r\n"):
+                # DictReader skips empty lines
+                continue
+
+            buffer.append(line)
+            if not quoted:
+                yield "".join(buffer)
+                buffer = []
+
+        if buffer:
+            yield "".join(buffer)
+
+    def raw_reader(self, iterator: Iterator) -> Tuple[str, Iterator[str]]:
+        raw_records: Iterator[str] = self.split_records(iterator)
+
+        return next(raw_records, ""), raw_records
+
+    def parse_raw(
+        self, preamble: str, raw_records: Iterator[str]
+    ) -> Generator[Dict, None, None]:
+        return self.reader(chain([preamble], raw_records))
+
 
 class TSVDictReaderMixin(CSVDictReaderMixin):
     """
@@ -68,10 +113,20 @@ class JSONLinesReaderMixin:
     Read jsonlines
     """
 
+    supports_raw: bool = True
+
     def reader(self, iterator: Iterator) -> Generator[Dict, None, None]:
         for line in iterator:
             yield json.loads(line)
 
+    def raw_reader(self, iterator: Iterator) -> Tuple[str, Iterator[str]]:
+        return "", iter(iterator)
+
+    def parse_raw(
+        self, preamble: str, raw_records: Iterator[str]
+    ) -> Generator[Dict, None, None]:
+        return self.reader(raw_records)
+
 
 class JSONReaderMixin:
     """
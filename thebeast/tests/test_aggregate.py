@@ -0,0 +1,248 @@
+import json
+import unittest
+import tempfile
+from pathlib import Path
+from typing import List
+
+from thebeast.conf.checkpoint import Checkpointer
+from thebeast.conf.incremental import IncrementalRun
+from thebeast.digest.merge import EntityMerger
+from thebeast.dump import FTMLinesWriter, StatementsCSVWriter
+from thebeast.dump.aggregate import AggregatingWriter, read_ftm_lines
+from thebeast.types import RedGreenEntity
+from thebeast.tests.utils import digest_fragments, load_mapping, write_mapping
+
+
+class AggregatingWriterTests(unittest.TestCase):
+    def setUp(self):
+        self.mapping = load_mapping("thebeast/tests/sample/mappings/ukrainian_mps.yaml")
+        # With the statements meta, so it can be written as statements too
+        self.fragments = digest_fragments(self.mapping)
+
+    def merged(self, keep_meta: bool):
+        return sorted(
+            EntityMerger(keep_meta=keep_meta).merge(self.fragments),
+            key=lambda entity: entity.payload["id"],
+        )
+
+    def write(self, writer_cls, output_uri: str, entities) -> str:
+        writer = writer_cls(
+            output_uri=output_uri, meta_fields=self.mapping.digestor.meta_fields
+        )
+        writer.write_entities(entities)
+        writer.close()
+
+        return Path(output_uri).read_text()
+
+    def test_aggregate(self):
+        for writer_cls in [FTMLinesWriter, StatementsCSVWriter]:
+            with self.subTest(
+                "Aggregated output", writer=writer_cls.__name__
+            ), tempfile.TemporaryDirectory() as tmp_dir:
+                expected: str = self.write(
+                    writer_cls,
+                    str(Path(tmp_dir) / "expected"),
+                    self.merged(keep_meta=writer_cls.uses_meta),
+                )
+
+                spill_dir: Path = Path(tmp_dir) / "spill"
+                spill_dir.mkdir()
+                writer = AggregatingWriter(
+                    output_uri=str(Path(tmp_dir) / "output"),
+                    meta_fields=self.mapping.digestor.meta_fields,
+                    writer=f"thebeast.dump.{writer_cls.__name__}",
+                    run_size=100,
+                    max_runs=4,
+                    spill_dir=str(spill_dir),
+                )
+                self.assertEqual(writer.uses_meta, writer_cls.uses_meta)
+
+                writer.write_entities(self.fragments[:1000])
+                writer.write_entities(self.fragments[1000:])
+                self.assertTrue(list(spill_dir.iterdir()))
+
+                # Runs are merged by level, so none of the fragments is rewritten
+                # over and over again by each merge
+                levels: List[int] = [level for level, _ in writer.runs]
+                self.assertEqual(levels, sorted(levels, reverse=True))
+                self.assertTrue(max(levels) > 1)
+                self.assertTrue(all(levels.count(level) < 4 for level in levels))
+                writer.close()
+
+                self.assertEqual((Path(tmp_dir) / "output").read_text(), expected)
+                self.assertEqual(list(spill_dir.iterdir()), [])
+
+    def test_shards(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            expected: str = self.write(
+                FTMLinesWriter,
+                str(Path(tmp_dir) / "expected"),
+                self.merged(keep_meta=False),
+            )
+
+            half: int = len(self.fragments) // 2
+            shards = [
+                self.write(FTMLinesWriter, str(Path(tmp_dir) / name), fragments)
+                for name, fragments in [
+                    ("out-shard00000.jsonl", self.fragments[:half]),
+                    ("out-shard00001.jsonl", self.fragments[half:]),
+                ]
+            ]
+            self.assertTrue(all(shards))
+
+            writer = AggregatingWriter(
+                output_uri=str(Path(tmp_dir) / "output"),
+                meta_fields=self.mapping.digestor.meta_fields,
+                run_size=500,
+            )
+            for name in ["out-shard00000.jsonl", "out-shard00001.jsonl"]:
+                writer.write_entities(read_ftm_lines(str(Path(tmp_dir) / name)))
+            writer.close()
+
+            self.assertEqual((Path(tmp_dir) / "output").read_text(), expected)
+
+    def test_mapping(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            expected: str = self.write(
+                FTMLinesWriter,
+                str(Path(tmp_dir) / "expected"),
+                self.merged(keep_meta=False),
+            )
+
+            mapping_path: Path = write_mapping(
+                "thebeast/tests/sample/mappings/ukrainian_mps.yaml",
+                tmp_dir,
+                "thebeast.dump.aggregate.AggregatingWriter",
+            )
+
+            mapping = load_mapping(
+                mapping_path,
+                dump_overrides={"output_uri": str(Path(tmp_dir) / "output")},
+            )
+            # Wrapped FTMLinesWriter doesn't need the statements meta
+            self.assertFalse(mapping.dumper.uses_meta)
+
+            # Output is written once the dumper is closed, so it can't be
+            # checkpointed or assembled from the parts of the input files
+            with self.assertRaises(ValueError):
+                Checkpointer(
+                    Path(tmp_dir) / "checkpoint.json",
+                    ingestor=mapping.ingestor,
+                    digestor=mapping.digestor,
+                    dumper=mapping.dumper,
+                )
+
+            with self.assertRaises(ValueError):
+                IncrementalRun(Path(tmp_dir) / "state", mapping)
+
+            mapping.dumper.write_entities(mapping.digestor.extract(mapping.ingestor))
+            mapping.dumper.close()
+
+            self.assertEqual((Path(tmp_dir) / "output").read_text(), expected)
+
+    def test_invalid_fragments(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            mapping_path: Path = write_mapping(
+                "thebeast/tests/sample/mappings/fragments.yaml",
+                tmp_dir,
+                "thebeast.dump.aggregate.AggregatingWriter",
+            )
+            mapping = load_mapping(
+                mapping_path,
+                dump_overrides={"output_uri": str(Path(tmp_dir) / "output")},
+            )
+            # Errors go to /dev/null, still Person with only the birthDate is kept
+            # until it's merged with the name
+            self.assertEqual(mapping.dumper.error_uri, "/dev/null")
+            self.assertFalse(mapping.dumper.discards_invalid)
+
+            mapping.dumper.write_entities(mapping.digestor.extract(mapping.ingestor))
+            mapping.dumper.close()
+
+            lines = (Path(tmp_dir) / "output").read_text().splitlines()
+            self.assertEqual(len(lines), 67)
+            for line in lines:
+                self.assertEqual(
+                    set(json.loads(line)["properties"]), {"name", "birthDate"}
+                )
+
+    def test_anonymous(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output: Path = Path(tmp_dir) / "output"
+            writer = AggregatingWriter(
+                output_uri=str(output),
+                meta_fields=self.mapping.digestor.meta_fields,
+            )
+            anonymous = RedGreenEntity(
+                payload={"schema": "Person", "properties": {"name": ["Foo"]}},
+                valid=True,
+            )
+            written: List[str] = []
+
+            def entities():
+                yield anonymous
+                writer.flush()
+                written.append(output.read_text())
+                yield from self.fragments[:10]
+
+            # Entities without id are written right away, not buffered
+            writer.write_entities(entities())
+            self.assertEqual(
+                written,
+                [
+                    json.dumps(anonymous.payload, sort_keys=True, ensure_ascii=False)
+                    + "\n"
+                ],
+            )
+            self.assertEqual(len(writer.buffer), 10)
+            writer.close()
+
+    def test_revalidate(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            shard: Path = Path(tmp_dir) / "out-shard00000.jsonl"
+            # Shards are not trusted to have only the valid entities
+            shard.write_text(
+                json.dumps(
+                    {"id": "foo", "schema": "Person", "properties": {"name": ["Foo"]}}
+                )
+                + "\n"
+                + json.dumps(
+                    {
+                        "id": "bar",
+                        "schema": "Person",
+                        "properties": {"birthDate": ["1970"]},
+                    }
+                )
+                + "\n"
+            )
+
+            writer = AggregatingWriter(
+                output_uri=str(Path(tmp_dir) / "output"),
+                meta_fields=self.mapping.digestor.meta_fields,
+                error_uri=str(Path(tmp_dir) / "errors"),
+            )
+            writer.write_entities(read_ftm_lines(str(shard)))
+            writer.close()
+
+            for name, entity_id in [("output", "foo"), ("errors", "bar")]:
+                lines = (Path(tmp_dir) / name).read_text().splitlines()
+                self.assertEqual(
+                    [json.loads(line)["id"] for line in lines], [entity_id]
+                )
+
+    def test_append(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output: Path = Path(tmp_dir) / "output"
+            output.write_text("previous\n")
+
+            writer = AggregatingWriter(
+                output_uri=str(output),
+                meta_fields=self.mapping.digestor.meta_fields,
+                append=True,
+            )
+            writer.write_entities(self.fragments[:10])
+            writer.close()
+
+            lines = output.read_text().splitlines()
+            self.assertEqual(lines[0], "previous")
+            self.assertTrue(len(lines) > 1)
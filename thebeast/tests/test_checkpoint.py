@@ -0,0 +1,190 @@
+import unittest
+import tempfile
+from itertools import islice
+from pathlib import Path
+from typing import List, Optional
+
+from thebeast.conf.mapping import SourceMapping
+from thebeast.conf.checkpoint import Checkpointer, load_checkpoint
+from thebeast.digest import MultiProcessDigestor
+from thebeast.tests.utils import load_mapping
+
+
+class CheckpointTests(unittest.TestCase):
+    def make_mapping(
+        self, mapping_path: Path, output_uri: str, resume_from: Optional[Path] = None
+    ) -> SourceMapping:
+        return load_mapping(
+            mapping_path,
+            dump_overrides={"output_uri": output_uri},
+            resume=load_checkpoint(resume_from) if resume_from is not None else None,
+        )
+
+    def run_mapping(
+        self,
+        mapping_path: Path,
+        output_uri: str,
+        checkpoint_path: Path,
+        resume: bool = False,
+        limit: Optional[int] = None,
+        sources: Optional[List[str]] = None,
+    ) -> Checkpointer:
+        mapping = self.make_mapping(
+            mapping_path, output_uri, checkpoint_path if resume else None
+        )
+        if sources is not None:
+            # Files listed by the sourcer in the given order
+            mapping.ingestor.sourcer = lambda: iter(sources)
+        checkpointer = Checkpointer(
+            checkpoint_path,
+            ingestor=mapping.ingestor,
+            digestor=mapping.digestor,
+            dumper=mapping.dumper,
+            interval=0,
+        )
+        entities = checkpointer.track(mapping.digestor.extract(mapping.ingestor))
+        if limit is not None:
+            # Interrupted run, some of the entities after the checkpoint are written too
+            entities = islice(entities, limit)
+
+        mapping.dumper.write_entities(entities)
+        mapping.dumper.close()
+
+        if limit is None:
+            checkpointer.finish()
+
+        return checkpointer
+
+    def test_resume(self):
+        # Runs are interrupted after the limits of entities, each one resuming the
+        # previous one
+        for path, dumper_cls, limits, has_offset in [
+            ("ukrainian_mps.yaml", "thebeast.dump.FTMLinesWriter", [40, 150], True),
+            (
+                "ukrainian_mps.yaml",
+                "thebeast.dump.StatementsCSVWriter",
+                [40, 150],
+                True,
+            ),
+            ("ru_mayors.yaml", "thebeast.dump.FTMLinesWriter", [40, 150], True),
+            # Single json document, two records
+            ("ukrainian_edr.yaml", "thebeast.dump.FTMLinesWriter", [8], False),
+        ]:
+            with self.subTest(
+                "Resumed run", mapping=path, dumper=dumper_cls
+            ), tempfile.TemporaryDirectory() as tmp_dir:
+                mapping_path = Path(tmp_dir) / path
+                mapping_path.write_text(
+                    (Path("thebeast/tests/sample/mappings") / path)
+                    .read_text()
+                    .replace("thebeast.dump.FTMLinesWriter", dumper_cls)
+                )
+                checkpoint_path = Path(tmp_dir) / "checkpoint.json"
+
+                expected_uri = str(Path(tmp_dir) / "expected")
+                self.run_mapping(mapping_path, expected_uri, checkpoint_path)
+                self.assertFalse(checkpoint_path.exists())
+
+                output_uri = str(Path(tmp_dir) / "output")
+                for i, limit in enumerate(limits):
+                    checkpointer = self.run_mapping(
+                        mapping_path,
+                        output_uri,
+                        checkpoint_path,
+                        resume=i > 0,
+                        limit=limit,
+                    )
+                    self.assertIsNotNone(checkpointer.saved)
+                    self.assertEqual(checkpointer.saved.offset is not None, has_offset)
+                    self.assertEqual(
+                        load_checkpoint(checkpoint_path), checkpointer.saved
+                    )
+
+                self.run_mapping(mapping_path, output_uri, checkpoint_path, resume=True)
+                self.assertFalse(checkpoint_path.exists())
+                self.assertEqual(
+                    Path(output_uri).read_text(), Path(expected_uri).read_text()
+                )
+
+    def test_resume_by_name(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            lines: List[str] = (
+                Path("thebeast/tests/sample/csv/rada4.tsv").read_text().splitlines()
+            )
+            sources: List[str] = []
+            for i, name in enumerate(["a", "b", "c", "d"]):
+                path = Path(tmp_dir) / f"{name}.tsv"
+                path.write_text(
+                    "\n".join([lines[0]] + lines[1 + i * 50 : 1 + (i + 1) * 50]) + "\n"
+                )
+                sources.append(str(path))
+
+            mapping_path = Path(tmp_dir) / "mapping.yaml"
+            mapping_path.write_text(
+                Path("thebeast/tests/sample/mappings/ukrainian_mps.yaml")
+                .read_text()
+                .replace("thebeast/tests/sample/csv/rada*.tsv", f"{tmp_dir}/*.tsv")
+            )
+            checkpoint_path = Path(tmp_dir) / "checkpoint.json"
+
+            expected_uri = str(Path(tmp_dir) / "expected")
+            self.run_mapping(mapping_path, expected_uri, checkpoint_path)
+
+            output_uri = str(Path(tmp_dir) / "output")
+            checkpointer = self.run_mapping(
+                mapping_path,
+                output_uri,
+                checkpoint_path,
+                limit=150,
+                sources=sources[:3],
+            )
+            self.assertEqual(checkpointer.saved.input_uri, sources[1])
+            self.assertEqual(checkpointer.saved.done, sources[:1])
+
+            # The order of the files is different and there is a new one, done
+            # files are skipped by name regardless
+            self.run_mapping(
+                mapping_path,
+                output_uri,
+                checkpoint_path,
+                resume=True,
+                sources=sources[::-1],
+            )
+            self.assertEqual(
+                sorted(Path(output_uri).read_text().splitlines()),
+                sorted(Path(expected_uri).read_text().splitlines()),
+            )
+
+    def test_unsupported(self):
+        mapping = load_mapping("thebeast/tests/sample/mappings/ru_mayors.yaml")
+        with self.assertRaises(ValueError):
+            # Writes into stdout
+            Checkpointer(
+                Path("checkpoint.json"),
+                ingestor=mapping.ingestor,
+                digestor=mapping.digestor,
+                dumper=mapping.dumper,
+            )
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            mapping = load_mapping(
+                "thebeast/tests/sample/mappings/ru_mayors.yaml",
+                dump_overrides={"output_uri": str(Path(tmp_dir) / "output.jsonl")},
+            )
+            for params in [
+                {"preserve_order": False},
+                {"files_in_workers": True, "range_size": 1 << 20},
+            ]:
+                with self.subTest("Unsupported digestor", params=params):
+                    with self.assertRaises(ValueError):
+                        Checkpointer(
+                            Path(tmp_dir) / "checkpoint.json",
+                            ingestor=mapping.ingestor,
+                            digestor=MultiProcessDigestor(
+                                mapping_config=mapping.digestor.mapping_config,
+                                meta_fields=mapping.digestor.meta_fields,
+                                **params,
+                            ),
+                            dumper=mapping.dumper,
+                        )
+            mapping.dumper.close()
@@ -0,0 +1,69 @@
+import unittest
+
+from followthemoney.types import registry  # type: ignore
+
+from thebeast.contrib.ftm_ext import meta_factory
+from thebeast.contrib.ftm_ext.clean_cache import CleanCache, CLEAN_CACHE
+from thebeast.contrib.ftm_ext.rigged_entity_proxy import StrProxy
+from thebeast.digest.utils import make_entity
+
+
+class CleanCacheTests(unittest.TestCase):
+    def setUp(self):
+        # Reseting the singletone.
+        meta_factory.meta_cls = None
+
+    def test_hits_and_misses(self):
+        cache = CleanCache(maxsize=2)
+
+        self.assertEqual(cache.clean(registry.country, "Ukraine"), "ua")
+        self.assertEqual(cache.clean(registry.country, StrProxy("Ukraine")), "ua")
+        self.assertEqual(cache.clean(registry.date, "2020-01-01"), "2020-01-01")
+        self.assertEqual(cache.cache_info().hits, 1)
+        self.assertEqual(cache.cache_info().misses, 2)
+
+        # Least recently used value is evicted
+        cache.clean(registry.country, "Poland")
+        self.assertEqual(cache.cache_info().currsize, 2)
+        cache.clean(registry.date, "2020-01-01")
+        self.assertEqual(cache.cache_info().misses, 3)
+        cache.clean(registry.country, "Ukraine")
+        self.assertEqual(cache.cache_info().misses, 4)
+
+        # Cached values don't carry the meta of the raw ones
+        for cached in cache._data:
+            self.assertIs(type(cached[1]), str)
+
+        cache.resize(0)
+        self.assertEqual(cache.cache_info().currsize, 0)
+        cache.clean(registry.country, "Ukraine")
+        self.assertEqual(cache.cache_info().currsize, 0)
+
+    def test_proxy_dependent_types(self):
+        cache = CleanCache()
+
+        ua = make_entity("Person")
+        ua.add("country", "ua")
+        gb = make_entity("Person")
+        gb.add("country", "gb")
+
+        self.assertEqual(
+            cache.clean(registry.phone, "0442001020", proxy=ua), "+380442001020"
+        )
+        self.assertIsNone(cache.clean(registry.phone, "0442001020", proxy=gb))
+
+        cache.clean(registry.entity, "foo", proxy=ua)
+        self.assertEqual(cache.cache_info().currsize, 2)
+
+    def test_entity_values(self):
+        CLEAN_CACHE.clear()
+
+        for _ in range(3):
+            entity = make_entity("Person")
+            entity.add("nationality", StrProxy("Ukraine", meta={"locale": "uk"}))
+            value = entity.get("nationality")[0]
+
+            self.assertEqual(value, "ua")
+            self.assertEqual(value._meta.locale, "uk")
+
+        self.assertEqual(CLEAN_CACHE.cache_info().hits, 2)
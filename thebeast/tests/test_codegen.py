@@ -0,0 +1,84 @@
+import unittest
+import tempfile
+from unittest import mock
+from itertools import islice
+from pathlib import Path
+
+from thebeast.types import Record
+from thebeast.digest import SingleProcessDigestor, CodegenDigestor
+from thebeast.digest.codegen import mapping_hash
+from thebeast.tests.utils import load_mapping, serialize_meta
+
+
+class CodegenDigestorTests(unittest.TestCase):
+    def test_identical_output(self):
+        for path, records in [
+            ("thebeast/tests/sample/mappings/optimizer/gb_mps.yaml", None),
+            ("thebeast/tests/sample/mappings/ukrainian_mps.yaml", None),
+            ("thebeast/tests/sample/mappings/ukrainian_edr.yaml", None),
+            (
+                "thebeast/tests/sample/mappings/keys_resolver/entity_keys.yaml",
+                [
+                    Record(payload={"name": "Ющенко", "company": "ВРУ"}),
+                    Record(payload={"name": "Ющенко"}),
+                ],
+            ),
+        ]:
+            for optimize in [False, True]:
+                with self.subTest("Same output", mapping=path, optimize=optimize):
+                    outputs = []
+                    for digestor_cls in [SingleProcessDigestor, CodegenDigestor]:
+                        mapping = load_mapping(path)
+                        digestor = digestor_cls(
+                            mapping_config=mapping.digestor.mapping_config,
+                            meta_fields=mapping.digestor.meta_fields,
+                            optimize=optimize,
+                        )
+
+                        outputs.append(
+                            serialize_meta(
+                                digestor.extract(
+                                    records
+                                    if records is not None
+                                    else islice(mapping.ingestor, 200)
+                                )
+                            )
+                        )
+
+                    self.assertTrue(len(outputs[0]) > 0)
+                    self.assertEqual(outputs[0], outputs[1])
+
+    def test_disk_cache_and_dump(self):
+        mapping = load_mapping("thebeast/tests/sample/mappings/optimizer/gb_mps.yaml")
+        mapping_config = mapping.digestor.mapping_config
+        key = mapping_hash(mapping_config, optimize=True)
+        self.assertNotEqual(key, mapping_hash(mapping_config, optimize=False))
+        # Upgraded code generator never loads the modules of the previous one
+        with mock.patch(
+            "thebeast.digest.codegen.codegen_fingerprint", return_value="upgraded"
+        ):
+            self.assertNotEqual(key, mapping_hash(mapping_config, optimize=True))
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            dump_path = Path(cache_dir) / "dump.py"
+            first = CodegenDigestor(
+                mapping_config=mapping_config,
+                meta_fields=mapping.digestor.meta_fields,
+                cache_dir=cache_dir,
+                dump_source=str(dump_path),
+            )
+
+            self.assertTrue((Path(cache_dir) / f"{key}.py").exists())
+            self.assertEqual(dump_path.read_text(encoding="utf-8"), first.source)
+            self.assertIn("def collection_0(", first.source)
+
+            second = CodegenDigestor(
+                mapping_config=mapping_config,
+                meta_fields=mapping.digestor.meta_fields,
+                cache_dir=cache_dir,
+            )
+            self.assertEqual(first.source, second.source)
+            self.assertEqual(
+                serialize_meta(first.extract(islice(mapping.ingestor, 10))),
+                serialize_meta(second.extract(islice(mapping.ingestor, 10))),
+            )
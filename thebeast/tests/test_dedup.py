@@ -0,0 +1,182 @@
+import unittest
+import csv
+import tempfile
+from itertools import islice
+from pathlib import Path
+from typing import List, Set
+
+from thebeast.conf.incremental import IncrementalRun
+from thebeast.digest import MultiProcessDigestor, SingleProcessDigestor
+from thebeast.dump import StatementsCSVWriter
+from thebeast.dump.dedup import BloomFilter, StatementSet
+from thebeast.tests.utils import digest_fragments, load_mapping, write_mapping
+
+
+class StatementsDedupTests(unittest.TestCase):
+    def setUp(self):
+        self.mapping = load_mapping("thebeast/tests/sample/mappings/ukrainian_mps.yaml")
+        # With the statements meta, so the same values of the different records have
+        # the different statement ids
+        self.fragments = digest_fragments(self.mapping)
+
+    def write(self, output_uri: str, entities, **params) -> StatementsCSVWriter:
+        writer = StatementsCSVWriter(
+            output_uri=output_uri,
+            meta_fields=self.mapping.digestor.meta_fields,
+            **params
+        )
+        writer.write_entities(entities)
+
+        return writer
+
+    def read_rows(self, path: Path) -> List[List[str]]:
+        with path.open() as fp:
+            return list(csv.reader(fp))
+
+    def test_dedup(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self.write(str(Path(tmp_dir) / "full.csv"), self.fragments).close()
+            full: List[List[str]] = self.read_rows(Path(tmp_dir) / "full.csv")
+
+            seen: Set[str] = set()
+            expected: List[List[str]] = [full[0]]
+            for row in full[1:]:
+                if row[0] not in seen:
+                    seen.add(row[0])
+                    expected.append(row)
+            self.assertTrue(len(expected) < len(full))
+
+            for params in [
+                {},
+                # Exact set on disk only
+                {"dedup_bloom_capacity": 0},
+                {"dedup_bloom_capacity": 1000000},
+                # Overfilled filter reports most of the statements as seen
+                {"dedup_bloom_capacity": 100},
+            ]:
+                with self.subTest("Deduplicated statements", **params):
+                    output: Path = Path(tmp_dir) / "dedup.csv"
+                    writer = self.write(
+                        str(output), self.fragments[:1000], dedup=True, **params
+                    )
+                    writer.write_entities(self.fragments[1000:])
+                    info = writer.dedup_info()
+                    writer.close()
+
+                    self.assertEqual(self.read_rows(output), expected)
+                    self.assertEqual(info.statements, len(full) - 1)
+                    self.assertEqual(info.duplicates, len(full) - len(expected))
+                    if params.get("dedup_bloom_capacity") == 1000000:
+                        # Only the duplicates (and rare false positives) hit the disk
+                        self.assertTrue(info.lookups < len(expected))
+
+    def test_dedup_path(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output: Path = Path(tmp_dir) / "dedup.csv"
+            dedup_path: str = str(Path(tmp_dir) / "statements.sqlite")
+            half: int = len(self.fragments) // 2
+
+            self.write(
+                str(output), self.fragments[:half], dedup=True, dedup_path=dedup_path
+            ).close()
+            first: List[List[str]] = self.read_rows(output)
+
+            # Statements written by the previous run are skipped
+            writer = self.write(
+                str(output),
+                self.fragments,
+                append=True,
+                dedup=True,
+                dedup_path=dedup_path,
+                dedup_bloom_capacity=100000,
+            )
+            self.assertEqual(writer.params()["dedup_path"], dedup_path)
+            writer.close()
+
+            rows: List[List[str]] = self.read_rows(output)
+            self.assertEqual(rows[: len(first)], first)
+            ids: List[str] = [row[0] for row in rows[1:]]
+            self.assertEqual(len(ids), len(set(ids)))
+
+            shard = StatementsCSVWriter.make_shard(writer.params(), 1)
+            self.assertEqual(
+                shard.dedup_path, str(Path(tmp_dir) / "statements-shard00001.sqlite")
+            )
+            shard.close()
+
+    def test_write_in_workers(self):
+        mapping = load_mapping(
+            "thebeast/tests/sample/mappings/ukrainian_mps_multiprocess.yaml"
+        )
+        # Same records read by the different workers produce the same statements
+        records = list(islice(mapping.ingestor, 100)) * 2
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            single: Path = Path(tmp_dir) / "single.csv"
+            writer = self.write(
+                str(single),
+                SingleProcessDigestor(
+                    mapping_config=mapping.digestor.mapping_config,
+                    meta_fields=mapping.digestor.meta_fields,
+                ).extract(records),
+                dedup=True,
+            )
+            writer.close()
+
+            multi: Path = Path(tmp_dir) / "multi.csv"
+            writer = StatementsCSVWriter(
+                output_uri=str(multi),
+                meta_fields=mapping.digestor.meta_fields,
+                dedup=True,
+            )
+            MultiProcessDigestor(
+                mapping_config=mapping.digestor.mapping_config,
+                meta_fields=mapping.digestor.meta_fields,
+                processes=2,
+                batch_size=50,
+                write_in_workers=True,
+            ).dump(records, writer)
+            writer.close()
+
+            # Statements written by the different workers (and by the parent) are
+            # deduplicated once the shards are merged
+            rows: List[List[str]] = self.read_rows(multi)
+            ids: List[str] = [row[0] for row in rows[1:]]
+            self.assertEqual(len(ids), len(set(ids)))
+            self.assertEqual(sorted(rows[1:]), sorted(self.read_rows(single)[1:]))
+
+    def test_incremental(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            mapping_path: Path = write_mapping(
+                "thebeast/tests/sample/mappings/ukrainian_mps.yaml",
+                tmp_dir,
+                "thebeast.dump.StatementsCSVWriter",
+            )
+
+            mapping = load_mapping(
+                mapping_path,
+                dump_overrides={
+                    "output_uri": str(Path(tmp_dir) / "output.csv"),
+                    "dedup": True,
+                },
+            )
+
+            # Output is assembled from the parts, each written by its own dumper
+            with self.assertRaises(ValueError):
+                IncrementalRun(Path(tmp_dir) / "state", mapping)
+            mapping.dumper.close()
+
+    def test_statement_set(self):
+        bloom = BloomFilter(1000)
+        self.assertFalse(bloom.add("foo"))
+        self.assertTrue(bloom.add("foo"))
+
+        statements = StatementSet(bloom_capacity=10, batch_size=2)
+        self.assertEqual(
+            [statements.add(key) for key in ["a", "b", "c", "a", "b", "d", "c"]],
+            [True, True, True, False, False, True, False],
+        )
+        self.assertEqual(statements.info()[:2], (7, 3))
+        path: str = statements.path
+        statements.close()
+        self.assertFalse(Path(path).exists())
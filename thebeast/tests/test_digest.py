@@ -8,6 +8,7 @@ from followthemoney.schema import Schema  # type: ignore
 from thebeast.types import Record
 from thebeast.conf.mapping import SourceMapping
 from thebeast.contrib.ftm_ext import meta_factory
+from thebeast.digest import SingleProcessDigestor
 
 
 class MappingDigestTests(unittest.TestCase):
@@ -324,3 +325,44 @@ class MappingDigestTests(unittest.TestCase):
                         # so we are checking that those aren't populated in the results
                         for meta_field in meta_factory.DEFAULT_META_FIELDS:
                             self.assertNotIn(meta_field, prop._meta._fields)
+
+    def test_parse_in_workers(self):
+        for path in [
+            Path("thebeast/tests/sample/mappings/ukrainian_mps_multiprocess.yaml"),
+            Path("thebeast/tests/sample/mappings/ru_mayors_multiprocess.yaml"),
+        ]:
+            with self.subTest("Same output", mapping=path):
+                mapping = SourceMapping(path)
+                digestor = mapping.digestor.__class__(
+                    mapping_config=mapping.digestor.mapping_config,
+                    meta_fields=mapping.digestor.meta_fields,
+                    processes=2,
+                    batch_size=50,
+                    parse_in_workers=True,
+                )
+                single_digestor = SingleProcessDigestor(
+                    mapping_config=mapping.digestor.mapping_config,
+                    meta_fields=mapping.digestor.meta_fields,
+                )
+
+                outputs = [
+                    [
+                        (
+                            entity.valid,
+                            json.dumps(entity.payload, sort_keys=True),
+                            [
+                                value._meta
+                                for values in entity.payload["properties"].values()
+                                for value in values
+                            ],
+                        )
+                        for entity in entities
+                    ]
+                    for entities in [
+                        digestor.extract(mapping.ingestor),
+                        single_digestor.extract(list(mapping.ingestor)),
+                    ]
+                ]
+
+                self.assertTrue(len(outputs[0]) > 0)
+                self.assertEqual(outputs[0], outputs[1])
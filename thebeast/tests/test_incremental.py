@@ -0,0 +1,135 @@
+import unittest
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional
+
+from thebeast.conf.mapping import SourceMapping
+from thebeast.conf.incremental import IncrementalRun
+from thebeast.ingest import TSVDictGlobReader
+from thebeast.tests.utils import load_mapping
+
+
+class IncrementalRunTests(unittest.TestCase):
+    def make_mapping(
+        self, mapping_path: Path, tmp_dir: str, error_uri: Optional[str] = None
+    ) -> SourceMapping:
+        dump_overrides: Dict[str, str] = {"output_uri": str(Path(tmp_dir) / "out")}
+        if error_uri is not None:
+            dump_overrides["error_uri"] = error_uri
+
+        return load_mapping(
+            mapping_path,
+            ingest_overrides={"input_uri": str(Path(tmp_dir) / "*.tsv")},
+            dump_overrides=dump_overrides,
+        )
+
+    def full_run(self, mapping_path: Path, tmp_dir: str) -> str:
+        mapping = self.make_mapping(mapping_path, tmp_dir)
+        mapping.dumper.write_entities(mapping.digestor.extract(mapping.ingestor))
+        mapping.dumper.close()
+
+        return (Path(tmp_dir) / "out").read_text()
+
+    def incremental_run(
+        self, mapping_path: Path, tmp_dir: str, error_uri: Optional[str] = None
+    ) -> Dict[str, int]:
+        mapping = self.make_mapping(mapping_path, tmp_dir, error_uri)
+        stats = IncrementalRun(Path(tmp_dir) / "state", mapping).run()
+        mapping.dumper.close()
+
+        return stats
+
+    def test_incremental(self):
+        for dumper_cls in [
+            "thebeast.dump.FTMLinesWriter",
+            "thebeast.dump.StatementsCSVWriter",
+        ]:
+            with self.subTest(
+                "Incremental run", dumper=dumper_cls
+            ), tempfile.TemporaryDirectory() as tmp_dir:
+                mapping_path = Path(tmp_dir) / "mapping.yaml"
+                mapping_path.write_text(
+                    Path("thebeast/tests/sample/mappings/ukrainian_mps.yaml")
+                    .read_text()
+                    .replace("thebeast.dump.FTMLinesWriter", dumper_cls)
+                )
+
+                for name in ["rada4.tsv", "rada5.tsv"]:
+                    chunk = next(
+                        TSVDictGlobReader(
+                            input_uri=f"thebeast/tests/sample/csv/{name}"
+                        ).raw_chunks(30)
+                    )
+                    (Path(tmp_dir) / name).write_text(
+                        chunk.preamble + "".join(chunk.payload)
+                    )
+
+                expected: str = self.full_run(mapping_path, tmp_dir)
+                for expected_stats in [
+                    {"digested": 2, "reused": 0, "removed": 0},
+                    {"digested": 0, "reused": 2, "removed": 0},
+                ]:
+                    self.assertEqual(
+                        self.incremental_run(mapping_path, tmp_dir), expected_stats
+                    )
+                    self.assertEqual((Path(tmp_dir) / "out").read_text(), expected)
+
+                # One of the files has changed
+                changed: Path = Path(tmp_dir) / "rada5.tsv"
+                changed.write_text("".join(changed.read_text().splitlines(True)[:-5]))
+                expected = self.full_run(mapping_path, tmp_dir)
+                self.assertEqual(
+                    self.incremental_run(mapping_path, tmp_dir),
+                    {"digested": 1, "reused": 1, "removed": 0},
+                )
+                self.assertEqual((Path(tmp_dir) / "out").read_text(), expected)
+
+                # And the other one is gone
+                (Path(tmp_dir) / "rada4.tsv").unlink()
+                expected = self.full_run(mapping_path, tmp_dir)
+                self.assertEqual(
+                    self.incremental_run(mapping_path, tmp_dir),
+                    {"digested": 0, "reused": 1, "removed": 1},
+                )
+                self.assertEqual((Path(tmp_dir) / "out").read_text(), expected)
+                self.assertEqual(
+                    len(list((Path(tmp_dir) / "state/parts").iterdir())), 1
+                )
+
+                # Mapping has changed, so nothing is reused
+                self.assertEqual(
+                    self.incremental_run(
+                        mapping_path, tmp_dir, error_uri=str(Path(tmp_dir) / "out")
+                    ),
+                    {"digested": 1, "reused": 0, "removed": 0},
+                )
+
+    def test_fingerprint(self):
+        fingerprints = [
+            load_mapping(
+                "thebeast/tests/sample/mappings/ukrainian_mps.yaml",
+                ingest_overrides=ingest_overrides,
+                dump_overrides=dump_overrides,
+            ).fingerprint
+            for ingest_overrides, dump_overrides in [
+                ({}, {}),
+                ({"input_uri": "rada.tsv"}, {"output_uri": "/dev/null"}),
+                ({}, {"error_uri": "/dev/stderr"}),
+            ]
+        ]
+
+        # Location of the input and the output doesn't change the entities
+        self.assertEqual(fingerprints[0], fingerprints[1])
+        self.assertNotEqual(fingerprints[0], fingerprints[2])
+
+        ingestor = TSVDictGlobReader(input_uri="thebeast/tests/sample/csv/rada4.tsv")
+        self.assertTrue(
+            ingestor.source_fingerprint(
+                "thebeast/tests/sample/csv/rada4.tsv"
+            ).startswith("stat:")
+        )
+        self.assertTrue(
+            ingestor.source_fingerprint(
+                "thebeast/tests/sample/csv/rada4.tsv", content=True
+            ).startswith("sha256:")
+        )
@@ -1,4 +1,7 @@
 import unittest
+import tempfile
+from pathlib import Path
+
 from thebeast.ingest import (
     CSVDictReader,
     TSVDictGlobReader,
@@ -116,3 +119,156 @@ class JSONReadersTests(unittest.TestCase):
         self.assertEqual(
             items[0].input_uri, "thebeast/tests/sample/json/bank_ceos.json"
         )
+
+
+class RawChunksTests(unittest.TestCase):
+    def assertSameRecords(self, ingestor, chunk_size):
+        chunks = list(ingestor.raw_chunks(chunk_size))
+        self.assertTrue(all(len(chunk.payload) <= chunk_size for chunk in chunks))
+
+        self.assertEqual(
+            list(ingestor),
+            [record for chunk in chunks for record in ingestor.parse_chunk(chunk)],
+        )
+
+    def test_raw_chunks(self):
+        for ingestor in [
+            CSVDictReader(input_uri="thebeast/tests/sample/csv/gb_mps.csv"),
+            TSVDictGlobReader(input_uri="thebeast/tests/sample/csv/rada*.tsv"),
+            JSONLinesGlobReader(input_uri="thebeast/tests/sample/json/ru_mayors.jsonl"),
+        ]:
+            for chunk_size in [1, 7, 1000]:
+                with self.subTest(
+                    "Same records", uri=ingestor.input_uri, chunk_size=chunk_size
+                ):
+                    self.assertSameRecords(ingestor, chunk_size)
+
+    def test_raw_multiline_csv(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "multiline.csv"
+            path.write_text(
+                'name,"multiline\nheader"\n'
+                '"Ivan ""Sraka""",1\n'
+                "\n"
+                'Petro,"first\n\nsecond, ""third""\n"\n'
+                "Vasyl,2\n"
+            )
+
+            ingestor = CSVDictReader(input_uri=str(path))
+            items = list(ingestor)
+            self.assertEqual(len(items), 3)
+            self.assertEqual(
+                items[1].payload["multiline\nheader"], 'first\n\nsecond, "third"\n'
+            )
+
+            for chunk_size in [1, 2]:
+                with self.subTest("Same records", chunk_size=chunk_size):
+                    self.assertSameRecords(ingestor, chunk_size)
+
+    def test_unsupported(self):
+        self.assertFalse(
+            JSONGlobReader(
+                input_uri="thebeast/tests/sample/json/bank_ceos.json"
+            ).supports_raw
+        )
+
+
+class ByteRangesTests(unittest.TestCase):
+    def assertSameRecords(self, ingestor, file_uri, range_size):
+        ranges = list(ingestor.byte_ranges(file_uri, range_size))
+
+        # Ranges are contiguous
+        for prev, byte_range in zip(ranges, ranges[1:]):
+            self.assertEqual(prev.end, byte_range.start)
+
+        self.assertEqual(
+            list(ingestor.iterate_file(file_uri)),
+            [
+                record
+                for byte_range in ranges
+                for record in ingestor.iterate_range(byte_range)
+            ],
+        )
+
+        return ranges
+
+    def test_byte_ranges(self):
+        for ingestor, file_uri in [
+            (
+                CSVDictReader(input_uri="thebeast/tests/sample/csv/gb_mps.csv"),
+                "thebeast/tests/sample/csv/gb_mps.csv",
+            ),
+            (
+                TSVDictGlobReader(input_uri="thebeast/tests/sample/csv/rada*.tsv"),
+                "thebeast/tests/sample/csv/rada4.tsv",
+            ),
+            (
+                JSONLinesGlobReader(
+                    input_uri="thebeast/tests/sample/json/ru_mayors.jsonl"
+                ),
+                "thebeast/tests/sample/json/ru_mayors.jsonl",
+            ),
+        ]:
+            self.assertTrue(ingestor.splittable(file_uri))
+
+            for range_size in [1, 5000, 10**9]:
+                with self.subTest("Same records", uri=file_uri, range_size=range_size):
+                    ranges = self.assertSameRecords(ingestor, file_uri, range_size)
+                    if range_size == 10**9:
+                        self.assertEqual(len(ranges), 1)
+
+    def test_multiline_csv(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "multiline.csv"
+            path.write_bytes(
+                'name,"multiline\r\nheader"\r\n'
+                '"Іван ""Срака""",1\r\n'
+                "\r\n"
+                'Petro,"first\r\n\r\nsecond, ""third""\r\n"\r\n'
+                "Vasyl,2".encode("utf-8")
+            )
+
+            ingestor = CSVDictReader(input_uri=str(path))
+            for range_size in [1, 2, 30]:
+                with self.subTest("Same records", range_size=range_size):
+                    self.assertSameRecords(ingestor, str(path), range_size)
+
+            ranges = list(ingestor.byte_ranges(str(path), 1))
+            self.assertEqual([byte_range.record_no for byte_range in ranges], [0, 1, 2])
+
+    def test_line_endings(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "old_mac.csv"
+            # Bare \r breaks the lines in the text mode, just like \n and \r\n
+            path.write_bytes(
+                b'name,number\rIvan,1\rPetro,"2\r\n3"\r\nVasyl,4\n\rMykola,5\r'
+            )
+
+            ingestor = CSVDictReader(input_uri=str(path))
+            self.assertEqual(len(list(ingestor.iterate_file(str(path)))), 4)
+            for range_size in [1, 10, 1000]:
+                with self.subTest("Same records", range_size=range_size):
+                    self.assertSameRecords(ingestor, str(path), range_size)
+
+            ranges = list(ingestor.byte_ranges(str(path), 1))
+            self.assertEqual(
+                [byte_range.record_no for byte_range in ranges], [0, 1, 2, 3]
+            )
+
+    def test_not_splittable(self):
+        self.assertFalse(
+            JSONGlobReader(
+                input_uri="thebeast/tests/sample/json/bank_ceos.json"
+            ).splittable("thebeast/tests/sample/json/bank_ceos.json")
+        )
+        self.assertFalse(
+            JSONLinesGlobReader(input_uri="foo.jsonl.gz").splittable("foo.jsonl.gz")
+        )
+
+        # Line breaks of utf-16 are not the same bytes as in ascii
+        self.assertFalse(
+            CSVDictReader(
+                input_uri="thebeast/tests/sample/csv/gb_mps.csv",
+                input_encoding="utf-16",
+            ).splittable("thebeast/tests/sample/csv/gb_mps.csv")
+        )
@@ -0,0 +1,35 @@
+import unittest
+from itertools import islice
+
+from thebeast.digest import SingleProcessDigestor, SubinterpreterDigestor
+from thebeast.digest.interpreters import SUBINTERPRETERS_AVAILABLE
+from thebeast.tests.utils import load_mapping, serialize
+
+
+class SubinterpreterDigestorTests(unittest.TestCase):
+    @unittest.skipIf(SUBINTERPRETERS_AVAILABLE, "Subinterpreters are available")
+    def test_unavailable(self):
+        with self.assertRaises(RuntimeError):
+            SubinterpreterDigestor(mapping_config={"collections": {}}, meta_fields=[])
+
+    @unittest.skipUnless(SUBINTERPRETERS_AVAILABLE, "Requires python 3.14+")
+    def test_same_output(self):
+        mapping = load_mapping("thebeast/tests/sample/mappings/ukrainian_edr.yaml")
+        records = list(islice(mapping.ingestor, 200))
+
+        expected = serialize(
+            SingleProcessDigestor(
+                mapping_config=mapping.digestor.mapping_config,
+                meta_fields=mapping.digestor.meta_fields,
+            ).extract(records)
+        )
+
+        output = serialize(
+            SubinterpreterDigestor(
+                mapping_config=mapping.digestor.mapping_config,
+                meta_fields=mapping.digestor.meta_fields,
+                interpreters=2,
+                batch_size=10,
+            ).extract(records)
+        )
+        self.assertEqual(output, expected)
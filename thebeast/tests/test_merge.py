@@ -0,0 +1,174 @@
+import unittest
+from collections import defaultdict
+from typing import Dict, List, Set
+
+from thebeast.digest.merge import EntityMerger, merge_all, merge_fragments
+from thebeast.types import RedGreenEntity
+from thebeast.tests.utils import load_mapping, serialize_provenance
+
+
+class EntityMergerTests(unittest.TestCase):
+    def setUp(self):
+        mapping = load_mapping("thebeast/tests/sample/mappings/ukrainian_mps.yaml")
+        self.fragments = list(mapping.digestor.extract(mapping.ingestor))
+
+    def test_merge(self):
+        merger = EntityMerger()
+        merged = list(merger.merge(self.fragments))
+
+        ids: List[str] = [entity.payload["id"] for entity in merged]
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(
+            ids, list(dict.fromkeys(entity.payload["id"] for entity in self.fragments))
+        )
+        self.assertTrue(len(merged) < len(self.fragments))
+        self.assertEqual(merger.info(), (len(self.fragments), len(merged), 0))
+
+        values: Dict[str, Set] = defaultdict(set)
+        for entity in self.fragments:
+            for prop, prop_values in entity.payload["properties"].items():
+                values[entity.payload["id"]].update((prop, v) for v in prop_values)
+
+        for entity in merged:
+            self.assertEqual(
+                {
+                    (prop, value)
+                    for prop, prop_values in entity.payload["properties"].items()
+                    for value in prop_values
+                },
+                values[entity.payload["id"]],
+            )
+
+    def test_eviction(self):
+        complete: Dict[str, RedGreenEntity] = {
+            entity.payload["id"]: entity
+            for entity in EntityMerger().merge(self.fragments)
+        }
+        consumed: List[RedGreenEntity] = []
+
+        def fragments():
+            for entity in self.fragments:
+                consumed.append(entity)
+                yield entity
+
+        merger = EntityMerger(max_entities=100)
+        merged = merger.merge(fragments())
+
+        # Output is streamed, the least recently updated entities are yielded first
+        next(merged)
+        self.assertTrue(len(consumed) < len(self.fragments))
+        merged = list(merged)
+
+        info = merger.info()
+        self.assertTrue(info.evictions > 0)
+        self.assertEqual(info.entities, len(merged) + 1)
+        self.assertTrue(info.entities > len(complete))
+
+        # Partially merged entities add up to the complete ones
+        parts: Dict[str, List[RedGreenEntity]] = defaultdict(list)
+        for entity in EntityMerger(max_entities=100).merge(self.fragments):
+            parts[entity.payload["id"]].append(entity)
+
+        self.assertEqual(set(parts), set(complete))
+        for entity_id, entities in parts.items():
+            self.assertEqual(
+                serialize_provenance([merge_all(entities)], valid=True),
+                serialize_provenance([complete[entity_id]], valid=True),
+            )
+
+    def test_invalid_fragments(self):
+        mapping_path: str = "thebeast/tests/sample/mappings/fragments.yaml"
+
+        # Invalid entities are thrown away by the dumper, so are skipped by the digest
+        mapping = load_mapping(mapping_path)
+        self.assertTrue(mapping.dumper.discards_invalid)
+        merged = list(EntityMerger().merge(mapping.digestor.extract(mapping.ingestor)))
+        self.assertFalse(
+            any("birthDate" in entity.payload["properties"] for entity in merged)
+        )
+
+        # Unless those are merged, as birthDate alone is completed by the name
+        mapping = load_mapping(mapping_path, merge_entities=True)
+        merged = list(EntityMerger().merge(mapping.digestor.extract(mapping.ingestor)))
+        self.assertEqual(len(merged), 67)
+        for entity in merged:
+            self.assertTrue(entity.valid)
+            self.assertEqual(set(entity.payload["properties"]), {"name", "birthDate"})
+
+    def test_merge_fragments(self):
+        company = RedGreenEntity(
+            payload={
+                "id": "foo",
+                "schema": "Company",
+                "properties": {"name": ["Foo"], "country": ["ua"]},
+            },
+            valid=True,
+        )
+        legal_entity = RedGreenEntity(
+            payload={
+                "id": "foo",
+                "schema": "LegalEntity",
+                "properties": {"name": ["Foo", "Foo LLC"]},
+            },
+            valid=True,
+        )
+
+        merged = merge_fragments(legal_entity, company)
+        self.assertEqual(merged.payload["schema"], "Company")
+        self.assertEqual(
+            merged.payload["properties"],
+            {"name": ["Foo", "Foo LLC"], "country": ["ua"]},
+        )
+        self.assertTrue(merged.valid)
+
+        # Fragment without the required name is completed by the other one
+        nameless = RedGreenEntity(
+            payload={
+                "id": "foo",
+                "schema": "Company",
+                "properties": {"country": ["ua"]},
+            },
+            valid=False,
+        )
+        self.assertTrue(merge_fragments(nameless, company).valid)
+
+        # Unrelated schemas are not merged
+        person = RedGreenEntity(
+            payload={"id": "foo", "schema": "Person", "properties": {"name": ["Bar"]}},
+            valid=True,
+        )
+        self.assertEqual(merge_fragments(company, person), company)
+
+    def test_many_fragments(self):
+        fragments = [
+            RedGreenEntity(
+                payload={
+                    "id": "foo",
+                    "schema": "Company",
+                    "properties": {"name": ["Foo", f"Foo {idx % 500}"]},
+                },
+                valid=True,
+            )
+            for idx in range(2000)
+        ]
+        # Without the name the first fragment is invalid, merged entity is not
+        fragments.insert(
+            0,
+            RedGreenEntity(
+                payload={"id": "foo", "schema": "Company", "properties": {}},
+                valid=False,
+            ),
+        )
+
+        merged = list(EntityMerger().merge(fragments))
+        self.assertEqual(len(merged), 1)
+        self.assertTrue(merged[0].valid)
+        self.assertEqual(
+            merged[0].payload["properties"]["name"],
+            ["Foo"] + [f"Foo {idx}" for idx in range(500)],
+        )
+        self.assertEqual(merge_all(fragments, keep_meta=False), merged[0])
+
+        # Fragments themselves are not changed
+        self.assertEqual(fragments[0].payload["properties"], {})
+        self.assertEqual(fragments[1].payload["properties"]["name"], ["Foo", "Foo 0"])
@@ -0,0 +1,69 @@
+import unittest
+import json
+from itertools import islice
+
+from thebeast.contrib.ftm_ext import meta_factory
+from thebeast.contrib.ftm_ext.rigged_entity_proxy import StrProxy
+from thebeast.digest import SingleProcessDigestor, CodegenDigestor
+from thebeast.tests.utils import load_mapping
+
+
+class MetaFreeTests(unittest.TestCase):
+    def test_detection(self):
+        mapping = load_mapping("thebeast/tests/sample/mappings/optimizer/gb_mps.yaml")
+        self.assertTrue(mapping.digestor.meta_free)
+
+        # Explicit param wins
+        mapping = load_mapping("thebeast/tests/sample/mappings/ukrainian_mps.yaml")
+        self.assertFalse(mapping.digestor.meta_free)
+
+    def test_identical_output(self):
+        for path in [
+            "thebeast/tests/sample/mappings/optimizer/gb_mps.yaml",
+            "thebeast/tests/sample/mappings/ukrainian_mps.yaml",
+            "thebeast/tests/sample/mappings/ukrainian_edr.yaml",
+        ]:
+            for digestor_cls in [SingleProcessDigestor, CodegenDigestor]:
+                with self.subTest("Same output", mapping=path, cls=digestor_cls):
+                    outputs = []
+                    for meta_free in [False, True]:
+                        mapping = load_mapping(path)
+                        digestor = digestor_cls(
+                            mapping_config=mapping.digestor.mapping_config,
+                            meta_fields=mapping.digestor.meta_fields,
+                            meta_free=meta_free,
+                        )
+
+                        outputs.append(
+                            [
+                                (
+                                    entity.valid,
+                                    json.dumps(
+                                        entity.payload,
+                                        sort_keys=True,
+                                        ensure_ascii=False,
+                                    ),
+                                )
+                                for entity in digestor.extract(
+                                    islice(mapping.ingestor, 200)
+                                )
+                            ]
+                        )
+
+                        # Mode is switched off once the digest is over
+                        self.assertFalse(meta_factory.settings.meta_free)
+
+                    self.assertTrue(len(outputs[0]) > 0)
+                    self.assertEqual(outputs[0], outputs[1])
+
+    def test_values_share_empty_meta(self):
+        meta_factory.set_meta_free(True)
+        try:
+            value = StrProxy("foo", meta={"locale": "uk"})
+            self.assertIsNone(value._meta.locale)
+            self.assertIs(value._meta, StrProxy("bar")._meta)
+            self.assertIs(value.inject_meta_to_str("baz")._meta, value._meta)
+        finally:
+            meta_factory.set_meta_free(False)
+
+        self.assertEqual(StrProxy("foo", meta={"locale": "uk"})._meta.locale, "uk")
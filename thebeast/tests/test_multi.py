@@ -0,0 +1,371 @@
+import unittest
+import json
+import pickle
+import time
+import threading
+import tempfile
+from itertools import islice, chain
+from pathlib import Path
+from typing import List
+
+from thebeast.types import Record, RedGreenEntity
+from thebeast.digest import SingleProcessDigestor, MultiProcessDigestor
+from thebeast.dump import FTMLinesWriter, StatementsCSVWriter
+from thebeast.ingest import TSVDictGlobReader
+from thebeast.dump.abstract import shard_uri
+from thebeast.digest.multi import BatchResult, Window, reorder
+from thebeast.digest.utils import pack_entities, unpack_entities
+from thebeast.tests.utils import load_mapping, serialize, serialize_provenance
+
+
+class MultiProcessDigestorTests(unittest.TestCase):
+    def read_lines(self, path: Path) -> List[str]:
+        return path.read_text().splitlines()
+
+    def test_shard_uri(self):
+        self.assertEqual(
+            shard_uri("s3://bucket/out.jsonl.gz", 3),
+            "s3://bucket/out-shard00003.jsonl.gz",
+        )
+        self.assertEqual(shard_uri("out", 12), "out-shard00012")
+        self.assertEqual(shard_uri("/dev/null", 1), "/dev/null")
+
+        with self.assertRaises(ValueError):
+            shard_uri("/dev/stdout", 1)
+
+    def test_packed_entities(self):
+        mapping = load_mapping("thebeast/tests/sample/mappings/ukrainian_edr.yaml")
+        with open("thebeast/tests/sample/json/edr_sample.json", "r") as fp_in:
+            records = [
+                Record(payload=rec, input_uri="edr_sample.json", record_no=i)
+                for i, rec in enumerate(json.load(fp_in))
+            ]
+
+        entities = list(mapping.digestor.extract(records))
+        metas = [
+            [value._meta for value in values]
+            for entity in entities
+            for values in entity.payload["properties"].values()
+        ]
+        packed = pack_entities(entities)
+
+        # Meta is sent once per batch
+        self.assertEqual(len(packed[0]), len(set(sum(metas, []))))
+
+        restored = unpack_entities(pickle.loads(pickle.dumps(packed)))
+        self.assertEqual(restored, entities)
+        self.assertEqual(
+            [
+                [value._meta for value in values]
+                for entity in restored
+                for values in entity.payload["properties"].values()
+            ],
+            metas,
+        )
+        self.assertEqual(
+            [list(entity.payload) for entity in restored],
+            [list(entity.payload) for entity in entities],
+        )
+
+        # Plain values stay plain
+        plain = RedGreenEntity(
+            payload={"id": "1", "schema": "Person", "properties": {"name": ["foo"]}},
+            valid=True,
+        )
+        restored = unpack_entities(pack_entities([plain]))
+        self.assertEqual(restored, [plain])
+        self.assertIs(type(restored[0].payload["properties"]["name"][0]), str)
+
+    def test_reorder(self):
+        results = [
+            BatchResult(seq=seq, shard=None, count=1, entities=[seq])
+            for seq in [2, 0, 1, 4, 3, 5]
+        ]
+
+        self.assertEqual(
+            [result.seq for result in reorder(results)], [0, 1, 2, 3, 4, 5]
+        )
+
+    def test_window(self):
+        window = Window(max_in_flight=2, max_pending=3)
+        fed = []
+
+        def feed():
+            for item in window.feed(range(10)):
+                fed.append(item)
+
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+
+        # Ingest is blocked once two batches are in flight
+        feeder.join(0.2)
+        self.assertEqual(fed, [0, 1])
+        self.assertEqual(window.stats().in_flight, 2)
+
+        # Received, but not released batches are still pending
+        list(window.receive([None, None]))
+        feeder.join(0.2)
+        self.assertEqual(fed, [0, 1, 2])
+        self.assertEqual(window.stats().pending, 3)
+
+        for _ in range(3):
+            window.release()
+        feeder.join(0.2)
+        self.assertEqual(fed, [0, 1, 2, 3])
+
+        window.close()
+        feeder.join(1)
+        self.assertFalse(feeder.is_alive())
+
+        stats = window.stats()
+        self.assertEqual(stats.peak_in_flight, 2)
+        self.assertTrue(stats.blocked >= 3)
+
+    def test_bounded_input(self):
+        mapping = load_mapping(
+            "thebeast/tests/sample/mappings/ukrainian_mps_multiprocess.yaml"
+        )
+        digestor = MultiProcessDigestor(
+            mapping_config=mapping.digestor.mapping_config,
+            meta_fields=mapping.digestor.meta_fields,
+            processes=2,
+            batch_size=10,
+            preserve_order=False,
+            max_in_flight=3,
+        )
+
+        consumed = []
+
+        def records():
+            for record in mapping.ingestor:
+                consumed.append(record)
+                yield record
+
+        entities = digestor.extract(records())
+        next(entities)
+        time.sleep(0.5)
+
+        # Only the batches in flight are read from the input
+        self.assertTrue(len(consumed) <= 4 * digestor.batch_size)
+        self.assertTrue(digestor.queue_stats().in_flight <= 3)
+
+        list(entities)
+        stats = digestor.queue_stats()
+        self.assertEqual(stats.in_flight, 0)
+        self.assertEqual(stats.peak_in_flight, 3)
+
+    def test_preserve_order(self):
+        mapping = load_mapping(
+            "thebeast/tests/sample/mappings/ukrainian_edr_multiprocess.yaml"
+        )
+        with open("thebeast/tests/sample/json/edr_sample.json", "r") as fp_in:
+            records = [
+                Record(payload=rec, input_uri="edr_sample.json", record_no=i)
+                for i, rec in enumerate(json.load(fp_in))
+            ] * 20
+
+        expected = serialize(
+            SingleProcessDigestor(
+                mapping_config=mapping.digestor.mapping_config,
+                meta_fields=mapping.digestor.meta_fields,
+            ).extract(records)
+        )
+
+        for preserve_order in [True, False]:
+            with self.subTest("Same output", preserve_order=preserve_order):
+                output = serialize(
+                    MultiProcessDigestor(
+                        mapping_config=mapping.digestor.mapping_config,
+                        meta_fields=mapping.digestor.meta_fields,
+                        processes=3,
+                        batch_size=3,
+                        preserve_order=preserve_order,
+                        reorder_buffer=2,
+                    ).extract(records)
+                )
+
+                if preserve_order:
+                    self.assertEqual(output, expected)
+                else:
+                    self.assertEqual(sorted(output), sorted(expected))
+
+    def test_write_in_workers(self):
+        mapping = load_mapping(
+            "thebeast/tests/sample/mappings/ukrainian_mps_multiprocess.yaml"
+        )
+        records = list(islice(mapping.ingestor, 200))
+
+        for dumper_cls in [FTMLinesWriter, StatementsCSVWriter]:
+            for merge_shards in [True, False]:
+                with self.subTest(
+                    "Same output", dumper_cls=dumper_cls, merge_shards=merge_shards
+                ), tempfile.TemporaryDirectory() as tmp_dir:
+                    single_path = Path(tmp_dir) / "single.txt"
+                    dumper = dumper_cls(
+                        output_uri=str(single_path),
+                        meta_fields=mapping.digestor.meta_fields,
+                    )
+                    dumper.write_entities(
+                        SingleProcessDigestor(
+                            mapping_config=mapping.digestor.mapping_config,
+                            meta_fields=mapping.digestor.meta_fields,
+                        ).extract(records)
+                    )
+                    dumper.close()
+
+                    multi_path = Path(tmp_dir) / "multi.txt"
+                    dumper = dumper_cls(
+                        output_uri=str(multi_path),
+                        meta_fields=mapping.digestor.meta_fields,
+                    )
+                    written = MultiProcessDigestor(
+                        mapping_config=mapping.digestor.mapping_config,
+                        meta_fields=mapping.digestor.meta_fields,
+                        processes=2,
+                        batch_size=50,
+                        write_in_workers=True,
+                        merge_shards=merge_shards,
+                    ).dump(records, dumper)
+                    dumper.close()
+
+                    shards = sorted(Path(tmp_dir).glob("multi-shard*.txt"))
+                    lines = self.read_lines(multi_path)
+                    if merge_shards:
+                        self.assertEqual(shards, [])
+                    else:
+                        self.assertEqual(
+                            sorted(written),
+                            sorted([str(multi_path)] + [str(path) for path in shards]),
+                        )
+                        for shard in shards:
+                            lines += self.read_lines(shard)[dumper.header_lines :]
+
+                    # Constant entities and at least one shard per worker
+                    self.assertTrue(len(written) > 1)
+                    if dumper_cls is FTMLinesWriter:
+                        self.assertEqual(len(lines), sum(written.values()))
+
+                    self.assertEqual(
+                        sorted(lines), sorted(self.read_lines(single_path))
+                    )
+
+    def test_files_in_workers(self):
+        mapping = load_mapping(
+            "thebeast/tests/sample/mappings/ukrainian_mps_multiprocess.yaml"
+        )
+        chunks = TSVDictGlobReader(
+            input_uri="thebeast/tests/sample/csv/rada4.tsv"
+        ).raw_chunks(25)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # Files of different sizes, the glob order is not the size order
+            for name, size in [("a", 1), ("b", 3), ("c", 2)]:
+                chunk = next(chunks)
+                (Path(tmp_dir) / f"{name}.tsv").write_text(
+                    chunk.preamble + "".join(chunk.payload[: size * 8])
+                )
+
+            ingestor = TSVDictGlobReader(input_uri=f"{tmp_dir}/*.tsv")
+            by_size = [str(Path(tmp_dir) / f"{name}.tsv") for name in ["b", "c", "a"]]
+
+            expected = serialize_provenance(
+                SingleProcessDigestor(
+                    mapping_config=mapping.digestor.mapping_config,
+                    meta_fields=mapping.digestor.meta_fields,
+                ).extract(
+                    chain.from_iterable(
+                        ingestor.iterate_file(file_uri) for file_uri in by_size
+                    )
+                )
+            )
+            # Records are numbered within each of the files
+            provenance = {
+                tuple(value_meta)
+                for line in expected
+                for value_meta in json.loads(line)[1]
+            }
+            self.assertIn((23, by_size[0]), provenance)
+            self.assertNotIn((23, by_size[1]), provenance)
+
+            # Entities of the whole file are never sent back at once
+            with self.assertRaises(ValueError):
+                MultiProcessDigestor(
+                    mapping_config=mapping.digestor.mapping_config,
+                    meta_fields=mapping.digestor.meta_fields,
+                    files_in_workers=True,
+                )
+
+            for preserve_order in [True, False]:
+                with self.subTest("Same output", preserve_order=preserve_order):
+                    output = serialize_provenance(
+                        MultiProcessDigestor(
+                            mapping_config=mapping.digestor.mapping_config,
+                            meta_fields=mapping.digestor.meta_fields,
+                            processes=2,
+                            files_in_workers=True,
+                            # Larger than the files, so each one is a single range
+                            range_size=1 << 30,
+                            preserve_order=preserve_order,
+                        ).extract(ingestor)
+                    )
+
+                    if preserve_order:
+                        self.assertEqual(output, expected)
+                    else:
+                        self.assertEqual(sorted(output), sorted(expected))
+
+    def test_byte_ranges_in_workers(self):
+        mapping = load_mapping(
+            "thebeast/tests/sample/mappings/ukrainian_mps_multiprocess.yaml"
+        )
+        chunk = next(
+            TSVDictGlobReader(
+                input_uri="thebeast/tests/sample/csv/rada4.tsv"
+            ).raw_chunks(60)
+        )
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "rada.tsv"
+            path.write_text(chunk.preamble + "".join(chunk.payload))
+            ingestor = TSVDictGlobReader(input_uri=str(path))
+
+            expected = serialize_provenance(
+                SingleProcessDigestor(
+                    mapping_config=mapping.digestor.mapping_config,
+                    meta_fields=mapping.digestor.meta_fields,
+                ).extract(ingestor)
+            )
+
+            digestor = MultiProcessDigestor(
+                mapping_config=mapping.digestor.mapping_config,
+                meta_fields=mapping.digestor.meta_fields,
+                processes=2,
+                files_in_workers=True,
+                range_size=path.stat().st_size // 5,
+            )
+            ranges = list(digestor.schedule_files(ingestor))
+            self.assertTrue(len(ranges) >= 4)
+            self.assertEqual(
+                [byte_range.end - byte_range.start for byte_range in ranges],
+                sorted(
+                    [byte_range.end - byte_range.start for byte_range in ranges],
+                    reverse=True,
+                ),
+            )
+
+            # Without the lookahead, ranges are sent in the order they are found
+            digestor.schedule_lookahead = 0
+            self.assertEqual(
+                list(digestor.schedule_files(ingestor)),
+                [batch for batch, _ in digestor.scan_files(ingestor)],
+            )
+            self.assertEqual(sorted(digestor.schedule_files(ingestor)), sorted(ranges))
+            digestor.schedule_lookahead = 4
+
+            output = serialize_provenance(digestor.extract(ingestor))
+            self.assertEqual(sorted(output), sorted(expected))
+
+            # Files, that can't be split, are read by the parent in batches
+            batches = list(digestor.bounded_batches(ingestor, [str(path)]))
+            self.assertTrue(all(isinstance(batch, tuple) for batch in batches))
+            self.assertEqual(sum(len(batch) for batch in batches), 60)
@@ -0,0 +1,121 @@
+import unittest
+from itertools import islice
+
+from thebeast.types import Record
+from thebeast.digest.plan import compile_mapping
+from thebeast.digest.optimizer import optimize_plan
+from thebeast.digest.resolvers import _resolve_shared_column, _resolve_column
+from thebeast.tests.utils import load_mapping, serialize_meta
+
+
+class OptimizerTests(unittest.TestCase):
+    def test_optimized_plan(self):
+        mapping = load_mapping("thebeast/tests/sample/mappings/optimizer/gb_mps.yaml")
+        plan = mapping.digestor.plan
+        root = plan.collections[0]
+
+        # Literal only meta is resolved once
+        self.assertEqual(root.constant_meta, {"origin": "House of Commons"})
+        self.assertEqual([name for name, _ in root.meta], ["date"])
+
+        person, membership = root.entities
+        properties = {prop.name: prop for prop in person.properties}
+
+        # Unused variables are gone
+        self.assertIn("$key", properties)
+        self.assertNotIn("$unused", properties)
+        self.assertNotIn("$also_unused", properties)
+
+        # Literals are hoisted and cleaned where possible
+        self.assertEqual(properties["country"].constant_values, ["gb"])
+        self.assertTrue(properties["country"].cleaned)
+        self.assertEqual(properties["nationality"].constant_values, ["gb", "gb"])
+        self.assertEqual(properties["phone"].constant_values, ["020 7219 3000"])
+        self.assertFalse(properties["phone"].cleaned)
+        self.assertIsNone(properties["name"].constant_values)
+
+        # name is read three times, so it's shared, sort_name is read once
+        self.assertIs(properties["name"].pipelines[0][0][0], _resolve_shared_column)
+        self.assertIs(properties["alias"].pipelines[0][0][0], _resolve_column)
+        self.assertIs(properties["alias"].pipelines[1][0][0], _resolve_shared_column)
+        self.assertIs(
+            {prop.name: prop for prop in membership.properties}[
+                "description"
+            ].pipelines[0][0][0],
+            _resolve_shared_column,
+        )
+
+    def test_variables_used_by_templates_are_kept(self):
+        plan = optimize_plan(
+            compile_mapping(
+                {
+                    "collections": {
+                        "root": {
+                            "path": "[@]",
+                            "entities": {
+                                "person": {
+                                    "schema": "Person",
+                                    "keys": ["entity.name"],
+                                    "properties": {
+                                        "$first": {"column": "first"},
+                                        "name": {
+                                            "template": "{{ variables['$first'][0] }}"
+                                        },
+                                    },
+                                }
+                            },
+                        }
+                    }
+                }
+            )
+        )
+
+        self.assertEqual(
+            [prop.name for prop in plan.collections[0].entities[0].properties],
+            ["$first", "name"],
+        )
+
+    def test_identical_output(self):
+        for path, records in [
+            (
+                "thebeast/tests/sample/mappings/optimizer/gb_mps.yaml",
+                None,
+            ),
+            (
+                "thebeast/tests/sample/mappings/ukrainian_mps.yaml",
+                None,
+            ),
+            (
+                "thebeast/tests/sample/mappings/ukrainian_edr.yaml",
+                None,
+            ),
+            (
+                "thebeast/tests/sample/mappings/keys_resolver/entity_keys.yaml",
+                [
+                    Record(payload={"name": "Ющенко", "company": "ВРУ"}),
+                    Record(payload={"name": "Ющенко"}),
+                ],
+            ),
+        ]:
+            with self.subTest("Same output", mapping=path):
+                outputs = []
+                for optimize in [False, True]:
+                    mapping = load_mapping(path)
+                    digestor = mapping.digestor.__class__(
+                        mapping_config=mapping.digestor.mapping_config,
+                        meta_fields=mapping.digestor.meta_fields,
+                        optimize=optimize,
+                    )
+
+                    outputs.append(
+                        serialize_meta(
+                            digestor.extract(
+                                records
+                                if records is not None
+                                else islice(mapping.ingestor, 200)
+                            )
+                        )
+                    )
+
+                self.assertTrue(len(outputs[0]) > 0)
+                self.assertEqual(outputs[0], outputs[1])
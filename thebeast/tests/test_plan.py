@@ -0,0 +1,125 @@
+import unittest
+
+from jmespath.parser import ParsedResult  # type: ignore
+
+from thebeast.digest.plan import compile_mapping, compile_keys
+from thebeast.digest.resolvers import (
+    _resolve_entity,
+    _resolve_regex,
+    _resolve_transformer,
+    _resolve_regex_replace,
+    compile_entity,
+    compile_regex,
+    compile_transformer,
+    compile_regex_replace,
+    CompiledTransformer,
+    ResolveContext,
+)
+from thebeast.digest.utils import generate_pseudo_id
+from thebeast.contrib.ftm_ext.rigged_entity_proxy import StrProxy
+from thebeast.tests.utils import load_mapping
+
+
+class MappingPlanTests(unittest.TestCase):
+    def test_plan_structure(self):
+        mapping = load_mapping("thebeast/tests/sample/mappings/ukrainian_edr.yaml")
+        plan = mapping.digestor.plan
+
+        self.assertEqual(len(plan.collections), 1)
+        root = plan.collections[0]
+        self.assertEqual(root.name, "root")
+        self.assertIsInstance(root.path, ParsedResult)
+        self.assertIsNone(root.record_transformer)
+
+        self.assertEqual([e.name for e in root.entities], ["edr_company"])
+        company = root.entities[0]
+        self.assertEqual(company.schema, "Company")
+        self.assertEqual(company.pseudo_id, generate_pseudo_id("edr_company"))
+        self.assertEqual(company.keys[0].key_type, "record")
+        self.assertIsInstance(company.keys[0].key_path, ParsedResult)
+
+        property_names = [prop.name for prop in company.properties]
+        self.assertEqual(property_names[0], "name")
+
+        name_pipeline = company.properties[0].pipelines[0]
+        (_, command_config), (_, transformer) = name_pipeline
+        self.assertIsInstance(command_config, ParsedResult)
+        self.assertIsInstance(transformer, CompiledTransformer)
+        self.assertEqual(
+            transformer.signature,
+            "thebeast.contrib.transformers.mixed_charset_fixer()",
+        )
+
+        self.assertEqual(
+            [c.name for c in root.collections],
+            ["edr_founder"],
+        )
+
+    def test_constant_entities_and_meta(self):
+        plan = compile_mapping(
+            {
+                "meta": {"locale": {"literal": "uk"}},
+                "constant_entities": {
+                    "rada": {
+                        "schema": "PublicBody",
+                        "keys": ["entity.name"],
+                        "properties": {"name": [{"literal": "ВРУ"}, {"column": "x"}]},
+                    }
+                },
+                "collections": {},
+            }
+        )
+
+        self.assertEqual([name for name, _ in plan.meta], ["locale"])
+        self.assertEqual(len(plan.constant_entities), 1)
+        self.assertEqual(
+            plan.constant_entities[0].pseudo_id, generate_pseudo_id("rada")
+        )
+        self.assertEqual(len(plan.constant_entities[0].properties[0].pipelines), 2)
+        self.assertEqual(plan.collections, [])
+
+    def test_keys(self):
+        keys = compile_keys(["entity.*", "record.foo.bar", "variable.$baz"])
+
+        self.assertEqual(keys[0].key_type, "entity")
+        self.assertEqual(keys[0].key_path, "*")
+        self.assertEqual(keys[1].key_type, "record")
+        self.assertEqual(keys[1].key_path.search({"foo": {"bar": 42}}), 42)
+        self.assertEqual(keys[2].key_type, "variable")
+        self.assertEqual(keys[2].key_path, "$baz")
+
+    def test_compiled_and_raw_configs_are_equivalent(self):
+        ctx = ResolveContext(
+            record={},
+            property_values=[StrProxy("foo 123 bar 456", meta={"locale": "uk"})],
+            entity=None,
+            statements_meta={"locale": "uk"},
+            variables={},
+        )
+
+        self.assertEqual(
+            _resolve_regex(r"\d+", ctx), _resolve_regex(compile_regex(r"\d+"), ctx)
+        )
+        self.assertEqual(
+            _resolve_entity("foo", ctx), _resolve_entity(compile_entity("foo"), ctx)
+        )
+
+        replace_config = {"regex": ["foo", "bar"], "replace": ["baz", "qux"]}
+        self.assertEqual(
+            _resolve_regex_replace(replace_config, ctx),
+            _resolve_regex_replace(compile_regex_replace(replace_config), ctx),
+        )
+
+        transformer_config = {
+            "name": "thebeast.contrib.transformers.convert_case",
+            "params": {"case": "upper"},
+        }
+        raw = _resolve_transformer(transformer_config, ctx)
+        compiled = _resolve_transformer(compile_transformer(transformer_config), ctx)
+        self.assertEqual(raw, compiled)
+        self.assertEqual(raw[0]._meta.transformation, compiled[0]._meta.transformation)
+
+    def test_compile_caches(self):
+        self.assertIs(compile_regex(r"\s+"), compile_regex(r"\s+"))
+        compiled = compile_regex(r"\s+")
+        self.assertIs(compile_regex(compiled), compiled)
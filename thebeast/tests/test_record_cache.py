@@ -0,0 +1,183 @@
+import unittest
+from copy import deepcopy
+import tempfile
+from itertools import islice
+from pathlib import Path
+from typing import List
+
+from thebeast.digest import SingleProcessDigestor
+from thebeast.digest.record_cache import callable_names, mapping_fingerprint
+from thebeast.types import Record
+from thebeast.tests.utils import load_mapping, serialize_provenance
+
+
+class RecordCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.mapping = load_mapping("thebeast/tests/sample/mappings/ukrainian_mps.yaml")
+
+    def read_records(self) -> List[Record]:
+        # Records are read again for each run, as the digest might change them in place
+        return list(islice(self.mapping.ingestor, 50))
+
+    def make_digestor(self, **params) -> SingleProcessDigestor:
+        return SingleProcessDigestor(
+            mapping_config=self.mapping.digestor.mapping_config,
+            meta_fields=self.mapping.digestor.meta_fields,
+            **params,
+        )
+
+    def test_same_output(self):
+        expected = serialize_provenance(
+            self.make_digestor().extract(self.read_records())
+        )
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = str(Path(tmp_dir) / "cache.sqlite")
+
+            for hits, misses in [(0, 50), (50, 0)]:
+                digestor = self.make_digestor(record_cache=path)
+                output = serialize_provenance(digestor.extract(self.read_records()))
+                self.assertEqual(output, expected)
+                self.assertEqual(digestor.record_cache.info()[:2], (hits, misses))
+                # Database is closed once the digest is over
+                self.assertIsNone(digestor.record_cache.conn)
+
+            # Same records come back in another dump, at the other positions
+            moved = [
+                record._replace(record_no=record.record_no + 1000, input_uri="new.tsv")
+                for record in reversed(self.read_records())
+            ]
+            digestor = self.make_digestor(record_cache=path)
+            self.assertEqual(
+                serialize_provenance(digestor.extract(moved)),
+                serialize_provenance(
+                    self.make_digestor().extract(
+                        [
+                            record._replace(
+                                record_no=record.record_no + 1000, input_uri="new.tsv"
+                            )
+                            for record in reversed(self.read_records())
+                        ]
+                    )
+                ),
+            )
+            self.assertEqual(digestor.record_cache.info()[:2], (50, 0))
+
+            # Different settings produce different entities, so nothing is reused
+            digestor = self.make_digestor(record_cache=path, validation="off")
+            list(digestor.extract(self.read_records()))
+            self.assertEqual(digestor.record_cache.info()[:2], (0, 50))
+
+    def test_meta_free(self):
+        expected = serialize_provenance(
+            self.make_digestor(meta_free=True).extract(self.read_records())
+        )
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = str(Path(tmp_dir) / "cache.sqlite")
+
+            # Values without the meta are not stamped with the position of the record
+            for hits, misses in [(0, 50), (50, 0)]:
+                digestor = self.make_digestor(record_cache=path, meta_free=True)
+                self.assertEqual(
+                    serialize_provenance(digestor.extract(self.read_records())),
+                    expected,
+                )
+                self.assertEqual(digestor.record_cache.info()[:2], (hits, misses))
+
+    def test_statements_meta_in_templates(self):
+        config = deepcopy(self.mapping.digestor.mapping_config)
+        entity = config["collections"]["root"]["entities"]["ukrainian_mp_person"]
+        entity["properties"]["sourceUrl"] = {
+            "template": "https://x/{{ meta.input_uri }}/{{ meta.record_no }}"
+        }
+        entity["keys"].append("entity.sourceUrl")
+
+        def make_digestor(**params) -> SingleProcessDigestor:
+            return SingleProcessDigestor(
+                mapping_config=config,
+                meta_fields=self.mapping.digestor.meta_fields,
+                **params,
+            )
+
+        def read_records() -> List[Record]:
+            # Same payloads coming from the different files
+            records = self.read_records()[:5]
+            return records + [
+                record._replace(input_uri="new.tsv")
+                for record in self.read_records()[:5]
+            ]
+
+        expected = serialize_provenance(make_digestor().extract(read_records()))
+        self.assertEqual(len(expected), len(set(expected)))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = str(Path(tmp_dir) / "cache.sqlite")
+
+            # Position of the record is the part of the key, so the entities are only
+            # reused for the record at the same position
+            for hits, misses in [(0, 10), (10, 0)]:
+                digestor = make_digestor(record_cache=path)
+                self.assertTrue(digestor.record_cache.stamped_key)
+                self.assertEqual(
+                    serialize_provenance(digestor.extract(read_records())),
+                    expected,
+                )
+                self.assertEqual(digestor.record_cache.info()[:2], (hits, misses))
+
+        self.assertFalse(
+            self.make_digestor(record_cache=":memory:").record_cache.stamped_key
+        )
+
+    def test_eviction(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            digestor = self.make_digestor(
+                record_cache=str(Path(tmp_dir) / "cache.sqlite"),
+                record_cache_size=20000,
+            )
+            list(digestor.extract(self.read_records()))
+
+            info = digestor.record_cache.info()
+            self.assertTrue(info.evictions > 0)
+            self.assertTrue(0 < info.currsize <= info.maxsize)
+
+            # Last records are still there, once the database is opened again
+            list(digestor.extract(self.read_records()[-3:]))
+            self.assertEqual(digestor.record_cache.info().hits, 3)
+
+    def test_mapping_fingerprint(self):
+        config = {
+            "collections": {
+                "foo": {
+                    "path": "[]",
+                    "record_transformer": "thebeast.contrib.transformers.trim_string",
+                    "entities": {
+                        "bar": {
+                            "properties": {
+                                "name": {
+                                    "column": "name",
+                                    "transformer": [
+                                        "thebeast.contrib.transformers.trim_string",
+                                        {
+                                            "name": "thebeast.contrib.transformers.convert_case"
+                                        },
+                                    ],
+                                }
+                            }
+                        }
+                    },
+                }
+            }
+        }
+
+        self.assertEqual(
+            set(callable_names(config)),
+            {
+                "thebeast.contrib.transformers.trim_string",
+                "thebeast.contrib.transformers.convert_case",
+            },
+        )
+        self.assertEqual(mapping_fingerprint(config), mapping_fingerprint(config))
+        self.assertNotEqual(
+            mapping_fingerprint(config), mapping_fingerprint(config, meta_free=True)
+        )
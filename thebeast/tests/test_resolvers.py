@@ -1,5 +1,6 @@
 import unittest
 import re
+import random
 
 from thebeast.digest.resolvers import (
     _resolve_literal,
@@ -11,6 +12,8 @@ from thebeast.digest.resolvers import (
     _resolve_augmentor,
     _resolve_template,
     _resolve_property,
+    compile_regex_replace,
+    set_regex_concurrent,
     ResolveContext,
 )
 from thebeast.contrib.ftm_ext.rigged_entity_proxy import StrProxy
@@ -240,6 +243,81 @@ class ResolversTests(unittest.TestCase):
                 ctx,
             )
 
+    def test_regex_replace_single_pass(self):
+        for config, merged in [
+            ({"regex": ["foo", "bar"], "replace": ["baz", "qux"]}, False),
+            ({"regex": ["ТОВ", '"'], "replace": ["", "'"]}, True),
+            ({"regex": ["ТОВ", "&quot;"], "replace": ["", '"']}, False),
+            ({"regex": ["a", "b", "c"], "replace": "-"}, True),
+            ({"regex": ["ab", "cd"], "replace": ["c", ""]}, False),
+            ({"regex": ["x", "cd"], "replace": ["", "e"]}, False),
+            ({"regex": ["\\s+", ","], "replace": " "}, False),
+            ({"regex": ["a", "b"], "replace": ["\\1", "c"]}, False),
+            ({"regex": ["a", "b"], "replace": ["c"]}, False),
+            ({"regex": "abc", "replace": ""}, False),
+        ]:
+            with self.subTest("Merge", config=config):
+                self.assertEqual(
+                    compile_regex_replace(config).merged_regex is not None, merged
+                )
+
+        # Merged replacements must behave exactly as the sequential ones
+        rnd = random.Random(42)
+        alphabet = "abcdef "
+        ctx = ResolveContext(
+            record={},
+            property_values=[],
+            entity=None,
+            statements_meta={},
+            variables={},
+        )
+
+        merged_count = 0
+        for _ in range(500):
+            patterns = [
+                "".join(rnd.choice(alphabet) for _ in range(rnd.randint(1, 2)))
+                for _ in range(rnd.randint(2, 3))
+            ]
+            replaces = [
+                "".join(rnd.choice(alphabet) for _ in range(rnd.randint(0, 2)))
+                for _ in patterns
+            ]
+            config = {"regex": patterns, "replace": replaces}
+            if compile_regex_replace(config).merged_regex is None:
+                continue
+
+            merged_count += 1
+            value = "".join(rnd.choice(alphabet) for _ in range(20))
+            expected = value
+            for pattern, replace in zip(patterns, replaces):
+                expected = re.sub(pattern, replace, expected)
+
+            ctx.property_values = [StrProxy(value, meta={"locale": "uk"})]
+            result = _resolve_regex_replace(config, ctx)
+            self.assertEqual(result, [expected], config)
+            self.assertEqual(result[0]._meta.locale, "uk")
+
+        self.assertTrue(merged_count > 0)
+
+    def test_regex_concurrent(self):
+        ctx = ResolveContext(
+            record={},
+            property_values=[StrProxy("foo, bar")],
+            entity=None,
+            statements_meta={},
+            variables={},
+        )
+
+        try:
+            set_regex_concurrent(True)
+            self.assertEqual(_resolve_regex_split(",\\s*", ctx), ["foo", "bar"])
+            self.assertEqual(
+                _resolve_regex_replace({"regex": ["o", "a"], "replace": "0"}, ctx),
+                ["f00, b0r"],
+            )
+        finally:
+            set_regex_concurrent(None)
+
     def test_resolve_augmentor(self):
         ctx = ResolveContext(
             record={},
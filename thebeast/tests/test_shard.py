@@ -0,0 +1,104 @@
+import unittest
+import tempfile
+from pathlib import Path
+from typing import List
+
+from thebeast.conf.utils import parse_shard
+from thebeast.conf.exc import InvalidOverridesException
+from thebeast.ingest import TSVDictGlobReader
+from thebeast.tests.utils import load_mapping, serialize
+
+
+class ShardTests(unittest.TestCase):
+    def test_parse_shard(self):
+        self.assertEqual(parse_shard("1/4"), (1, 4))
+
+        for value in ["1", "a/4", "1/"]:
+            with self.subTest("Invalid shard", value=value):
+                with self.assertRaises(ValueError):
+                    parse_shard(value)
+
+    def test_ingestor_shards(self):
+        all_records = list(
+            TSVDictGlobReader(input_uri="thebeast/tests/sample/csv/rada*.tsv")
+        )
+
+        for count, shard_by, expected_mode in [
+            (2, None, "file"),
+            (3, None, "record"),
+            (2, "record", "record"),
+        ]:
+            with self.subTest("Disjoint shards", count=count, shard_by=shard_by):
+                shards = []
+                for index in range(count):
+                    ingestor = TSVDictGlobReader(
+                        input_uri="thebeast/tests/sample/csv/rada*.tsv"
+                    )
+                    ingestor.set_shard(index, count, shard_by=shard_by)
+                    self.assertEqual(ingestor.shard_by, expected_mode)
+                    shards.append(list(ingestor))
+
+                self.assertTrue(all(shards))
+                self.assertEqual(sum(len(shard) for shard in shards), len(all_records))
+                self.assertEqual(
+                    sorted(
+                        [(r.input_uri, r.record_no) for shard in shards for r in shard]
+                    ),
+                    sorted([(r.input_uri, r.record_no) for r in all_records]),
+                )
+
+    def test_mapping_shards(self):
+        chunk = next(
+            TSVDictGlobReader(
+                input_uri="thebeast/tests/sample/csv/rada4.tsv"
+            ).raw_chunks(60)
+        )
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_uri = str(Path(tmp_dir) / "rada.tsv")
+            Path(input_uri).write_text(chunk.preamble + "".join(chunk.payload))
+            output_uri = str(Path(tmp_dir) / "out.jsonl")
+
+            mapping = load_mapping(
+                "thebeast/tests/sample/mappings/ukrainian_mps.yaml",
+                ingest_overrides={"input_uri": input_uri},
+                dump_overrides={"output_uri": output_uri},
+            )
+            expected = serialize(mapping.digestor.extract(mapping.ingestor))
+            constants = serialize(mapping.digestor.extract([]))
+            self.assertTrue(constants)
+
+            output: List[str] = []
+            for index in range(3):
+                mapping = load_mapping(
+                    "thebeast/tests/sample/mappings/ukrainian_mps.yaml",
+                    ingest_overrides={"input_uri": input_uri},
+                    dump_overrides={"output_uri": output_uri},
+                    shard=(index, 3),
+                )
+                self.assertEqual(
+                    mapping.dumper.output_uri,
+                    str(Path(tmp_dir) / f"out-shard{index:05d}.jsonl"),
+                )
+                # Single file is split by record
+                self.assertEqual(mapping.ingestor.shard_by, "record")
+
+                shard_output = serialize(mapping.digestor.extract(mapping.ingestor))
+                # Only the first shard emits the constant entities
+                self.assertEqual(
+                    set(constants) <= set(shard_output),
+                    index == 0,
+                )
+                output += shard_output
+
+            self.assertEqual(sorted(output), sorted(expected))
+
+    def test_invalid_shard(self):
+        for shard, shard_by in [((3, 3), None), ((-1, 3), None), ((0, 3), "hash")]:
+            with self.subTest("Invalid shard", shard=shard, shard_by=shard_by):
+                with self.assertRaises(InvalidOverridesException):
+                    load_mapping(
+                        "thebeast/tests/sample/mappings/ukrainian_edr.yaml",
+                        shard=shard,
+                        shard_by=shard_by,
+                    )
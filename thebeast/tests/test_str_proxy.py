@@ -1,3 +1,4 @@
+import pickle
 from unittest import TestCase
 from thebeast.contrib.ftm_ext.rigged_entity_proxy import StrProxy
 
@@ -40,3 +41,32 @@ class StrProxyTestCase(TestCase):
         ultimate_s = better_s.inject_meta_to_str(even_better_s)
         self.assertEqual(ultimate_s._meta.locale, "uk")
         self.assertEqual(ultimate_s, "double_bar")
+
+    def test_shared_meta(self):
+        statements_meta = {"locale": "uk", "unknown_field": "foo"}
+        s = StrProxy("foo", meta=statements_meta)
+        other_s = StrProxy("bar", meta=statements_meta)
+
+        # Values made with the same statements meta share the meta object
+        self.assertIs(s._meta, other_s._meta)
+        self.assertIs(s.inject_meta_to_str("baz")._meta, s._meta)
+        self.assertIs(StrProxy(s)._meta, s._meta)
+        self.assertIsNot(StrProxy(s), s)
+
+        # But the changes of the statements meta are respected
+        statements_meta["locale"] = "en"
+        self.assertEqual(StrProxy("foo", meta=statements_meta)._meta.locale, "en")
+        self.assertEqual(s._meta.locale, "uk")
+
+    def test_pickle(self):
+        s = StrProxy("foo", meta={"locale": "uk", "record_no": 5})
+        other_s = s.inject_meta_to_str("bar")
+
+        restored, other_restored = pickle.loads(pickle.dumps([s, other_s]))
+        self.assertIsInstance(restored, StrProxy)
+        self.assertEqual(restored, "foo")
+        self.assertEqual(restored._meta, s._meta)
+
+        # Only the values of the meta cross the boundary, not the dynamic class
+        self.assertNotIn(b"meta_cls", pickle.dumps(s))
+        self.assertIs(restored._meta, other_restored._meta)
@@ -0,0 +1,94 @@
+import unittest
+from collections import OrderedDict
+
+from thebeast.digest.templates import (
+    compile_template,
+    parse_simple_template,
+    jinja_env,
+    CompiledTemplate,
+)
+from thebeast.contrib.ftm_ext.rigged_entity_proxy import StrProxy
+
+
+class TemplatesTests(unittest.TestCase):
+    def test_simple_detection(self):
+        self.assertEqual(
+            parse_simple_template("Був депутатов {{ record.days_served }} днів"),
+            ["Був депутатов ", ("record", ["days_served"]), " днів"],
+        )
+        self.assertEqual(
+            parse_simple_template("{{ record['foo'].bar }}{{ entity.name[0] }}"),
+            [("record", ["foo", "bar"]), ("entity", ["name", 0])],
+        )
+        self.assertEqual(parse_simple_template("just text"), ["just text"])
+
+        for source in [
+            "{{ property_value|join('') }}",
+            "{% if record.foo %}{{ record.foo }}{% endif %}",
+            "{{ record.foo ~ record.bar }}",
+            "{{ range(3) }}",
+            "{{ record.foo() }}",
+            "{% for x in record %}{{ x }}{% endfor %}",
+        ]:
+            with self.subTest("Not simple", source=source):
+                self.assertIsNone(parse_simple_template(source))
+
+    def test_cache(self):
+        template = compile_template("{{ record.foo }}")
+        self.assertIs(template, compile_template("{{ record.foo }}"))
+        self.assertIs(template, compile_template(template))
+        self.assertIsInstance(template, CompiledTemplate)
+        self.assertTrue(template.is_simple)
+        self.assertFalse(compile_template("{{ record.foo|upper }}").is_simple)
+
+    def test_fast_path_matches_jinja(self):
+        contexts = [
+            {
+                "record": {"foo": "bar", "num": 42, "none": None, "items": "x"},
+                "entity": {"name": ["Ющенко"], "empty": []},
+                "meta": {"locale": "uk"},
+                "property_value": StrProxy("pv"),
+                "variables": {"$foo": [StrProxy("5")]},
+            },
+            {
+                "record": OrderedDict([("foo", "<b>&'\"</b>"), ("nested", {"a": 1})]),
+                "entity": None,
+                "meta": None,
+                "property_value": StrProxy(""),
+                "variables": None,
+            },
+            {
+                "record": [],
+                "entity": {},
+                "meta": {},
+                "property_value": StrProxy("x"),
+                "variables": {},
+            },
+        ]
+
+        sources = [
+            "{{ record.foo }}",
+            "Був депутатов {{ record.num }} днів\n",
+            "{{ record.none }}|{{ record.missing }}|",
+            "{{ record.items }}",
+            "{{ record['foo'] }} {{ record.nested.a }}",
+            "{{ entity.name[0] }} {{ entity.name[5] }} {{ entity.empty[0] }}",
+            "{{ meta.locale }}-{{ property_value }}-{{ unknown }}",
+            "{{ variables['$foo'][0] }}",
+            "{{ '<const>' }} {{ 42 }}",
+            "  {{- record.foo -}}  ",
+            "line\r\nbreaks\n\n",
+        ]
+
+        for context in contexts:
+            for source in sources:
+                with self.subTest("Render", source=source, record=context["record"]):
+                    try:
+                        expected = jinja_env.from_string(source).render(**context)
+                    except Exception as e:
+                        with self.assertRaises(type(e)):
+                            compile_template(source).render(**context)
+                    else:
+                        self.assertEqual(
+                            compile_template(source).render(**context), expected
+                        )
@@ -0,0 +1,115 @@
+import unittest
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+
+from thebeast.contrib.ftm_ext import meta_factory
+from thebeast.contrib.ftm_ext.clean_cache import CLEAN_CACHE, CLEAN_CACHE_SETTINGS
+from thebeast.digest import (
+    SingleProcessDigestor,
+    ThreadPoolDigestor,
+    MultiProcessDigestor,
+)
+from thebeast.digest.resolvers import REGEX_SETTINGS
+from thebeast.digest.utils import resolve_callable, CALLABLE_CACHE
+from thebeast.digest.templates import compile_template, TEMPLATE_CACHE
+from thebeast.tests.utils import load_mapping, serialize
+
+
+class ThreadPoolDigestorTests(unittest.TestCase):
+    def test_same_output(self):
+        for path in [
+            "thebeast/tests/sample/mappings/optimizer/gb_mps.yaml",
+            "thebeast/tests/sample/mappings/ukrainian_edr.yaml",
+            "thebeast/tests/sample/mappings/ukrainian_mps.yaml",
+        ]:
+            with self.subTest("Same output", mapping=path):
+                mapping = load_mapping(path)
+                records = list(islice(mapping.ingestor, 200))
+
+                expected = serialize(
+                    SingleProcessDigestor(
+                        mapping_config=mapping.digestor.mapping_config,
+                        meta_fields=mapping.digestor.meta_fields,
+                    ).extract(records)
+                )
+                self.assertTrue(len(expected) > 0)
+
+                for batch_size, max_in_flight in [(1, -1), (7, 2), (50, 0)]:
+                    output = serialize(
+                        ThreadPoolDigestor(
+                            mapping_config=mapping.digestor.mapping_config,
+                            meta_fields=mapping.digestor.meta_fields,
+                            threads=4,
+                            batch_size=batch_size,
+                            max_in_flight=max_in_flight,
+                        ).extract(records)
+                    )
+                    self.assertEqual(output, expected)
+
+    def test_early_close(self):
+        mapping = load_mapping("thebeast/tests/sample/mappings/ukrainian_edr.yaml")
+        entities = ThreadPoolDigestor(
+            mapping_config=mapping.digestor.mapping_config,
+            meta_fields=mapping.digestor.meta_fields,
+            threads=2,
+            max_in_flight=2,
+        ).extract(mapping.ingestor)
+
+        next(entities)
+        entities.close()
+
+    def test_shared_state(self):
+        def load(_):
+            return (
+                meta_factory.get_meta_cls(),
+                resolve_callable("thebeast.contrib.transformers.trim_string"),
+                compile_template("{{ foo|upper }}-{{ bar }}").jinja_template,
+            )
+
+        CALLABLE_CACHE.pop("thebeast.contrib.transformers.trim_string", None)
+        TEMPLATE_CACHE.pop("{{ foo|upper }}-{{ bar }}", None)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(load, range(64)))
+
+        for idx in range(3):
+            self.assertEqual(len({id(result[idx]) for result in results}), 1)
+
+    def test_own_settings(self):
+        mapping = load_mapping("thebeast/tests/sample/mappings/ukrainian_mps.yaml")
+        records = list(islice(mapping.ingestor, 100))
+
+        def digestor(cls, **params):
+            return cls(
+                mapping_config=mapping.digestor.mapping_config,
+                meta_fields=mapping.digestor.meta_fields,
+                **params,
+            )
+
+        threaded = digestor(ThreadPoolDigestor, threads=2, clean_cache_size=10)
+        meta_free = digestor(SingleProcessDigestor, meta_free=True)
+        expected = [
+            serialize(threaded.extract(records)),
+            serialize(meta_free.extract(records)),
+        ]
+
+        # Creating the digestors doesn't switch anything for the rest of the process
+        self.assertIsNone(REGEX_SETTINGS.concurrent)
+        self.assertIs(CLEAN_CACHE_SETTINGS.cache, CLEAN_CACHE)
+        self.assertEqual(threaded.clean_cache.maxsize, 10)
+
+        # Digestors running at the same time don't interfere
+        output = [[], []]
+        for pair in zip(threaded.extract(records), meta_free.extract(records)):
+            self.assertFalse(meta_factory.settings.meta_free)
+            self.assertIsNone(REGEX_SETTINGS.concurrent)
+            for idx, entity in enumerate(pair):
+                output[idx] += serialize([entity])
+
+        self.assertEqual(output, expected)
+        self.assertIs(CLEAN_CACHE_SETTINGS.cache, CLEAN_CACHE)
+
+        self.assertTrue(
+            digestor(
+                MultiProcessDigestor, processes=1, regex_concurrent=True
+            ).regex_concurrent
+        )
@@ -0,0 +1,132 @@
+import unittest
+import json
+from itertools import islice
+from unittest import mock
+
+from followthemoney import model as ftm  # type: ignore
+
+from thebeast.types import Record
+from thebeast.digest import SingleProcessDigestor, CodegenDigestor
+from thebeast.digest.utils import make_entity, deflate_entity
+from thebeast.tests.utils import load_mapping
+
+
+class ValidationTests(unittest.TestCase):
+    def test_modes(self):
+        valid = make_entity("Person", ftm)
+        valid.make_id("ivan")
+        valid.add("name", "Ivan Sraka")
+
+        # Person requires a name
+        no_name = make_entity("Person", ftm)
+        no_name.make_id("petro")
+
+        no_id = make_entity("Person", ftm)
+        no_id.add("name", "Petro Sraka")
+
+        for validation in ["full", "required", "off"]:
+            with self.subTest("Validation", validation=validation):
+                self.assertTrue(deflate_entity(valid, validation=validation).valid)
+                self.assertFalse(deflate_entity(no_id, validation=validation).valid)
+                self.assertEqual(
+                    deflate_entity(no_name, validation=validation).valid,
+                    validation == "off",
+                )
+
+                deflated = deflate_entity(
+                    no_name, validation=validation, skip_invalid=True
+                )
+                if validation == "off":
+                    self.assertTrue(deflated.valid)
+                else:
+                    self.assertIsNone(deflated)
+
+                    # Thrown away before the serialization in both modes
+                    with mock.patch.object(
+                        no_name, "to_dict", side_effect=AssertionError
+                    ):
+                        self.assertIsNone(
+                            deflate_entity(
+                                no_name, validation=validation, skip_invalid=True
+                            )
+                        )
+
+                self.assertIsNone(
+                    deflate_entity(no_id, validation=validation, skip_invalid=True)
+                )
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            SingleProcessDigestor(
+                mapping_config={"collections": {}},
+                meta_fields=[],
+                validation="partial",
+            )
+
+    def test_detection(self):
+        mapping = load_mapping("thebeast/tests/sample/mappings/optimizer/gb_mps.yaml")
+        self.assertTrue(mapping.digestor.skip_invalid)
+
+        # Explicit param wins
+        mapping = load_mapping(
+            "thebeast/tests/sample/mappings/keys_resolver/entity_keys.yaml"
+        )
+        self.assertFalse(mapping.digestor.skip_invalid)
+
+    def test_skip_invalid(self):
+        items = [
+            Record(payload={"name": "Ivan Sraka", "company": "Sraka, LTD."}),
+            Record(payload={"name": "Ivan Sraka"}),
+        ]
+
+        for digestor_cls in [SingleProcessDigestor, CodegenDigestor]:
+            with self.subTest("Skip invalid", cls=digestor_cls):
+                mapping = load_mapping(
+                    "thebeast/tests/sample/mappings/keys_resolver/entity_keys.yaml"
+                )
+                outputs = {}
+                for skip_invalid in [False, True]:
+                    digestor = digestor_cls(
+                        mapping_config=mapping.digestor.mapping_config,
+                        meta_fields=mapping.digestor.meta_fields,
+                        skip_invalid=skip_invalid,
+                    )
+                    outputs[skip_invalid] = list(digestor.extract(items))
+
+                self.assertEqual(
+                    [entity for entity in outputs[False] if entity.valid],
+                    outputs[True],
+                )
+                self.assertTrue(len(outputs[True]) < len(outputs[False]))
+
+    def test_required_mode_output(self):
+        for path in [
+            "thebeast/tests/sample/mappings/optimizer/gb_mps.yaml",
+            "thebeast/tests/sample/mappings/ukrainian_edr.yaml",
+        ]:
+            with self.subTest("Same output", mapping=path):
+                outputs = []
+                for validation in ["full", "required"]:
+                    mapping = load_mapping(path)
+                    digestor = SingleProcessDigestor(
+                        mapping_config=mapping.digestor.mapping_config,
+                        meta_fields=mapping.digestor.meta_fields,
+                        validation=validation,
+                    )
+
+                    outputs.append(
+                        [
+                            (
+                                entity.valid,
+                                json.dumps(
+                                    entity.payload, sort_keys=True, ensure_ascii=False
+                                ),
+                            )
+                            for entity in digestor.extract(
+                                islice(mapping.ingestor, 200)
+                            )
+                        ]
+                    )
+
+                self.assertTrue(len(outputs[0]) > 0)
+                self.assertEqual(outputs[0], outputs[1])
@@ -0,0 +1,102 @@
+import json
+from pathlib import Path
+from typing import Any, Iterable, List, Union
+
+from thebeast.conf.mapping import SourceMapping
+from thebeast.contrib.ftm_ext import meta_factory
+from thebeast.digest import SingleProcessDigestor
+from thebeast.types import RedGreenEntity
+
+
+def serialize(entities: Iterable[RedGreenEntity]) -> List[str]:
+    """
+    Turns entities into something comparable
+    """
+    return [
+        json.dumps(entity.payload, sort_keys=True, ensure_ascii=False)
+        for entity in entities
+    ]
+
+
+def serialize_provenance(
+    entities: Iterable[RedGreenEntity], valid: bool = False
+) -> List[str]:
+    """
+    Same as serialize, but the provenance of the values (and the validity of the
+    entity, if asked) is compared too
+    """
+    return [
+        json.dumps(
+            [
+                entity.payload,
+                [
+                    # Values of the meta_free mode might come without the meta at all
+                    (
+                        [value._meta.record_no, value._meta.input_uri]
+                        if hasattr(value, "_meta")
+                        else None
+                    )
+                    for values in entity.payload["properties"].values()
+                    for value in values
+                ],
+            ]
+            + ([entity.valid] if valid else []),
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        for entity in entities
+    ]
+
+
+def serialize_meta(entities: Iterable[RedGreenEntity]) -> List[Any]:
+    """
+    Turns entities into something comparable, including the meta of each value
+    """
+    return [
+        (
+            entity.valid,
+            json.dumps(entity.payload, sort_keys=True, ensure_ascii=False),
+            {
+                prop: [value._meta._asdict() for value in values]
+                for prop, values in entity.payload["properties"].items()
+            },
+        )
+        for entity in entities
+    ]
+
+
+def load_mapping(mapping_path: Union[str, Path], **kwargs) -> SourceMapping:
+    """
+    Loads the mapping from scratch, reseting the meta_factory singletone first
+    """
+    meta_factory.meta_cls = None
+    return SourceMapping(Path(mapping_path), **kwargs)
+
+
+def digest_fragments(mapping: SourceMapping) -> List[RedGreenEntity]:
+    """
+    Digests the whole input of the mapping with the statements meta, so the
+    fragments can be written by any dumper
+    """
+    return list(
+        SingleProcessDigestor(
+            mapping_config=mapping.digestor.mapping_config,
+            meta_fields=mapping.digestor.meta_fields,
+        ).extract(mapping.ingestor)
+    )
+
+
+def write_mapping(
+    mapping_path: Union[str, Path], tmp_dir: Union[str, Path], dumper_cls: str
+) -> Path:
+    """
+    Copies the mapping into tmp_dir, with the dumper replaced by dumper_cls
+    """
+    path: Path = Path(tmp_dir) / "mapping.yaml"
+    path.write_text(
+        Path(mapping_path)
+        .read_text()
+        .replace("cls: thebeast.dump.FTMLinesWriter", f"cls: {dumper_cls}")
+    )
+
+    return path
@@ -5,6 +5,30 @@ Record: type = namedtuple(
     "Record", ["payload", "record_no", "input_uri"], defaults=[None, None]
 )
 
+# A chunk of raw (unparsed) records of the same file, that can be shipped to the worker
+# process and parsed there. record_no is the number of the first record in the chunk,
+# preamble is whatever is needed to parse the records (i.e the header of csv)
+RawChunk: type = namedtuple(
+    "RawChunk", ["payload", "record_no", "input_uri", "preamble"], defaults=[""]
+)
+
+# A range of bytes of the local file, aligned to the records, that can be read and
+# parsed by the worker process independently. record_no is the number of the first
+# record in the range, preamble_size is the number of bytes at the beginning of the
+# file that are needed to parse the records (i.e the header of csv)
+ByteRange: type = namedtuple(
+    "ByteRange", ["input_uri", "start", "end", "record_no", "preamble_size"]
+)
+
+# Position of the interrupted run: the last record, all entities of which (and of all
+# the records before it) were written, the offset of the next record in its file,
+# if known, the sizes of the outputs at that moment and the files already done
+Checkpoint: type = namedtuple(
+    "Checkpoint",
+    ["input_uri", "record_no", "offset", "preamble_size", "outputs", "done"],
+    defaults=[None, 0, None, None],
+)
+
 # Again, a thin wrapper on top of the serialized entity
 # Just like Record is a main transport between ingest and digest, RedGreenEntity is a
 # transport between digest and dump